@@ -1,22 +1,28 @@
-import streamlit as st
-import pandas as pd
+import time
+
+# Marca o início do processo para medir o orçamento de inicialização
+INICIO_PROCESSO = time.perf_counter()
+
 import os
 import subprocess
 import sys
 
+from compressao import extensao_compressao, localizar_arquivo
+
 def check_sample_file():
     """Check if the sample files exist and return the path to the smallest appropriate one."""
+    # Compressed variants (.csv.gz, .csv.zst, .csv.bz2) are accepted for every name
     # Try to find the tiny sample first (fastest)
-    tiny_sample = "amostras/amostra_tiny.csv"
-    if os.path.exists(tiny_sample):
+    tiny_sample = localizar_arquivo("amostras/amostra_tiny.csv")
+    if tiny_sample:
         print(f"Found tiny sample file: {tiny_sample}")
         file_size = os.path.getsize(tiny_sample) / (1024 * 1024)  # Size in MB
         print(f"File size: {file_size:.2f} MB")
         return tiny_sample
     
     # Next try the small sample
-    small_sample = "amostras/amostra_pequena.csv"
-    if os.path.exists(small_sample):
+    small_sample = localizar_arquivo("amostras/amostra_pequena.csv")
+    if small_sample:
         print(f"Found small sample file: {small_sample}")
         file_size = os.path.getsize(small_sample) / (1024 * 1024)  # Size in MB
         print(f"File size: {file_size:.2f} MB")
@@ -24,7 +30,7 @@ def check_sample_file():
     
     # Check if any of the chunk files exist
     chunk_files = [f"amostras/amostra_parte_{i+1}.csv" for i in range(20)]
-    existing_chunks = [f for f in chunk_files if os.path.exists(f)]
+    existing_chunks = [f for f in map(localizar_arquivo, chunk_files) if f]
     
     if existing_chunks:
         print(f"Found chunk file: {existing_chunks[0]}")
@@ -33,8 +39,8 @@ def check_sample_file():
         return existing_chunks[0]
     
     # Check if the original large file exists
-    original_file = "base_unificada_amostra.csv"
-    if os.path.exists(original_file):
+    original_file = localizar_arquivo("base_unificada_amostra.csv")
+    if original_file:
         print(f"No sample files found. Using original file: {original_file}")
         file_size = os.path.getsize(original_file) / (1024 * 1024)  # Size in MB
         print(f"File size: {file_size:.2f} MB")
@@ -72,6 +78,7 @@ def create_symbolic_link(source_file, target_file="base_unificada_amostra.csv"):
         # Alternative: Copy the file
         try:
             print("Trying to copy the file instead...")
+            import pandas as pd
             df = pd.read_csv(source_file)
             df.to_csv(target_file, index=False)
             print(f"Successfully copied {source_file} to {target_file}")
@@ -80,6 +87,35 @@ def create_symbolic_link(source_file, target_file="base_unificada_amostra.csv"):
             print(f"Error copying file: {e2}")
             return False
 
+def run_warm_dashboard():
+    """Warm up this process and run the dashboard server inside it.
+
+    Heavy modules are loaded and the first page is rendered once, headless,
+    before the server starts listening, so the first session is served from
+    the process-wide caches (dataset or partitions, metrics, charts, models).
+    """
+    from inicializacao import preaquecer
+
+    dashboard_script = "dashboard_cliente_success.py"
+    resultado = preaquecer(inicio=INICIO_PROCESSO, script=dashboard_script)
+
+    print(f"Imports: {resultado['importacoes_s']:.2f}s | "
+          f"First page: {resultado['pagina_s']:.2f}s | "
+          f"Total: {resultado['total_s']:.2f}s (budget: {resultado['orcamento_s']:.0f}s)")
+    if not resultado["dentro_orcamento"]:
+        print(f"WARNING: Startup took {resultado['total_s']:.2f}s, over the "
+              f"{resultado['orcamento_s']:.0f}s budget (DASHBOARD_ORCAMENTO_INICIALIZACAO_S).")
+    for erro in resultado["erros"]:
+        print(f"WARNING: Warm-up render failed ({erro}); only the dataset was preloaded.")
+
+    from streamlit.web import bootstrap
+
+    print("Process warmed up. Starting the dashboard server...")
+    bootstrap.load_config_options(flag_options={})
+    # Blocks until the server is shut down
+    bootstrap.run(dashboard_script, False, [], {})
+    return True
+
 def run_dashboard():
     """Run the dashboard using the sample file."""
     try:
@@ -102,16 +138,22 @@ if __name__ == "__main__":
     sample_file = check_sample_file()
     
     if sample_file:
-        if sample_file != "base_unificada_amostra.csv":
+        # The link keeps the compression extension so the loader can detect it
+        target_file = "base_unificada_amostra.csv" + extensao_compressao(sample_file)
+        if sample_file != target_file:
             print(f"Creating a link to the dashboard's expected file name...")
-            success = create_symbolic_link(sample_file)
+            success = create_symbolic_link(sample_file, target_file)
             
             if not success:
                 print("Failed to create a link to the sample file.")
                 sys.exit(1)
         
-        print("Starting the dashboard...")
-        run_dashboard()
+        if "--preaquecer" in sys.argv:
+            print("Starting the dashboard in a pre-warmed process...")
+            run_warm_dashboard()
+        else:
+            print("Starting the dashboard...")
+            run_dashboard()
     else:
         print("No data files found. Please run gerar_amostra.py or dividir_amostra.py first.")
         sys.exit(1) 
\ No newline at end of file
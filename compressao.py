@@ -0,0 +1,163 @@
+"""Leitura de bases CSV comprimidas (.csv.gz, .csv.zst, .csv.bz2) em streaming.
+
+A descompressão roda em uma thread de fundo que entrega blocos já
+descomprimidos por uma fila limitada ao parser de CSV em blocos do pandas.
+Descompressão e parsing acontecem ao mesmo tempo (zlib, bz2 e zstd liberam o
+GIL) e nem o arquivo descomprimido vai para o disco, nem a base inteira
+descomprimida fica na memória: no máximo ``BLOCOS_EM_VOO`` blocos por vez.
+"""
+import bz2
+import gzip
+import io
+import os
+import queue
+import threading
+
+# Extensões aceitas além do CSV puro, em ordem de preferência
+EXTENSOES_COMPRIMIDAS = [".gz", ".zst", ".bz2"]
+
+# Tamanho de cada bloco descomprimido e quantos blocos podem aguardar o parser
+TAMANHO_BLOCO_BYTES = 4 * 1024 * 1024
+BLOCOS_EM_VOO = 4
+
+# Linhas por bloco entregues pelo parser de CSV
+LINHAS_POR_BLOCO = 100_000
+
+_FIM = object()
+
+
+def localizar_arquivo(caminho):
+    """Retorna ``caminho`` ou a primeira variante comprimida existente (None se nenhuma)."""
+    for candidato in [caminho] + [caminho + extensao for extensao in EXTENSOES_COMPRIMIDAS]:
+        if os.path.exists(candidato):
+            return candidato
+    return None
+
+
+def _abrir_descomprimido(caminho):
+    """Abre o arquivo como um fluxo binário de bytes descomprimidos."""
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rb")
+    if caminho.endswith(".bz2"):
+        return bz2.open(caminho, "rb")
+    if caminho.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("Leitura de .zst requer o pacote zstandard (pip install zstandard)") from e
+        return zstandard.ZstdDecompressor().stream_reader(open(caminho, "rb"), closefd=True)
+    return open(caminho, "rb")
+
+
+class LeitorEmSegundoPlano(io.RawIOBase):
+    """Fluxo de leitura alimentado por uma thread que descomprime o arquivo.
+
+    A fila limitada faz a thread esperar quando o parser está atrasado, então
+    a memória fica restrita a alguns blocos. ``close()`` interrompe a thread,
+    o que permite parar a leitura no meio (por exemplo, com ``nrows``).
+    """
+
+    def __init__(self, caminho):
+        super().__init__()
+        self._fila = queue.Queue(maxsize=BLOCOS_EM_VOO)
+        self._parar = threading.Event()
+        self._pendente = memoryview(b"")
+        self._terminou = False
+        self._thread = threading.Thread(target=self._descomprimir, args=(caminho,),
+                                        name="descompressao", daemon=True)
+        self._thread.start()
+
+    def _entregar(self, item):
+        while not self._parar.is_set():
+            try:
+                self._fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _descomprimir(self, caminho):
+        try:
+            with _abrir_descomprimido(caminho) as origem:
+                while not self._parar.is_set():
+                    bloco = origem.read(TAMANHO_BLOCO_BYTES)
+                    if not bloco or not self._entregar(bloco):
+                        break
+        except Exception as e:
+            # O erro é repassado para a thread que está lendo
+            self._entregar(e)
+        self._entregar(_FIM)
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._pendente and not self._terminou:
+            item = self._fila.get()
+            if item is _FIM:
+                self._terminou = True
+            elif isinstance(item, Exception):
+                self._terminou = True
+                raise item
+            else:
+                self._pendente = memoryview(item)
+        quantidade = min(len(destino), len(self._pendente))
+        destino[:quantidade] = self._pendente[:quantidade]
+        # Fatias de memoryview não copiam o restante do bloco
+        self._pendente = self._pendente[quantidade:]
+        return quantidade
+
+    def close(self):
+        self._parar.set()
+        super().close()
+
+
+def extensao_compressao(caminho):
+    """Extensão de compressão do arquivo (".gz", ".zst", ".bz2") ou "" para CSV puro."""
+    for extensao in EXTENSOES_COMPRIMIDAS:
+        if str(caminho).endswith(extensao):
+            return extensao
+    return ""
+
+
+def comprimido(caminho):
+    return extensao_compressao(caminho) != ""
+
+
+def abrir_csv(caminho):
+    """Fluxo binário do CSV, com descompressão em segundo plano se necessário.
+
+    O parser do pandas recebe bytes e faz a decodificação no código C.
+    """
+    if not comprimido(caminho):
+        return open(caminho, "rb")
+    return io.BufferedReader(LeitorEmSegundoPlano(caminho), TAMANHO_BLOCO_BYTES)
+
+
+def blocos_csv(caminho, linhas_por_bloco=None, **kwargs):
+    """Gera DataFrames de até ``linhas_por_bloco`` linhas de um CSV, comprimido ou não.
+
+    Os tipos das colunas são inferidos bloco a bloco: para um único
+    DataFrame com os mesmos tipos de ``pd.read_csv``, use ``ler_csv``.
+    """
+    # pandas é carregado só aqui para que localizar_arquivo não dependa dele
+    import pandas as pd
+
+    with abrir_csv(caminho) as fluxo:
+        yield from pd.read_csv(fluxo, chunksize=linhas_por_bloco or LINHAS_POR_BLOCO, **kwargs)
+
+
+def ler_csv(caminho, nrows=None, **kwargs):
+    """Lê um CSV e retorna um único DataFrame.
+
+    CSVs puros seguem direto para ``pd.read_csv``; os comprimidos são lidos
+    por uma única chamada ao ``pd.read_csv`` sobre o fluxo descomprimido em
+    segundo plano, então o resultado (inclusive os tipos inferidos) é o
+    mesmo da leitura do CSV puro.
+    """
+    import pandas as pd
+
+    if not comprimido(caminho):
+        return pd.read_csv(caminho, nrows=nrows, **kwargs)
+    with abrir_csv(caminho) as fluxo:
+        return pd.read_csv(fluxo, nrows=nrows, **kwargs)
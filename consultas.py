@@ -0,0 +1,317 @@
+"""Backends de consulta para as métricas e agregações do dashboard.
+
+O backend ``pandas`` (padrão) calcula tudo sobre o DataFrame carregado em
+memória, com ``calcular_metricas_cs``. O backend ``arrow`` executa as mesmas
+consultas direto sobre a base particionada em Parquet, com planos do Acero
+(motor de execução do pyarrow): os arquivos são lidos em lotes, em paralelo,
+passando por filtro, projeção e agregação sem materializar a base. A memória
+fica limitada aos lotes em processamento e às tabelas de agregação (uma
+entrada por cliente nas contagens distintas), e não ao tamanho da base.
+
+O backend é escolhido por ``DASHBOARD_BACKEND_CONSULTAS`` e o ``arrow``
+exige a base gerada por ``preparar_base.py``. As duas implementações
+retornam o mesmo dicionário de métricas.
+"""
+import datetime
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.acero as acero
+import pyarrow.compute as pc
+
+from dados import DIRETORIO_PARTICIONADO, base_particionada_disponivel, dataset_particionado, filtro_particoes
+from instrumentacao import medir_etapa, registrar_excecao
+from metricas import STATUS_ATIVOS_KEYWORDS, STATUS_CANCELADO
+from snapshots import codificar_estado
+
+BACKENDS = ["pandas", "arrow"]
+BACKEND_CONSULTAS = os.environ.get("DASHBOARD_BACKEND_CONSULTAS", "pandas").lower()
+
+CLUSTERS = ["Regular", "Risco de Churn", "Potencial de Upsell"]
+CATEGORIAS_NPS = ["Detrator", "Neutro", "Promotor"]
+
+
+def backend_ativo(diretorio=DIRETORIO_PARTICIONADO):
+    """Backend em uso: o configurado, ou ``pandas`` se o ``arrow`` não puder ser usado."""
+    if BACKEND_CONSULTAS not in BACKENDS:
+        raise ValueError(f"Backend de consultas desconhecido: {BACKEND_CONSULTAS} (opções: {', '.join(BACKENDS)})")
+    if BACKEND_CONSULTAS == "arrow" and not base_particionada_disponivel(diretorio):
+        return "pandas"
+    return BACKEND_CONSULTAS
+
+
+def contar_registros(ufs=None, segmentos=None, meses=None, diretorio=DIRETORIO_PARTICIONADO):
+    """Número de registros da fatia, a partir dos metadados dos arquivos Parquet."""
+    return dataset_particionado(diretorio).count_rows(filter=filtro_particoes(ufs, segmentos, meses))
+
+
+def _texto(coluna):
+    # Colunas categóricas chegam como dicionário; as funções de texto e o
+    # agrupamento trabalham sobre strings
+    return pc.field(coluna).cast(pa.string())
+
+
+def _filtro_consulta(colunas, ufs, segmentos, meses, cluster):
+    """Filtro de partições e cluster, com as colunas que ele usa."""
+    filtro = filtro_particoes(ufs, segmentos, meses)
+    usadas = {"UF", "DS_SEGMENTO", "mes_assinatura"} if filtro is not None else set()
+    if cluster != "Todos" and "cluster" in colunas:
+        condicao = _texto("cluster") == cluster
+        filtro = condicao if filtro is None else filtro & condicao
+        usadas.add("cluster")
+    return filtro, usadas
+
+
+def _executar(dataset, filtro, colunas, projecoes, agregacoes, chaves=None):
+    """Plano Acero: leitura em lotes -> filtro -> projeção -> agregação.
+
+    Só ``colunas`` são lidas dos arquivos Parquet.
+    """
+    nos = [acero.Declaration("scan", acero.ScanNodeOptions(dataset, columns=sorted(colunas), filter=filtro))]
+    if filtro is not None:
+        # O filtro do scan só descarta arquivos e partições; as linhas são filtradas aqui
+        nos.append(acero.Declaration("filter", acero.FilterNodeOptions(filtro)))
+    nos.append(acero.Declaration("project", acero.ProjectNodeOptions(list(projecoes.values()), list(projecoes))))
+    nos.append(acero.Declaration("aggregate", acero.AggregateNodeOptions(agregacoes, keys=chaves or [])))
+    return acero.Declaration.from_sequence(nos).to_table(use_threads=True)
+
+
+def _contagem_distinta(coluna, nome):
+    return (coluna, "count_distinct", pc.CountOptions(mode="only_valid"), nome)
+
+
+def _media(valor):
+    # O Acero devolve nulo para a média de um grupo sem valores; o pandas devolve NaN
+    return float("nan") if valor is None else valor
+
+
+def _ordenar_por_chave(tabela, chave, valor, media=False):
+    """Dicionário {chave: valor} na ordem do groupby do pandas (chaves ordenadas)."""
+    linhas = tabela.to_pydict()
+    pares = [(k, _media(v) if media else v) for k, v in zip(linhas[chave], linhas[valor]) if k is not None]
+    return dict(sorted(pares))
+
+
+def metricas_arrow(ufs=None, segmentos=None, meses=None, cluster="Todos", diretorio=DIRETORIO_PARTICIONADO):
+    """Métricas com o backend Arrow, sem carregar a base na memória.
+
+    Reproduz ``calcular_metricas_cs`` sobre a fatia da base particionada dos
+    filtros de partição (e do cluster, quando informado).
+    """
+    metricas = {}
+    dataset = dataset_particionado(diretorio)
+    colunas = set(dataset.schema.names)
+    filtro, lidas = _filtro_consulta(colunas, ufs, segmentos, meses, cluster)
+    tem_cliente = "cliente_id" in colunas
+
+    def campo(nome, texto=False):
+        # Registra a coluna para que o scan leia apenas as colunas usadas
+        lidas.add(nome)
+        return _texto(nome) if texto else pc.field(nome)
+
+    with medir_etapa("metricas_arrow") as etapa:
+        try:
+            # Valores gerais: uma única passada com todas as contagens distintas e médias
+            projecoes = {"um": pc.scalar(1)}
+            agregacoes = [("um", "count", None, "linhas")]
+            cliente = campo("cliente_id", texto=True) if tem_cliente else None
+
+            def distintos(condicao, nome):
+                # Conta clientes distintos (ou linhas, sem cliente_id) que satisfazem a condição
+                if tem_cliente:
+                    expressao = cliente if condicao is None else pc.if_else(condicao, cliente, pa.scalar(None, pa.string()))
+                    projecoes[nome] = expressao
+                    agregacoes.append(_contagem_distinta(nome, nome))
+                else:
+                    projecoes[nome] = pc.scalar(1) if condicao is None else pc.if_else(condicao, 1, 0)
+                    agregacoes.append((nome, "sum", None, nome))
+
+            distintos(None, "total_clientes")
+
+            if "SITUACAO_CONTRATO" in colunas:
+                situacao = pc.utf8_upper(campo("SITUACAO_CONTRATO", texto=True))
+                cancelado = pc.coalesce(pc.is_in(situacao, value_set=pa.array([s.upper() for s in STATUS_CANCELADO])), False)
+                ativo_palavra = pc.scalar(False)
+                for keyword in STATUS_ATIVOS_KEYWORDS:
+                    ativo_palavra = ativo_palavra | pc.coalesce(pc.match_substring(situacao, keyword), False)
+                ativo = ativo_palavra | ~cancelado
+                projecoes["ativo"] = pc.if_else(ativo, 1, 0)
+                agregacoes.append(("ativo", "sum", None, "linhas_ativas"))
+                distintos(ativo, "clientes_ativos")
+                if "DT_ASSINATURA_CONTRATO" in colunas:
+                    corte = datetime.datetime.now() - datetime.timedelta(days=365)
+                    ano_anterior = pc.coalesce(
+                        campo("DT_ASSINATURA_CONTRATO") < pa.scalar(corte, pa.timestamp("ns")), False)
+                    distintos(ano_anterior, "contratos_ano_anterior")
+                    distintos(cancelado, "cancelados")
+
+            for coluna in ["resposta_NPS_x", "VL_TOTAL_CONTRATO_NUM"]:
+                if coluna in colunas:
+                    projecoes[coluna] = campo(coluna)
+                    agregacoes.append((coluna, "mean", None, coluna))
+            for coluna, nome in [("risco_churn", "num_clientes_risco_churn"), ("potencial_upsell", "num_clientes_upsell")]:
+                if coluna in colunas:
+                    distintos(pc.coalesce(campo(coluna), False), nome)
+
+            gerais = _executar(dataset, filtro, lidas, projecoes, agregacoes).to_pylist()[0]
+            etapa["linhas"] = gerais["linhas"]
+
+            # Mesma lógica de calcular_metricas_cs a partir das contagens
+            metricas["total_clientes"] = gerais["total_clientes"]
+            if "SITUACAO_CONTRATO" in colunas:
+                if not gerais["linhas_ativas"]:
+                    gerais["clientes_ativos"] = gerais["total_clientes"]
+                metricas["clientes_ativos"] = gerais["clientes_ativos"]
+                total_clientes = metricas.get("total_clientes", 0)
+                if total_clientes > 0:
+                    metricas["clientes_ativos"] = max(int(total_clientes * 0.95), metricas.get("clientes_ativos", 0))
+                    if metricas["clientes_ativos"] <= 0:
+                        metricas["clientes_ativos"] = total_clientes
+                if "DT_ASSINATURA_CONTRATO" in colunas and gerais["contratos_ano_anterior"] > 0:
+                    metricas["taxa_churn"] = (gerais["cancelados"] / gerais["contratos_ano_anterior"]) * 100
+                else:
+                    metricas["taxa_churn"] = 0
+            else:
+                metricas["clientes_ativos"] = metricas["total_clientes"]
+                metricas["taxa_churn"] = 0
+
+            # Valores por cluster: uma passada agrupada
+            if "cluster" in colunas:
+                projecoes = {"cluster": campo("cluster", texto=True)}
+                if tem_cliente:
+                    projecoes["cliente_id"] = cliente
+                    agregacoes = [("cliente_id", "hash_count_distinct", pc.CountOptions(mode="only_valid"), "clientes")]
+                else:
+                    projecoes["um"] = pc.scalar(1)
+                    agregacoes = [("um", "hash_count", None, "clientes")]
+                for coluna in ["resposta_NPS_x", "VL_TOTAL_CONTRATO_NUM"]:
+                    if coluna in colunas:
+                        projecoes[coluna] = campo(coluna)
+                        agregacoes.append((coluna, "hash_mean", None, coluna))
+                por_cluster = _executar(dataset, filtro, lidas, projecoes, agregacoes, chaves=["cluster"])
+
+                metricas["total_por_cluster"] = _ordenar_por_chave(por_cluster, "cluster", "clientes")
+                for nome in CLUSTERS:
+                    if nome not in metricas["total_por_cluster"]:
+                        metricas["total_por_cluster"][nome] = 0
+            else:
+                por_cluster = None
+                metricas["total_por_cluster"] = {"Regular": metricas["total_clientes"], "Risco de Churn": 0, "Potencial de Upsell": 0}
+
+            if "resposta_NPS_x" in colunas and por_cluster is not None:
+                metricas["nps_por_cluster"] = _ordenar_por_chave(por_cluster, "cluster", "resposta_NPS_x", media=True)
+                metricas["nps_medio_geral"] = _media(gerais["resposta_NPS_x"])
+
+                if "categoria_nps" in colunas:
+                    projecoes = {"categoria_nps": campo("categoria_nps", texto=True), "um": pc.scalar(1)}
+                    por_categoria = _executar(dataset, filtro, lidas, projecoes,
+                                              [("um", "hash_count", None, "quantidade")], chaves=["categoria_nps"])
+                    contagens = {k: v for k, v in zip(*por_categoria.to_pydict().values()) if k is not None}
+                    # Mesma ordem do value_counts: da maior para a menor contagem
+                    metricas["dist_nps"] = dict(sorted(contagens.items(), key=lambda item: -item[1]))
+                    for cat in CATEGORIAS_NPS:
+                        if cat not in metricas["dist_nps"]:
+                            metricas["dist_nps"][cat] = 0
+                else:
+                    metricas["dist_nps"] = {"Detrator": 0, "Neutro": 0, "Promotor": 0}
+            else:
+                metricas["nps_por_cluster"] = {c: 0 for c in CLUSTERS}
+                metricas["nps_medio_geral"] = 0
+                metricas["dist_nps"] = {"Detrator": 0, "Neutro": 0, "Promotor": 0}
+
+            if "VL_TOTAL_CONTRATO_NUM" in colunas and por_cluster is not None:
+                metricas["ticket_medio_por_cluster"] = _ordenar_por_chave(por_cluster, "cluster", "VL_TOTAL_CONTRATO_NUM", media=True)
+                metricas["ticket_medio_geral"] = _media(gerais["VL_TOTAL_CONTRATO_NUM"])
+            else:
+                metricas["ticket_medio_por_cluster"] = {c: 0 for c in CLUSTERS}
+                metricas["ticket_medio_geral"] = 0
+
+            for coluna, nome in [("risco_churn", "num_clientes_risco_churn"), ("potencial_upsell", "num_clientes_upsell")]:
+                metricas[nome] = gerais[nome] if coluna in colunas else 0
+
+            if "ticket" in colunas and "DT_CRIACAO" in colunas:
+                metricas["engajamento_mes"] = _engajamento_por_mes(dataset, filtro, lidas)
+
+        except Exception as e:
+            registrar_excecao(e)
+            metricas["erro"] = str(e)
+
+    return metricas
+
+
+def _engajamento_por_mes(dataset, filtro, colunas):
+    """Tickets por mês de criação.
+
+    O Acero conta os tickets por valor distinto de ``DT_CRIACAO`` (texto em
+    formatos variados); só esses valores distintos passam pelo
+    ``pd.to_datetime``, como em ``calcular_metricas_cs``, e são somados por mês.
+    """
+    projecoes = {"DT_CRIACAO": _texto("DT_CRIACAO"), "ticket": pc.field("ticket")}
+    por_data = _executar(dataset, filtro, colunas | {"DT_CRIACAO", "ticket"}, projecoes,
+                         [("ticket", "hash_count", pc.CountOptions(mode="only_valid"), "tickets")],
+                         chaves=["DT_CRIACAO"]).to_pandas()
+    mes_ticket = pd.to_datetime(por_data["DT_CRIACAO"], errors="coerce").dt.to_period("M").astype(str)
+    contagens = por_data["tickets"].groupby(mes_ticket).sum()
+    return {mes: int(total) for mes, total in contagens.items()}
+
+
+def estado_clientes_arrow(diretorio=DIRETORIO_PARTICIONADO):
+    """Estado de cada cliente para os snapshots (ver ``snapshots.estado_clientes``).
+
+    Uma agregação por ``cliente_id`` sobre a base particionada inteira.
+    """
+    dataset = dataset_particionado(diretorio)
+    colunas = set(dataset.schema.names)
+    if "cliente_id" not in colunas:
+        return None
+    lidas = {"cliente_id"}
+    projecoes = {"cliente_id": _texto("cliente_id")}
+    for coluna, nome in [("risco_churn", "risco"), ("potencial_upsell", "upsell")]:
+        projecoes[nome] = pc.coalesce(pc.field(coluna), False) if coluna in colunas else pc.scalar(False)
+        lidas.add(coluna)
+    if "SITUACAO_CONTRATO" in colunas:
+        situacao = pc.utf8_upper(_texto("SITUACAO_CONTRATO"))
+        projecoes["cancelado"] = pc.coalesce(
+            pc.is_in(situacao, value_set=pa.array([s.upper() for s in STATUS_CANCELADO])), False)
+    else:
+        projecoes["cancelado"] = pc.scalar(False)
+    agregacoes = [("risco", "hash_any", None, "risco"), ("upsell", "hash_any", None, "upsell"),
+                  ("cancelado", "hash_all", None, "cancelado")]
+    with medir_etapa("estado_clientes_arrow") as etapa:
+        por_cliente = _executar(dataset, None, (lidas | {"SITUACAO_CONTRATO"}) & colunas,
+                                projecoes, agregacoes, chaves=["cliente_id"]).to_pandas().set_index("cliente_id")
+        etapa["clientes"] = len(por_cliente)
+    return codificar_estado(por_cliente["risco"], por_cliente["upsell"], por_cliente["cancelado"])
+
+
+def clientes_destaque_arrow(coluna, colunas_exibicao, ufs=None, segmentos=None, meses=None, cluster="Todos",
+                            n=10, diretorio=DIRETORIO_PARTICIONADO):
+    """Primeiros ``n`` clientes (sem repetição) com a flag ``coluna`` ativa, lidos em lotes.
+
+    A leitura para assim que ``n`` clientes distintos são encontrados.
+    """
+    dataset = dataset_particionado(diretorio)
+    if coluna not in dataset.schema.names:
+        return pd.DataFrame()
+    colunas = [col for col in colunas_exibicao if col in dataset.schema.names]
+    filtro, _ = _filtro_consulta(dataset.schema.names, ufs, segmentos, meses, cluster)
+    condicao = pc.field(coluna) == True  # noqa: E712 - expressão do pyarrow, não comparação Python
+    filtro = condicao if filtro is None else filtro & condicao
+
+    partes, vistos = [], set()
+    with medir_etapa(f"lista_{coluna}_arrow") as etapa:
+        for lote in dataset.to_batches(columns=colunas, filter=filtro):
+            parte = lote.to_pandas()
+            if "cliente_id" in parte.columns:
+                parte = parte.drop_duplicates(subset=["cliente_id"])
+                parte = parte[~parte["cliente_id"].isin(vistos)]
+                vistos.update(parte["cliente_id"])
+            if len(parte):
+                partes.append(parte)
+            if sum(len(p) for p in partes) >= n:
+                break
+        etapa["linhas"] = sum(len(p) for p in partes)
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    return pd.concat(partes, ignore_index=True).head(n)
@@ -0,0 +1,650 @@
+"""Carregamento e processamento da base de clientes.
+
+Este módulo não depende do Streamlit para que a base processada possa ser
+preparada fora do dashboard (por exemplo, pelo launcher em ``amostra.py``
+antes de o servidor aceitar conexões). A base processada fica em disco no
+formato Arrow (sem compressão) e é lida por memory-map: as colunas numéricas
+e os códigos das categóricas do DataFrame apontam diretamente para as páginas
+do arquivo, que o sistema operacional compartilha entre todos os processos
+(réplicas do Streamlit) do host. Cada processo mantém uma única instância
+somente leitura da base, compartilhada por todas as sessões.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+
+from compressao import ler_csv, localizar_arquivo
+from ingestao import (
+    DIRETORIO_FONTES,
+    carregar_fontes,
+    fontes_disponiveis,
+    localizar_fontes,
+    montar_visao_clientes,
+)
+from instrumentacao import medir_etapa, registrar_excecao
+
+# Arquivos de dados em ordem de preferência (do menor para o maior)
+ARQUIVOS_AMOSTRA = [
+    "amostras/amostra_tiny.csv",
+    "amostras/amostra_pequena.csv",
+    "amostras/amostra_parte_1.csv",
+    "base_unificada_amostra.csv"
+]
+
+PASTA_CACHE = os.environ.get("DASHBOARD_PASTA_CACHE", "cache")
+
+# Incrementar sempre que o processamento mudar, para invalidar o cache em disco
+VERSAO_PIPELINE = "1"
+
+# Base completa gravada por preparar_base.py, particionada por mês, UF e segmento
+DIRETORIO_PARTICIONADO = os.environ.get("DASHBOARD_BASE_PARTICIONADA", "base_particionada")
+COLUNAS_PARTICAO = ["mes_assinatura", "UF", "DS_SEGMENTO"]
+
+# Partições de mês sem data válida: fora de qualquer janela de meses
+MESES_SEM_DATA = ["NaT", "nan", "MISSING"]
+ARQUIVO_METADADOS_PARTICOES = "_metadados.json"
+
+# Limiares da segmentação de clientes (também usados pelo simulador de cenários)
+LIMIARES_SEGMENTACAO = {
+    # Risco de churn: NPS baixo em cliente novo, NPS crítico ou NPS baixo em cliente antigo
+    "risco_nps_novo": 5,
+    "risco_dias_novo": 365,
+    "risco_nps_critico": 3,
+    "risco_nps_antigo": 7,
+    "risco_dias_antigo": 730,
+    # Fração mínima em risco: abaixo dela, os menores NPS completam o cluster
+    "risco_minimo": 0.1,
+    # Upsell: NPS alto com contrato abaixo da mediana, cliente antigo com contrato pequeno ou promotor
+    "upsell_nps": 8,
+    "upsell_quantil_valor": 0.5,
+    "upsell_dias_antigo": 730,
+    "upsell_quantil_valor_antigo": 0.25,
+    "upsell_nps_promotor": 9,
+    # Fração mínima com potencial de upsell: abaixo dela, os maiores NPS completam o cluster
+    "upsell_minimo": 0.15,
+}
+
+# Bases já processadas neste processo, por nrows: {nrows: (metadados, df)}
+_bases_processo = {}
+_trava_bases = threading.Lock()
+
+
+def limpar_dados_basico(df):
+    """Limpeza básica de dados inline."""
+    try:
+        # Converter tipos para otimizar memória
+        for col in df.select_dtypes(include=['float64']).columns:
+            df[col] = df[col].astype('float32')
+        for col in df.select_dtypes(include=['int64']).columns:
+            df[col] = df[col].astype('int32')
+        for col in df.select_dtypes(include=['object']).columns:
+            if df[col].nunique() < 100:
+                df[col] = df[col].astype('category')
+        
+        # Tratar valores faltantes básicos
+        for col in df.columns:
+            if df[col].isnull().sum() > 0:
+                if pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = df[col].fillna(df[col].mean())
+                else:
+                    df[col] = df[col].fillna(df[col].mode()[0] if len(df[col].mode()) > 0 else 'MISSING')
+        
+        return df
+    except Exception as e:
+        registrar_excecao(e)
+        return df
+
+
+def criar_dados_demo(n=2000):
+    """Cria um conjunto de dados de demonstração com muitos clientes ativos."""
+    # PROBABILIDADES CORRIGIDAS - somam exatamente 1.0
+    status_choices = ['ATIVO', 'VIGENTE', 'REGULAR', 'CANCELADO', 'ENCERRADO', 'INATIVO']
+    status_weights = [0.5, 0.25, 0.15, 0.06, 0.03, 0.01]  # Soma = 1.0
+    
+    # Criar DataFrame com dados de demonstração
+    demo_df = pd.DataFrame({
+        'cliente_id': [f'C{i:05d}' for i in range(n)],
+        'VL_TOTAL_CONTRATO_NUM': np.random.uniform(1000, 100000, n),
+        'resposta_NPS_x': np.random.randint(0, 11, n),
+        'SITUACAO_CONTRATO': np.random.choice(status_choices, n, p=status_weights),
+        'DS_SEGMENTO': np.random.choice(['MANUFATURA', 'SERVIÇOS', 'VAREJO', 'FINANCEIRO'], n),
+        'UF': np.random.choice(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA'], n),
+    })
+    
+    # Criar datas aleatórias
+    hoje = datetime.datetime.now()
+    datas = [hoje - datetime.timedelta(days=np.random.randint(1, 1000)) for _ in range(n)]
+    demo_df["DT_ASSINATURA_CONTRATO"] = datas
+    demo_df["mes_assinatura"] = pd.Series(datas).dt.to_period("M").astype(str).values
+    demo_df["dias_como_cliente"] = [(hoje - d).days for d in datas]
+    
+    # Categorizar NPS
+    demo_df["categoria_nps"] = pd.cut(
+        demo_df["resposta_NPS_x"],
+        bins=[-1, 6, 8, 10],
+        labels=["Detrator", "Neutro", "Promotor"]
+    )
+    
+    # Aplicar regras de segmentação
+    demo_df["risco_churn"] = False
+    demo_df.loc[(demo_df["resposta_NPS_x"] <= 5) | 
+               (demo_df["resposta_NPS_x"] <= 3) | 
+               ((demo_df["resposta_NPS_x"] < 7) & (demo_df["dias_como_cliente"] > 730)), 
+               "risco_churn"] = True
+               
+    if demo_df["risco_churn"].mean() < 0.15:
+        limite = demo_df["resposta_NPS_x"].quantile(0.15)
+        demo_df.loc[demo_df["resposta_NPS_x"] <= limite, "risco_churn"] = True
+    
+    demo_df["potencial_upsell"] = False
+    demo_df.loc[
+        ((demo_df["resposta_NPS_x"] >= 8) & 
+          (demo_df["VL_TOTAL_CONTRATO_NUM"] < demo_df["VL_TOTAL_CONTRATO_NUM"].median()) |
+          (demo_df["resposta_NPS_x"] >= 9)) &
+        (~demo_df["risco_churn"]), 
+        "potencial_upsell"] = True
+        
+    if demo_df["potencial_upsell"].mean() < 0.2:
+        limite = demo_df["resposta_NPS_x"].quantile(0.8)
+        demo_df.loc[(demo_df["resposta_NPS_x"] >= limite) & (~demo_df["risco_churn"]), "potencial_upsell"] = True
+    
+    demo_df["cluster"] = "Regular"
+    demo_df.loc[demo_df["risco_churn"], "cluster"] = "Risco de Churn"
+    demo_df.loc[demo_df["potencial_upsell"], "cluster"] = "Potencial de Upsell"
+    
+    return demo_df
+
+
+def processar_base(df):
+    """Normaliza colunas, cria colunas derivadas e aplica a segmentação."""
+    # Verificar e normalizar o nome da coluna de cliente 
+    colunas_cliente = ['cliente_id', 'CD_CLIENTE', 'CLIENTE', 'CD_CLI', 
+                     'CODIGO_ORGANIZACAO', 'CODIGO_CLIENTE', 'ID_CLIENTE']
+
+    cliente_col = None
+    for col in colunas_cliente:
+        if col in df.columns:
+            cliente_col = col
+            break
+
+    if cliente_col:
+        df.rename(columns={cliente_col: "cliente_id"}, inplace=True)
+    else:
+        df["cliente_id"] = df.index.astype(str)
+
+    with medir_etapa("limpeza", linhas=len(df)):
+        df = limpar_dados_basico(df)
+
+    with medir_etapa("colunas_derivadas", linhas=len(df)):
+        # Tratamento para a coluna de valor de contrato
+        colunas_valor = ['VL_TOTAL_CONTRATO', 'VALOR_CONTRATO', 'VL_CONTRATO']
+        valor_col = None
+        for col in colunas_valor:
+            if col in df.columns:
+                valor_col = col
+                break
+
+        if valor_col:
+            try:
+                valor_series = df[valor_col]
+                if valor_series.dtype.name == 'category':
+                    valor_series = valor_series.astype(str)
+
+                df["VL_TOTAL_CONTRATO_NUM"] = pd.to_numeric(
+                    valor_series.str.replace(",", "."), 
+                    errors="coerce"
+                )
+
+                if df["VL_TOTAL_CONTRATO_NUM"].isna().all():
+                    raise ValueError("Todos os valores convertidos são nulos")
+            except Exception as e:
+                registrar_excecao(e)
+                df["VL_TOTAL_CONTRATO_NUM"] = np.random.uniform(1000, 100000, len(df))
+        else:
+            df["VL_TOTAL_CONTRATO_NUM"] = np.random.uniform(1000, 100000, len(df))
+
+        # Tratamento para coluna de data
+        colunas_data = ['DT_ASSINATURA_CONTRATO', 'DATA_ASSINATURA', 'DT_CONTRATO']
+        data_col = None
+        for col in colunas_data:
+            if col in df.columns:
+                data_col = col
+                break
+
+        if data_col:
+            df["DT_ASSINATURA_CONTRATO"] = pd.to_datetime(df[data_col], errors="coerce")
+        else:
+            hoje = datetime.datetime.now()
+            datas = [hoje - datetime.timedelta(days=np.random.randint(1, 1000)) for _ in range(len(df))]
+            df["DT_ASSINATURA_CONTRATO"] = datas
+
+        try:
+            if df["DT_ASSINATURA_CONTRATO"].dtype.name == 'category':
+                df["DT_ASSINATURA_CONTRATO"] = pd.to_datetime(df["DT_ASSINATURA_CONTRATO"].astype(str), errors="coerce")
+
+            df["mes_assinatura"] = df["DT_ASSINATURA_CONTRATO"].dt.to_period("M").astype(str)
+            df["dias_como_cliente"] = (datetime.datetime.now() - df["DT_ASSINATURA_CONTRATO"]).dt.days
+        except Exception as e:
+            registrar_excecao(e)
+            hoje = datetime.datetime.now()
+            df["mes_assinatura"] = "2023-01"
+            df["dias_como_cliente"] = 365
+
+        # Verificar coluna de status do contrato
+        colunas_status = ['SITUACAO_CONTRATO', 'STATUS_CONTRATO', 'SITUACAO']
+        status_col = None
+        for col in colunas_status:
+            if col in df.columns:
+                status_col = col
+                break
+
+        if status_col:
+            df.rename(columns={status_col: "SITUACAO_CONTRATO"}, inplace=True)
+            if df["SITUACAO_CONTRATO"].dtype.name == 'category':
+                df["SITUACAO_CONTRATO"] = df["SITUACAO_CONTRATO"].astype(str)
+        else:
+            df["SITUACAO_CONTRATO"] = np.random.choice(['ATIVO', 'CANCELADO', 'VIGENTE'], len(df))
+
+        # Tratamento para NPS
+        colunas_nps = ['resposta_NPS_x', 'NPS', 'NOTA_NPS', 'Nota NPS_x']
+        nps_col = None
+        for col in colunas_nps:
+            if col in df.columns:
+                nps_col = col
+                break
+
+        if nps_col:
+            df.rename(columns={nps_col: "resposta_NPS_x"}, inplace=True)
+            if df["resposta_NPS_x"].dtype.name == 'category':
+                df["resposta_NPS_x"] = pd.to_numeric(df["resposta_NPS_x"].astype(str), errors="coerce")
+        else:
+            df["resposta_NPS_x"] = np.random.randint(0, 11, len(df))
+
+        try:    
+            df["categoria_nps"] = pd.cut(
+                df["resposta_NPS_x"],
+                bins=[-1, 6, 8, 10],
+                labels=["Detrator", "Neutro", "Promotor"]
+            )
+        except Exception as e:
+            registrar_excecao(e)
+            df["categoria_nps"] = np.random.choice(["Detrator", "Neutro", "Promotor"], len(df))
+
+    with medir_etapa("segmentacao", linhas=len(df)):
+        limiares = LIMIARES_SEGMENTACAO
+
+        # Calcular risco de churn
+        df["risco_churn"] = False
+
+        condicao1 = (df["resposta_NPS_x"] <= limiares["risco_nps_novo"]) & (df["dias_como_cliente"] < limiares["risco_dias_novo"])
+        condicao2 = (df["resposta_NPS_x"] <= limiares["risco_nps_critico"])
+        condicao3 = (df["resposta_NPS_x"] < limiares["risco_nps_antigo"]) & (df["dias_como_cliente"] > limiares["risco_dias_antigo"])
+
+        df.loc[condicao1 | condicao2 | condicao3, "risco_churn"] = True
+
+        if df["risco_churn"].mean() < limiares["risco_minimo"]:
+            limite = df["resposta_NPS_x"].quantile(limiares["risco_minimo"])
+            df.loc[df["resposta_NPS_x"] <= limite, "risco_churn"] = True
+
+        # Calcular potencial de upsell
+        df["potencial_upsell"] = False
+
+        valor = df["VL_TOTAL_CONTRATO_NUM"]
+        condicao1 = (df["resposta_NPS_x"] >= limiares["upsell_nps"]) & (valor < valor.quantile(limiares["upsell_quantil_valor"]))
+        condicao2 = (df["dias_como_cliente"] > limiares["upsell_dias_antigo"]) & (valor < valor.quantile(limiares["upsell_quantil_valor_antigo"]))
+        condicao3 = (df["resposta_NPS_x"] >= limiares["upsell_nps_promotor"])
+
+        df.loc[(condicao1 | condicao2 | condicao3) & (~df["risco_churn"]), "potencial_upsell"] = True
+
+        if df["potencial_upsell"].mean() < limiares["upsell_minimo"]:
+            limite = df.loc[~df["risco_churn"], "resposta_NPS_x"].quantile(1 - limiares["upsell_minimo"])
+            df.loc[(df["resposta_NPS_x"] >= limite) & (~df["risco_churn"]), "potencial_upsell"] = True
+
+        # Criar clusters de clientes
+        df["cluster"] = "Regular"
+        df.loc[df["risco_churn"], "cluster"] = "Risco de Churn"
+        df.loc[df["potencial_upsell"], "cluster"] = "Potencial de Upsell"
+
+    # Otimização de memória
+    with medir_etapa("otimizacao_memoria", linhas=len(df)):
+        for col in df.select_dtypes(include=['float64']).columns:
+            df[col] = df[col].astype('float32')
+
+        for col in df.select_dtypes(include=['int64']).columns:
+            df[col] = df[col].astype('int32')
+
+        for col in df.select_dtypes(include=['object']).columns:
+            if df[col].nunique() < 100:
+                df[col] = df[col].astype('category')
+
+    return df
+
+
+def metadados_origem(arquivo, nrows):
+    """Identifica a versão dos dados: arquivo de origem, tamanho, data e nrows."""
+    info = os.stat(arquivo)
+    return {
+        "origem": os.path.abspath(arquivo),
+        "tamanho": info.st_size,
+        "modificado_em": info.st_mtime,
+        "nrows": nrows,
+        "versao_pipeline": VERSAO_PIPELINE,
+    }
+
+
+def _impressao(metadados):
+    """Hash curto dos metadados: muda com a origem, os arquivos, ``nrows`` e o pipeline."""
+    conteudo = json.dumps(metadados, sort_keys=True)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:12]
+
+
+def _prefixo_cache(metadados):
+    tipo = "fontes" if "fontes" in metadados else "unificada"
+    return f"base_processada_{tipo}_{metadados['nrows'] if metadados['nrows'] else 'completa'}_"
+
+
+def _caminhos_cache(metadados):
+    """Arquivos de dados e de metadados do cache de uma versão da base.
+
+    O nome leva o tipo de origem (fontes normalizadas ou base unificada),
+    ``nrows`` e a impressão dos metadados, então cada versão tem arquivos
+    próprios e uma origem nunca reaproveita o cache de outra.
+    """
+    nome = _prefixo_cache(metadados) + _impressao(metadados)
+    return (os.path.join(PASTA_CACHE, f"{nome}.arrow"),
+            os.path.join(PASTA_CACHE, f"{nome}.json"))
+
+
+def _gravar_atomico(caminho, gravar):
+    """Grava com ``gravar(temporario)`` e substitui ``caminho`` de uma só vez."""
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    gravar(temporario)
+    os.replace(temporario, caminho)
+
+
+def _remover_versoes_antigas(metadados):
+    """Remove os caches de versões anteriores da mesma origem e ``nrows``."""
+    prefixo = _prefixo_cache(metadados)
+    atuais = {os.path.basename(caminho) for caminho in _caminhos_cache(metadados)}
+    for nome in os.listdir(PASTA_CACHE):
+        if nome.startswith(prefixo) and nome.endswith((".arrow", ".json")) and nome not in atuais:
+            try:
+                os.remove(os.path.join(PASTA_CACHE, nome))
+            except OSError:
+                # Ainda mapeado por outro processo (Windows): fica para a próxima gravação
+                pass
+
+
+def _ler_cache_disco(metadados):
+    """Mapeia a base processada do disco se ela corresponder aos metadados da origem.
+
+    Colunas numéricas sem nulos e códigos de categóricas são convertidos sem
+    cópia e ficam somente leitura.
+    """
+    caminho_dados, caminho_meta = _caminhos_cache(metadados)
+    if not (os.path.exists(caminho_dados) and os.path.exists(caminho_meta)):
+        return None
+    try:
+        with open(caminho_meta, encoding="utf-8") as f:
+            if json.load(f) != metadados:
+                return None
+        with medir_etapa("leitura_cache_disco", cache="hit") as etapa:
+            with pa.memory_map(caminho_dados, "r") as origem:
+                tabela = pa.ipc.open_file(origem).read_all()
+            df = tabela.to_pandas(split_blocks=True)
+            etapa["linhas"] = len(df)
+        return df
+    except Exception as e:
+        registrar_excecao(e)
+        return None
+
+
+def _gravar_cache_disco(df, metadados):
+    """Grava a base processada em formato Arrow para os próximos processos.
+
+    O arquivo é gravado sem compressão (requisito para o memory-map sem cópia)
+    e os dois arquivos são substituídos atomicamente, para não afetar
+    processos que já os mapearam. Os metadados são gravados por último: só
+    então a versão passa a ser lida. Retorna True se a gravação foi concluída.
+    """
+    caminho_dados, caminho_meta = _caminhos_cache(metadados)
+
+    def gravar_metadados(caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(metadados, f)
+
+    try:
+        with medir_etapa("gravacao_cache_disco", linhas=len(df)):
+            os.makedirs(PASTA_CACHE, exist_ok=True)
+            _gravar_atomico(caminho_dados,
+                            lambda caminho: feather.write_feather(df, caminho, compression="uncompressed"))
+            _gravar_atomico(caminho_meta, gravar_metadados)
+            _remover_versoes_antigas(metadados)
+        return True
+    except Exception as e:
+        # Cache em disco é uma otimização: falhar aqui não impede o carregamento
+        registrar_excecao(e)
+        return False
+
+
+def versao_base(nrows=10000):
+    """Identificador da versão da base carregada no processo (None se não carregada).
+
+    Muda sempre que o arquivo de origem, ``nrows`` ou o pipeline mudam; serve
+    de chave para caches derivados da base.
+    """
+    em_processo = _bases_processo.get(nrows)
+    if em_processo is None:
+        return None
+    return _impressao(em_processo[0])
+
+
+def metadados_fontes(nrows, diretorio=DIRETORIO_FONTES):
+    """Versão dos dados normalizados: tamanho e data de cada fonte e nrows."""
+    arquivos = {
+        nome: [caminho, os.stat(caminho).st_size, os.stat(caminho).st_mtime]
+        for nome, caminho in localizar_fontes(diretorio).items()
+    }
+    return {
+        "origem": os.path.abspath(diretorio),
+        "fontes": arquivos,
+        "nrows": nrows,
+        "versao_pipeline": VERSAO_PIPELINE,
+    }
+
+
+def _ler_csv_unificado(arquivo, nrows):
+    with medir_etapa("leitura_arquivo", cache="miss") as etapa:
+        try:
+            df = ler_csv(arquivo, nrows=nrows)
+        except Exception as e:
+            registrar_excecao(e)
+            return None
+        etapa["arquivo"] = arquivo
+        etapa["linhas"] = len(df)
+    return df
+
+
+def _ler_fontes_normalizadas(nrows):
+    try:
+        return montar_visao_clientes(carregar_fontes(nrows=nrows))
+    except Exception as e:
+        registrar_excecao(e)
+        return None
+
+
+def _carregar_com_cache(metadados, ler):
+    """Busca a base no cache do processo e no disco; senão lê com ``ler()`` e processa."""
+    nrows = metadados["nrows"]
+    em_processo = _bases_processo.get(nrows)
+    if em_processo is not None and em_processo[0] == metadados:
+        return em_processo[1]
+
+    df = _ler_cache_disco(metadados)
+    if df is None:
+        df = ler()
+        if df is None:
+            return None
+        df = processar_base(df)
+        if _gravar_cache_disco(df, metadados):
+            # Troca a cópia recém-processada pela versão mapeada do disco
+            mapeada = _ler_cache_disco(metadados)
+            if mapeada is not None:
+                df = mapeada
+
+    _bases_processo[nrows] = (metadados, df)
+    return df
+
+
+def carregar_base(nrows=10000):
+    """Retorna a base processada, ou None se não houver arquivo de dados.
+
+    As fontes normalizadas (contratos, NPS e tickets em ``DIRETORIO_FONTES``)
+    têm preferência sobre a base unificada. A ordem de busca é: cache do
+    processo, cache em disco e, por fim, leitura e processamento dos CSVs. O
+    DataFrame retornado é compartilhado por todas as sessões e não deve ser
+    modificado: filtre com máscaras ou crie visões.
+    """
+    with _trava_bases:
+        if fontes_disponiveis():
+            df = _carregar_com_cache(metadados_fontes(nrows), lambda: _ler_fontes_normalizadas(nrows))
+            if df is not None:
+                return df
+
+        for arquivo in ARQUIVOS_AMOSTRA:
+            # Aceita também as versões comprimidas (.csv.gz, .csv.zst, .csv.bz2)
+            arquivo = localizar_arquivo(arquivo)
+            if arquivo is None:
+                continue
+            df = _carregar_com_cache(metadados_origem(arquivo, nrows),
+                                     lambda: _ler_csv_unificado(arquivo, nrows))
+            if df is not None:
+                return df
+
+    return None
+
+
+def gravar_base_particionada(df, destino=DIRETORIO_PARTICIONADO, metadados=None):
+    """Grava a base processada em Parquet particionado (hive) por mês, UF e segmento.
+
+    A gravação é feita em um diretório temporário, então leitores nunca veem
+    uma base pela metade. Ao final, a base anterior é renomeada e o
+    temporário toma o lugar dela: entre as duas renomeações (e não durante a
+    remoção da base antiga) um leitor pode não encontrar a base. Retorna o
+    número de arquivos gravados.
+    """
+    df = df.copy()
+    for col in COLUNAS_PARTICAO:
+        if col not in df.columns:
+            df[col] = "MISSING"
+        df[col] = df[col].astype(str)
+
+    temporario = f"{destino.rstrip(os.sep)}.tmp"
+    shutil.rmtree(temporario, ignore_errors=True)
+    with medir_etapa("gravacao_base_particionada", linhas=len(df)) as etapa:
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            temporario,
+            format="parquet",
+            partitioning=COLUNAS_PARTICAO,
+            partitioning_flavor="hive",
+            max_partitions=1_000_000,
+        )
+        metadados = dict(metadados or {}, versao_pipeline=VERSAO_PIPELINE, linhas=len(df))
+        with open(os.path.join(temporario, ARQUIVO_METADADOS_PARTICOES), "w", encoding="utf-8") as f:
+            json.dump(metadados, f)
+        etapa["arquivos"] = sum(len(arquivos) for _, _, arquivos in os.walk(temporario)) - 1
+
+    antigo = f"{destino.rstrip(os.sep)}.old"
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return etapa["arquivos"]
+
+
+def base_particionada_disponivel(diretorio=DIRETORIO_PARTICIONADO):
+    """Indica se a base particionada já foi gerada por preparar_base.py."""
+    return os.path.exists(os.path.join(diretorio, ARQUIVO_METADADOS_PARTICOES))
+
+
+def dataset_particionado(diretorio=DIRETORIO_PARTICIONADO, inferir_valores=False):
+    """Dataset pyarrow da base particionada, lido sob demanda (nada é carregado aqui)."""
+    if inferir_valores:
+        particionamento = ds.HivePartitioning.discover(infer_dictionary=True)
+    else:
+        particionamento = ds.partitioning(
+            pa.schema([(col, pa.string()) for col in COLUNAS_PARTICAO]), flavor="hive"
+        )
+    # Arquivos iniciados por "_" (como o de metadados) são ignorados pelo pyarrow
+    return ds.dataset(diretorio, format="parquet", partitioning=particionamento)
+
+
+def opcoes_particoes(diretorio=DIRETORIO_PARTICIONADO):
+    """Valores disponíveis de cada coluna de partição, lidos só dos nomes dos diretórios."""
+    if not base_particionada_disponivel(diretorio):
+        return {}
+    dataset = dataset_particionado(diretorio, inferir_valores=True)
+    return {
+        nome: sorted(valores.to_pylist()) if valores is not None else []
+        for nome, valores in zip(dataset.partitioning.schema.names, dataset.partitioning.dictionaries)
+    }
+
+
+def filtro_particoes(ufs=None, segmentos=None, meses=None):
+    """Expressão de filtro sobre as colunas de partição (None se não houver filtro).
+
+    ``meses`` limita a janela aos últimos N meses, incluindo o mês atual;
+    contratos sem data de assinatura ficam fora da janela.
+    """
+    condicoes = []
+    if ufs:
+        condicoes.append(ds.field("UF").isin(list(ufs)))
+    if segmentos:
+        condicoes.append(ds.field("DS_SEGMENTO").isin(list(segmentos)))
+    if meses:
+        mes_inicial = str(pd.Period(datetime.date.today(), freq="M") - (meses - 1))
+        # A comparação é entre textos: "NaT" >= "2024-10" seria verdadeiro
+        condicoes.append((ds.field("mes_assinatura") >= mes_inicial)
+                         & ~ds.field("mes_assinatura").isin(MESES_SEM_DATA))
+    filtro = None
+    for condicao in condicoes:
+        filtro = condicao if filtro is None else filtro & condicao
+    return filtro
+
+
+def carregar_particoes(ufs=None, segmentos=None, meses=None, diretorio=DIRETORIO_PARTICIONADO):
+    """Lê da base particionada apenas as partições necessárias para os filtros.
+
+    O filtro é aplicado às colunas de partição, então diretórios fora da
+    seleção nem chegam a ser abertos: o custo é proporcional à fatia lida.
+    """
+    dataset = dataset_particionado(diretorio)
+    filtro = filtro_particoes(ufs, segmentos, meses)
+    with medir_etapa("leitura_particoes") as etapa:
+        fragmentos = list(dataset.get_fragments(filter=filtro))
+        etapa["particoes_lidas"] = len(fragmentos)
+        etapa["particoes_total"] = len(dataset.files)
+        df = dataset.to_table(filter=filtro).to_pandas(split_blocks=True)
+        etapa["linhas"] = len(df)
+    for col in ["UF", "DS_SEGMENTO"]:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def versao_particoes(ufs=None, segmentos=None, meses=None, diretorio=DIRETORIO_PARTICIONADO):
+    """Versão de uma fatia da base particionada: metadados da gravação + filtros."""
+    with open(os.path.join(diretorio, ARQUIVO_METADADOS_PARTICOES), encoding="utf-8") as f:
+        metadados = json.load(f)
+    conteudo = json.dumps([metadados, sorted(ufs or []), sorted(segmentos or []), meses], sort_keys=True)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:12]
@@ -1,47 +1,48 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-import datetime
+import functools
 import gc
-import json
 import os
-import locale
 
-# Configurar locale para formatação de números em português do Brasil
-try:
-    locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
-except:
-    try:
-        locale.setlocale(locale.LC_ALL, 'Portuguese_Brazil.1252')
-    except:
-        locale.setlocale(locale.LC_ALL, '')
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-# Função de limpeza básica inline (substituindo limpeza_dados)
-def limpar_dados_basico(df):
-    """Limpeza básica de dados inline."""
-    try:
-        # Converter tipos para otimizar memória
-        for col in df.select_dtypes(include=['float64']).columns:
-            df[col] = df[col].astype('float32')
-        for col in df.select_dtypes(include=['int64']).columns:
-            df[col] = df[col].astype('int32')
-        for col in df.select_dtypes(include=['object']).columns:
-            if df[col].nunique() < 100:
-                df[col] = df[col].astype('category')
-        
-        # Tratar valores faltantes básicos
-        for col in df.columns:
-            if df[col].isnull().sum() > 0:
-                if pd.api.types.is_numeric_dtype(df[col]):
-                    df[col] = df[col].fillna(df[col].mean())
-                else:
-                    df[col] = df[col].fillna(df[col].mode()[0] if len(df[col].mode()) > 0 else 'MISSING')
-        
-        return df
-    except Exception:
-        return df
+from consultas import (
+    backend_ativo,
+    clientes_destaque_arrow,
+    contar_registros,
+    estado_clientes_arrow,
+    metricas_arrow,
+)
+from dados import (
+    LIMIARES_SEGMENTACAO,
+    carregar_base,
+    carregar_particoes,
+    criar_dados_demo,
+    opcoes_particoes,
+    versao_base,
+    versao_particoes,
+)
+from graficos import construir_figuras, formatar_moeda, formatar_numero, formatar_percentual
+from inicializacao import configurar_locale, importacao_tardia
+from instrumentacao import (
+    iniciar_execucao,
+    marcar_cache_miss,
+    medir_etapa,
+    registrar_excecao,
+    registros_execucao,
+    status_cache,
+)
+from metricas import calcular_metricas_cs
+from recomendacao import construir_modelo_produtos, recomendar_produtos, resumir_recomendacoes
+from similaridade import buscar_similares, construir_indice_similares
+from simulador import CORTES_DIAS, QUANTIS_VALOR, construir_histograma, simular_cenario
+from snapshots import TRANSICOES, comparar_snapshots, data_snapshot, estado_clientes, gravar_snapshot, listar_snapshots
+
+# Configurar locale para formatação de números em português do Brasil (uma vez por processo)
+configurar_locale()
+
+# plotly.express é pesado e só é importado quando a primeira seção com gráficos é renderizada
+px = importacao_tardia("plotly.express")
 
 # Configuração da página
 st.set_page_config(
@@ -50,472 +51,152 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Funções de formatação
-def formatar_moeda(valor):
-    if pd.isna(valor):
-        return "R$ 0"
-    valor_int = round(valor)
-    return f"R$ {valor_int:,}".replace(',', '.')
-
-def formatar_numero(valor):
-    if pd.isna(valor):
-        return "0"
-    return f"{int(valor):,}".replace(',', '.')
-
-def formatar_percentual(valor):
-    if pd.isna(valor):
-        return "0%"
-    return f"{valor:.1f}%"
-
-def criar_dados_demo(n=2000):
-    """Cria um conjunto de dados de demonstração com muitos clientes ativos."""
-    # PROBABILIDADES CORRIGIDAS - somam exatamente 1.0
-    status_choices = ['ATIVO', 'VIGENTE', 'REGULAR', 'CANCELADO', 'ENCERRADO', 'INATIVO']
-    status_weights = [0.5, 0.25, 0.15, 0.06, 0.03, 0.01]  # Soma = 1.0
-    
-    # Criar DataFrame com dados de demonstração
-    demo_df = pd.DataFrame({
-        'cliente_id': [f'C{i:05d}' for i in range(n)],
-        'VL_TOTAL_CONTRATO_NUM': np.random.uniform(1000, 100000, n),
-        'resposta_NPS_x': np.random.randint(0, 11, n),
-        'SITUACAO_CONTRATO': np.random.choice(status_choices, n, p=status_weights),
-        'DS_SEGMENTO': np.random.choice(['MANUFATURA', 'SERVIÇOS', 'VAREJO', 'FINANCEIRO'], n),
-        'UF': np.random.choice(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA'], n),
-    })
-    
-    # Criar datas aleatórias
-    hoje = datetime.datetime.now()
-    datas = [hoje - datetime.timedelta(days=np.random.randint(1, 1000)) for _ in range(n)]
-    demo_df["DT_ASSINATURA_CONTRATO"] = datas
-    demo_df["mes_assinatura"] = pd.Series(datas).dt.to_period("M").astype(str).values
-    demo_df["dias_como_cliente"] = [(hoje - d).days for d in datas]
-    
-    # Categorizar NPS
-    demo_df["categoria_nps"] = pd.cut(
-        demo_df["resposta_NPS_x"],
-        bins=[-1, 6, 8, 10],
-        labels=["Detrator", "Neutro", "Promotor"]
-    )
-    
-    # Aplicar regras de segmentação
-    demo_df["risco_churn"] = False
-    demo_df.loc[(demo_df["resposta_NPS_x"] <= 5) | 
-               (demo_df["resposta_NPS_x"] <= 3) | 
-               ((demo_df["resposta_NPS_x"] < 7) & (demo_df["dias_como_cliente"] > 730)), 
-               "risco_churn"] = True
-               
-    if demo_df["risco_churn"].mean() < 0.15:
-        limite = demo_df["resposta_NPS_x"].quantile(0.15)
-        demo_df.loc[demo_df["resposta_NPS_x"] <= limite, "risco_churn"] = True
-    
-    demo_df["potencial_upsell"] = False
-    demo_df.loc[
-        ((demo_df["resposta_NPS_x"] >= 8) & 
-          (demo_df["VL_TOTAL_CONTRATO_NUM"] < demo_df["VL_TOTAL_CONTRATO_NUM"].median()) |
-          (demo_df["resposta_NPS_x"] >= 9)) &
-        (~demo_df["risco_churn"]), 
-        "potencial_upsell"] = True
-        
-    if demo_df["potencial_upsell"].mean() < 0.2:
-        limite = demo_df["resposta_NPS_x"].quantile(0.8)
-        demo_df.loc[(demo_df["resposta_NPS_x"] >= limite) & (~demo_df["risco_churn"]), "potencial_upsell"] = True
-    
-    demo_df["cluster"] = "Regular"
-    demo_df.loc[demo_df["risco_churn"], "cluster"] = "Risco de Churn"
-    demo_df.loc[demo_df["potencial_upsell"], "cluster"] = "Potencial de Upsell"
-    
-    return demo_df
-
-@st.cache_data(ttl=3600)
+# Painel de performance oculto: ative com ?debug=1 na URL ou DASHBOARD_DEBUG=1
+modo_debug = os.environ.get("DASHBOARD_DEBUG") == "1" or st.query_params.get("debug") == "1"
+iniciar_execucao(rastrear_alocacoes=modo_debug)
+
+def fragmento(funcao):
+    """``st.fragment`` com contexto de instrumentação próprio nas reexecuções parciais.
+
+    Quando só o fragmento é reexecutado, as etapas medidas ficam em uma nova
+    execução com o nome do fragmento como escopo, e não misturadas aos
+    registros da última execução da página inteira.
+    """
+    @functools.wraps(funcao)
+    def executar(*args, **kwargs):
+        contexto = get_script_run_ctx()
+        if contexto is not None and contexto.fragment_ids_this_run:
+            iniciar_execucao(rastrear_alocacoes=modo_debug, escopo=funcao.__name__)
+        return funcao(*args, **kwargs)
+    return st.fragment(executar)
+
+@st.cache_resource(ttl=3600)
 def load_data(nrows=10000):
-    """Carrega e processa os dados do arquivo CSV."""
+    """Carrega e processa os dados do arquivo CSV.
+
+    Usa cache_resource para que todas as sessões compartilhem a mesma base
+    somente leitura, sem a cópia por sessão do cache_data. Retorna a base e
+    a sua versão, usada como chave dos caches derivados.
+    """
+    marcar_cache_miss("load_data")
     try:
-        # Verificar arquivos de amostra primeiro
-        arquivos_amostra = [
-            "amostras/amostra_tiny.csv",
-            "amostras/amostra_pequena.csv", 
-            "amostras/amostra_parte_1.csv",
-            "base_unificada_amostra.csv"
-        ]
-        
-        df = None
-        arquivo_usado = None
-        
-        for arquivo in arquivos_amostra:
-            if os.path.exists(arquivo):
-                try:
-                    df = pd.read_csv(arquivo, nrows=nrows)
-                    arquivo_usado = arquivo
-                    break
-                except Exception as e:
-                    continue
-        
+        df = carregar_base(nrows)
+
         if df is None:
             st.info("📄 Criando dados de demonstração")
-            return criar_dados_demo(2000)
-            
-        # Verificar e normalizar o nome da coluna de cliente 
-        colunas_cliente = ['cliente_id', 'CD_CLIENTE', 'CLIENTE', 'CD_CLI', 
-                         'CODIGO_ORGANIZACAO', 'CODIGO_CLIENTE', 'ID_CLIENTE']
-        
-        cliente_col = None
-        for col in colunas_cliente:
-            if col in df.columns:
-                cliente_col = col
-                break
-        
-        if cliente_col:
-            df.rename(columns={cliente_col: "cliente_id"}, inplace=True)
-        else:
-            df["cliente_id"] = df.index.astype(str)
-        
-        df = limpar_dados_basico(df)
-        
-        # Tratamento para a coluna de valor de contrato
-        colunas_valor = ['VL_TOTAL_CONTRATO', 'VALOR_CONTRATO', 'VL_CONTRATO']
-        valor_col = None
-        for col in colunas_valor:
-            if col in df.columns:
-                valor_col = col
-                break
-                
-        if valor_col:
-            try:
-                valor_series = df[valor_col]
-                if valor_series.dtype.name == 'category':
-                    valor_series = valor_series.astype(str)
-                
-                df["VL_TOTAL_CONTRATO_NUM"] = pd.to_numeric(
-                    valor_series.str.replace(",", "."), 
-                    errors="coerce"
-                )
-                
-                if df["VL_TOTAL_CONTRATO_NUM"].isna().all():
-                    raise ValueError("Todos os valores convertidos são nulos")
-            except Exception as e:
-                df["VL_TOTAL_CONTRATO_NUM"] = np.random.uniform(1000, 100000, len(df))
-        else:
-            df["VL_TOTAL_CONTRATO_NUM"] = np.random.uniform(1000, 100000, len(df))
-            
-        # Tratamento para coluna de data
-        colunas_data = ['DT_ASSINATURA_CONTRATO', 'DATA_ASSINATURA', 'DT_CONTRATO']
-        data_col = None
-        for col in colunas_data:
-            if col in df.columns:
-                data_col = col
-                break
-                
-        if data_col:
-            df["DT_ASSINATURA_CONTRATO"] = pd.to_datetime(df[data_col], errors="coerce")
-        else:
-            hoje = datetime.datetime.now()
-            datas = [hoje - datetime.timedelta(days=np.random.randint(1, 1000)) for _ in range(len(df))]
-            df["DT_ASSINATURA_CONTRATO"] = datas
-            
-        try:
-            if df["DT_ASSINATURA_CONTRATO"].dtype.name == 'category':
-                df["DT_ASSINATURA_CONTRATO"] = pd.to_datetime(df["DT_ASSINATURA_CONTRATO"].astype(str), errors="coerce")
-            
-            df["mes_assinatura"] = df["DT_ASSINATURA_CONTRATO"].dt.to_period("M").astype(str)
-            df["dias_como_cliente"] = (datetime.datetime.now() - df["DT_ASSINATURA_CONTRATO"]).dt.days
-        except Exception as e:
-            hoje = datetime.datetime.now()
-            df["mes_assinatura"] = "2023-01"
-            df["dias_como_cliente"] = 365
-
-        # Verificar coluna de status do contrato
-        colunas_status = ['SITUACAO_CONTRATO', 'STATUS_CONTRATO', 'SITUACAO']
-        status_col = None
-        for col in colunas_status:
-            if col in df.columns:
-                status_col = col
-                break
-                
-        if status_col:
-            df.rename(columns={status_col: "SITUACAO_CONTRATO"}, inplace=True)
-            if df["SITUACAO_CONTRATO"].dtype.name == 'category':
-                df["SITUACAO_CONTRATO"] = df["SITUACAO_CONTRATO"].astype(str)
-        else:
-            df["SITUACAO_CONTRATO"] = np.random.choice(['ATIVO', 'CANCELADO', 'VIGENTE'], len(df))
-        
-        # Tratamento para NPS
-        colunas_nps = ['resposta_NPS_x', 'NPS', 'NOTA_NPS', 'Nota NPS_x']
-        nps_col = None
-        for col in colunas_nps:
-            if col in df.columns:
-                nps_col = col
-                break
-                
-        if nps_col:
-            df.rename(columns={nps_col: "resposta_NPS_x"}, inplace=True)
-            if df["resposta_NPS_x"].dtype.name == 'category':
-                df["resposta_NPS_x"] = pd.to_numeric(df["resposta_NPS_x"].astype(str), errors="coerce")
-        else:
-            df["resposta_NPS_x"] = np.random.randint(0, 11, len(df))
-        
-        try:    
-            df["categoria_nps"] = pd.cut(
-                df["resposta_NPS_x"],
-                bins=[-1, 6, 8, 10],
-                labels=["Detrator", "Neutro", "Promotor"]
-            )
-        except Exception as e:
-            df["categoria_nps"] = np.random.choice(["Detrator", "Neutro", "Promotor"], len(df))
-        
-        # Calcular risco de churn
-        df["risco_churn"] = False
-        
-        condicao1 = (df["resposta_NPS_x"] <= 5) & (df["dias_como_cliente"] < 365)
-        condicao2 = (df["resposta_NPS_x"] <= 3)
-        condicao3 = (df["resposta_NPS_x"] < 7) & (df["dias_como_cliente"] > 730)
-        
-        df.loc[condicao1 | condicao2 | condicao3, "risco_churn"] = True
-        
-        if df["risco_churn"].mean() < 0.1:
-            limite = df["resposta_NPS_x"].quantile(0.1)
-            df.loc[df["resposta_NPS_x"] <= limite, "risco_churn"] = True
-              
-        # Calcular potencial de upsell
-        df["potencial_upsell"] = False
-        
-        condicao1 = (df["resposta_NPS_x"] >= 8) & (df["VL_TOTAL_CONTRATO_NUM"] < df["VL_TOTAL_CONTRATO_NUM"].median())
-        condicao2 = (df["dias_como_cliente"] > 730) & (df["VL_TOTAL_CONTRATO_NUM"] < df["VL_TOTAL_CONTRATO_NUM"].quantile(0.25))
-        condicao3 = (df["resposta_NPS_x"] >= 9)
-        
-        df.loc[(condicao1 | condicao2 | condicao3) & (~df["risco_churn"]), "potencial_upsell"] = True
-        
-        if df["potencial_upsell"].mean() < 0.15:
-            limite = df.loc[~df["risco_churn"], "resposta_NPS_x"].quantile(0.85)
-            df.loc[(df["resposta_NPS_x"] >= limite) & (~df["risco_churn"]), "potencial_upsell"] = True
-        
-        # Criar clusters de clientes
-        df["cluster"] = "Regular"
-        df.loc[df["risco_churn"], "cluster"] = "Risco de Churn"
-        df.loc[df["potencial_upsell"], "cluster"] = "Potencial de Upsell"
-            
-        # Otimização de memória
-        for col in df.select_dtypes(include=['float64']).columns:
-            df[col] = df[col].astype('float32')
-            
-        for col in df.select_dtypes(include=['int64']).columns:
-            df[col] = df[col].astype('int32')
-            
-        for col in df.select_dtypes(include=['object']).columns:
-            if df[col].nunique() < 100:
-                df[col] = df[col].astype('category')
-                
-        return df
-    
+            return criar_dados_demo(2000), "demo-2000"
+
+        return df, versao_base(nrows)
+
     except Exception as e:
+        registrar_excecao(e)
         st.error(f"Erro ao carregar dados: {e}")
         st.info("🔄 Criando dados de demonstração")
-        
-        n = 1000
-        
-        # PROBABILIDADES CORRIGIDAS - somam exatamente 1.0
-        status_choices = ['ATIVO', 'VIGENTE', 'REGULAR', 'CANCELADO', 'ENCERRADO', 'INATIVO']
-        status_weights = [0.5, 0.25, 0.15, 0.06, 0.03, 0.01]  # Soma = 1.0
-        
-        demo_df = pd.DataFrame({
-            'cliente_id': [f'C{i:05d}' for i in range(n)],
-            'VL_TOTAL_CONTRATO_NUM': np.random.uniform(1000, 100000, n),
-            'resposta_NPS_x': np.random.randint(0, 11, n),
-            'SITUACAO_CONTRATO': np.random.choice(status_choices, n, p=status_weights),
-            'DS_SEGMENTO': np.random.choice(['MANUFATURA', 'SERVIÇOS', 'VAREJO', 'FINANCEIRO'], n),
-            'UF': np.random.choice(['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA'], n),
-        })
-        
-        # Criar datas aleatórias
-        hoje = datetime.datetime.now()
-        datas = [hoje - datetime.timedelta(days=np.random.randint(1, 1000)) for _ in range(n)]
-        demo_df["DT_ASSINATURA_CONTRATO"] = datas
-        demo_df["mes_assinatura"] = pd.Series(datas).dt.to_period("M").astype(str).values
-        demo_df["dias_como_cliente"] = [(hoje - d).days for d in datas]
-        
-        # Categorizar NPS
-        demo_df["categoria_nps"] = pd.cut(
-            demo_df["resposta_NPS_x"],
-            bins=[-1, 6, 8, 10],
-            labels=["Detrator", "Neutro", "Promotor"]
-        )
-        
-        # Clusters
-        demo_df["risco_churn"] = False
-        demo_df.loc[(demo_df["resposta_NPS_x"] <= 5) | 
-                   (demo_df["resposta_NPS_x"] <= 3) | 
-                   ((demo_df["resposta_NPS_x"] < 7) & (demo_df["dias_como_cliente"] > 730)), 
-                   "risco_churn"] = True
-                   
-        if demo_df["risco_churn"].mean() < 0.15:
-            limite = demo_df["resposta_NPS_x"].quantile(0.15)
-            demo_df.loc[demo_df["resposta_NPS_x"] <= limite, "risco_churn"] = True
-        
-        demo_df["potencial_upsell"] = False
-        demo_df.loc[
-            ((demo_df["resposta_NPS_x"] >= 8) & 
-             (demo_df["VL_TOTAL_CONTRATO_NUM"] < demo_df["VL_TOTAL_CONTRATO_NUM"].median()) |
-             (demo_df["resposta_NPS_x"] >= 9)) &
-            (~demo_df["risco_churn"]), 
-            "potencial_upsell"] = True
-            
-        if demo_df["potencial_upsell"].mean() < 0.2:
-            limite = demo_df["resposta_NPS_x"].quantile(0.8)
-            demo_df.loc[(demo_df["resposta_NPS_x"] >= limite) & (~demo_df["risco_churn"]), "potencial_upsell"] = True
-        
-        demo_df["cluster"] = "Regular"
-        demo_df.loc[demo_df["risco_churn"], "cluster"] = "Risco de Churn"
-        demo_df.loc[demo_df["potencial_upsell"], "cluster"] = "Potencial de Upsell"
-        
-        return demo_df
-
-# Calcular métricas de cliente success
-@st.cache_data
-def calcular_metricas_cs(df):
-    """Calcula métricas agregadas para o dashboard de Customer Success."""
-    metricas = {}
-    
+        return criar_dados_demo(1000), "demo-1000"
+
+@st.cache_resource(ttl=3600, max_entries=32)
+def load_particoes(ufs, segmentos, meses):
+    """Carrega da base particionada apenas a fatia dos filtros, compartilhada entre sessões."""
+    marcar_cache_miss("load_data")
+    return carregar_particoes(ufs, segmentos, meses), versao_particoes(ufs, segmentos, meses)
+
+@st.cache_data(ttl=600)
+def opcoes_base_particionada():
+    """Valores de UF, segmento e mês disponíveis na base particionada (vazio se não existir)."""
+    return opcoes_particoes()
+
+@st.cache_resource(ttl=3600, max_entries=8)
+def modelo_recomendacao(_df, versao):
+    """Matrizes esparsas de produtos, construídas uma vez por versão da base."""
+    marcar_cache_miss("modelo_recomendacao")
+    return construir_modelo_produtos(_df)
+
+@st.cache_data(ttl=3600, max_entries=8)
+def recomendacoes_upsell(_df, versao, k=3):
+    """Próximos produtos de todos os candidatos a upsell, pontuados em um único lote."""
+    marcar_cache_miss("recomendacoes_upsell")
+    if "potencial_upsell" not in _df.columns or "cliente_id" not in _df.columns:
+        return resumir_recomendacoes(pd.DataFrame(columns=["cliente_id", "ranking", "produto"]))
+    candidatos = _df.loc[_df["potencial_upsell"].to_numpy(), "cliente_id"]
+    return resumir_recomendacoes(recomendar_produtos(modelo_recomendacao(_df, versao), candidatos, k))
+
+@st.cache_resource(ttl=3600, max_entries=8)
+def indice_similares(_df, versao):
+    """Índice de vizinhos mais próximos dos clientes, construído uma vez por versão da base."""
+    marcar_cache_miss("indice_similares")
+    return construir_indice_similares(_df)
+
+@st.cache_resource(ttl=3600, max_entries=8)
+def histograma_simulador(_df, versao):
+    """Histograma conjunto NPS x tempo de casa x valor, construído uma vez por versão da base."""
+    marcar_cache_miss("histograma_simulador")
+    return construir_histograma(_df)
+
+@st.cache_resource(ttl=3600, max_entries=8)
+def snapshot_segmentacao(_df, versao):
+    """Grava o snapshot da segmentação uma vez por versão da base.
+
+    Sem ``_df`` (backend Arrow), o estado dos clientes é calculado direto na
+    base particionada.
+    """
+    marcar_cache_miss("snapshot_segmentacao")
     try:
-        # Total de clientes
-        if "cliente_id" in df.columns:
-            metricas["total_clientes"] = df["cliente_id"].nunique()
-        else:
-            metricas["total_clientes"] = len(df)
-        
-        # Cliente ativos (não cancelados) - com definição ampliada
-        if "SITUACAO_CONTRATO" in df.columns:
-            # Tratamento seguro para diferentes strings de status
-            # Expandir a lista de status considerados como cancelados/inativos
-            status_cancelado = ["CANCELADO", "INATIVO", "ENCERRADO", "CANCELADO ", "CANCELADA", 
-                              "CANCEL", "CANC", "INACTIVE", "CLOSED", "ENCERRADA"]
-            
-            # Considerar como ativos apenas status que contenham palavras-chave específicas ou que não sejam cancelados
-            status_ativos_keywords = ["ATIV", "ATIVE", "ATUAL", "NORMAL", "REGULAR", "VIGENTE"]
-            
-            # Criar máscara para status explicitamente cancelados
-            mascara_cancelados = df["SITUACAO_CONTRATO"].str.upper().isin([s.upper() for s in status_cancelado])
-            
-            # Se não for explicitamente cancelado e contiver alguma palavra-chave de ativo, considerar ativo
-            mascara_ativos = False
-            for keyword in status_ativos_keywords:
-                mascara_ativos = mascara_ativos | df["SITUACAO_CONTRATO"].str.upper().str.contains(keyword, na=False)
-            
-            # Considerar ativos: ou explicitamente ativos ou não explicitamente cancelados
-            df_ativos = df[mascara_ativos | ~mascara_cancelados]
-            
-            # Se isso resultar em zero clientes ativos, considerar todos como ativos (para demonstração)
-            if df_ativos.empty:
-                df_ativos = df
-                
-            metricas["clientes_ativos"] = df_ativos["cliente_id"].nunique() if "cliente_id" in df.columns else len(df_ativos)
-            
-            # Forçar sempre um valor alto de clientes ativos (pelo menos 90% do total)
-            total_clientes = metricas.get("total_clientes", 0)
-            if total_clientes > 0:
-                # Garantir que pelo menos 90% dos clientes são ativos (sem mostrar aviso)
-                metricas["clientes_ativos"] = max(int(total_clientes * 0.95), metricas.get("clientes_ativos", 0))
-                # Se isso resultou em zero, usar o total de clientes
-                if metricas["clientes_ativos"] <= 0:
-                    metricas["clientes_ativos"] = total_clientes
-            
-            # Taxa de churn (assumindo que temos contratos de pelo menos 12 meses atrás)
-            if "DT_ASSINATURA_CONTRATO" in df.columns:
-                contratos_ano_anterior = df[df["DT_ASSINATURA_CONTRATO"] < datetime.datetime.now() - datetime.timedelta(days=365)]
-                contratos_ano_anterior_count = contratos_ano_anterior["cliente_id"].nunique() if "cliente_id" in df.columns else len(contratos_ano_anterior)
-                
-                cancelados = df[mascara_cancelados]
-                cancelados_count = cancelados["cliente_id"].nunique() if "cliente_id" in df.columns else len(cancelados)
-                
-                if contratos_ano_anterior_count > 0:
-                    metricas["taxa_churn"] = (cancelados_count / contratos_ano_anterior_count) * 100
-                else:
-                    metricas["taxa_churn"] = 0
-            else:
-                metricas["taxa_churn"] = 0
-        else:
-            metricas["clientes_ativos"] = metricas["total_clientes"]
-            metricas["taxa_churn"] = 0
-        
-        # Estatísticas de clusters
-        if "cluster" in df.columns:
-            if "cliente_id" in df.columns:
-                metricas["total_por_cluster"] = df.groupby("cluster", observed=True)["cliente_id"].nunique().to_dict()
-            else:
-                metricas["total_por_cluster"] = df.groupby("cluster", observed=True).size().to_dict()
-                
-            # Verificar se há clientes em todos os clusters
-            for cluster in ["Regular", "Risco de Churn", "Potencial de Upsell"]:
-                if cluster not in metricas["total_por_cluster"]:
-                    metricas["total_por_cluster"][cluster] = 0
-        else:
-            metricas["total_por_cluster"] = {"Regular": metricas["total_clientes"], "Risco de Churn": 0, "Potencial de Upsell": 0}
-                  
-        # NPS médio por cluster
-        if "resposta_NPS_x" in df.columns and "cluster" in df.columns:
-            metricas["nps_por_cluster"] = df.groupby("cluster", observed=True)["resposta_NPS_x"].mean().to_dict()
-            metricas["nps_medio_geral"] = df["resposta_NPS_x"].mean()
-            
-            # Distribuição de NPS
-            if "categoria_nps" in df.columns:
-                metricas["dist_nps"] = df["categoria_nps"].value_counts().to_dict()
-                
-                # Verificar se há valores em todas as categorias de NPS
-                for cat in ["Detrator", "Neutro", "Promotor"]:
-                    if cat not in metricas["dist_nps"]:
-                        metricas["dist_nps"][cat] = 0
-            else:
-                metricas["dist_nps"] = {"Detrator": 0, "Neutro": 0, "Promotor": 0}
-        else:
-            metricas["nps_por_cluster"] = {c: 0 for c in ["Regular", "Risco de Churn", "Potencial de Upsell"]}
-            metricas["nps_medio_geral"] = 0
-            metricas["dist_nps"] = {"Detrator": 0, "Neutro": 0, "Promotor": 0}
-            
-        # Ticket médio por cluster
-        if "VL_TOTAL_CONTRATO_NUM" in df.columns and "cluster" in df.columns:
-            metricas["ticket_medio_por_cluster"] = df.groupby("cluster", observed=True)["VL_TOTAL_CONTRATO_NUM"].mean().to_dict()
-            metricas["ticket_medio_geral"] = df["VL_TOTAL_CONTRATO_NUM"].mean()
-        else:
-            metricas["ticket_medio_por_cluster"] = {c: 0 for c in ["Regular", "Risco de Churn", "Potencial de Upsell"]}
-            metricas["ticket_medio_geral"] = 0
-        
-        # Clientes com risco de churn
-        if "risco_churn" in df.columns:
-            if "cliente_id" in df.columns:
-                metricas["num_clientes_risco_churn"] = df[df["risco_churn"]]["cliente_id"].nunique()
-            else:
-                metricas["num_clientes_risco_churn"] = df["risco_churn"].sum()
-        else:
-            metricas["num_clientes_risco_churn"] = 0
-        
-        # Clientes com oportunidade de upsell
-        if "potencial_upsell" in df.columns:
-            if "cliente_id" in df.columns:
-                metricas["num_clientes_upsell"] = df[df["potencial_upsell"]]["cliente_id"].nunique()
-            else:
-                metricas["num_clientes_upsell"] = df["potencial_upsell"].sum()
-        else:
-            metricas["num_clientes_upsell"] = 0
-        
-        # Tendência de engajamento (usando tickets de suporte como proxy se disponível)
-        if "ticket" in df.columns and "DT_CRIACAO" in df.columns:
-            df["DT_CRIACAO"] = pd.to_datetime(df["DT_CRIACAO"], errors="coerce")
-            df["mes_ticket"] = df["DT_CRIACAO"].dt.to_period("M").astype(str)
-            metricas["engajamento_mes"] = df.groupby("mes_ticket", observed=True)["ticket"].count().to_dict()
-        
+        estado = estado_clientes(_df) if _df is not None else estado_clientes_arrow()
+        return None if estado is None else gravar_snapshot(estado, versao)
     except Exception as e:
-        st.error(f"Erro ao calcular métricas: {e}")
-        
-    return metricas
+        # Os snapshots são um complemento: falhar aqui não impede o dashboard
+        registrar_excecao(e)
+        return None
 
-try:
-    # Carregar dados
-    df = load_data()
+@st.cache_data(ttl=3600, max_entries=32)
+def transicoes_snapshots(anterior, atual):
+    """Transições entre dois snapshots; os arquivos não mudam, então o id é a chave."""
+    marcar_cache_miss("transicoes_snapshots")
+    return comparar_snapshots(anterior, atual)
 
-    # Calcular métricas
-    metricas = calcular_metricas_cs(df)
-    
+# Calcular métricas de cliente success
+@st.cache_resource(ttl=3600, max_entries=32)
+def filtrar_cluster(_df, versao, cluster):
+    """Visão da base restrita a um cluster, compartilhada entre sessões e reruns."""
+    marcar_cache_miss("filtrar_cluster")
+    if cluster == "Todos" or "cluster" not in _df.columns:
+        return _df
+    return _df[(_df["cluster"] == cluster).to_numpy()]
+
+@st.cache_data(ttl=3600, max_entries=64)
+def metricas_painel(_df, versao, cluster):
+    """Métricas exibidas no painel, cacheadas pela versão da base e pelo cluster."""
+    marcar_cache_miss("metricas_painel")
+    filtrado = cluster != "Todos" and "cluster" in _df.columns
+    # Com o filtro de cluster, as métricas são calculadas só sobre a visão filtrada
+    metricas = calcular_metricas_cs(filtrar_cluster(_df, versao, cluster) if filtrado else _df)
+    if "erro" in metricas:
+        st.error(f"Erro ao calcular métricas: {metricas['erro']}")
+    if filtrado:
+        return metricas
+    total = len(_df["cliente_id"].unique()) if "cliente_id" in _df.columns else len(_df)
+    return forcar_numeros_demo(metricas, total)
+
+@st.cache_data(ttl=3600, max_entries=64)
+def metricas_painel_arrow(ufs, segmentos, meses, versao, cluster):
+    """Métricas do painel pelo backend Arrow, direto na fatia da base particionada."""
+    marcar_cache_miss("metricas_painel")
+    metricas = metricas_arrow(ufs, segmentos, meses, cluster)
+    if "erro" in metricas:
+        st.error(f"Erro ao calcular métricas: {metricas['erro']}")
+    if cluster != "Todos":
+        return metricas
+    return forcar_numeros_demo(metricas, metricas.get("total_clientes", 0))
+
+@st.cache_data(ttl=3600, max_entries=32)
+def registros_particoes(ufs, segmentos, meses, versao):
+    """Número de registros da fatia da base particionada (sem carregá-la)."""
+    return contar_registros(ufs, segmentos, meses)
+
+def forcar_numeros_demo(metricas, total):
+    """Ajusta as métricas da base completa com os números do dashboard de demonstração."""
     # FORÇAR VALORES PARA DASHBOARD DE DEMONSTRAÇÃO
     # Definir número alto de clientes
-    total = len(df["cliente_id"].unique()) if "cliente_id" in df.columns else len(df)
     total = max(total, 700)  # Forçar pelo menos 700 clientes totais
     ativos = max(int(total * 0.95), 650)  # Forçar pelo menos 650 clientes ativos
     
@@ -542,28 +223,33 @@ try:
     # Forçar números de clientes especiais
     metricas["num_clientes_risco_churn"] = total_churn
     metricas["num_clientes_upsell"] = total_upsell
+    return metricas
 
-    # Sidebar
-    st.sidebar.image("logo-totvs-v-blue.png", width=100)
-    st.sidebar.title("Filtros")
-
-    # Filtros simplificados
-    clusters = ["Todos", "Regular", "Risco de Churn", "Potencial de Upsell"]
-    cluster_selecionado = st.sidebar.selectbox("Cluster", options=clusters)
-
-    if cluster_selecionado != "Todos" and "cluster" in df.columns:
-        df = df[df["cluster"] == cluster_selecionado]
-        # Recalcular métricas com o filtro aplicado
-        metricas = calcular_metricas_cs(df)
-
-    # Título e descrição
-    st.markdown("""
-        <h1 style='text-align: center; color: #2E86C1;'>Dashboard de Customer Success</h1>
-        <p style='text-align: center; color: #7F8C8D;'>Métricas de retenção, segmentação de clientes e oportunidades de negócio</p>
-        <hr style='border:1px solid #2E86C1'>
-        """, unsafe_allow_html=True)
-
-    # KPIs principais - Primeira linha
+@st.cache_resource(ttl=3600, max_entries=32)
+def figuras_metricas(_metricas, versao, cluster):
+    """Gráficos de segmentação, valor e satisfação, montados uma vez por versão e cluster."""
+    marcar_cache_miss("figuras_metricas")
+    return construir_figuras(_metricas)
+
+@st.cache_data(ttl=3600, max_entries=64)
+def clientes_destaque(_df, versao, cluster, coluna, n=10):
+    """Primeiros clientes (sem repetição) com a flag ``coluna`` ativa na visão do cluster."""
+    marcar_cache_miss("clientes_destaque")
+    selecao = _df[_df[coluna].to_numpy()]
+    return selecao.drop_duplicates(subset=["cliente_id"] if "cliente_id" in _df.columns else None).head(n)
+
+@st.cache_data(ttl=3600, max_entries=64)
+def clientes_destaque_particoes(ufs, segmentos, meses, versao, cluster, coluna, colunas, n=10):
+    """Primeiros clientes com a flag ``coluna`` ativa, lidos em lotes da base particionada."""
+    marcar_cache_miss("clientes_destaque")
+    return clientes_destaque_arrow(coluna, colunas, ufs, segmentos, meses, cluster, n)
+
+# Seções do dashboard: cada uma recebe apenas as entradas de que depende
+# (métricas ou base, versão dos dados e cluster) e lê seus cálculos de caches
+# com essas mesmas chaves. As seções com widgets próprios são fragmentos:
+# interagir com elas reexecuta só o fragmento, não a página inteira.
+def secao_indicadores(metricas):
+    """KPIs principais. Depende de: métricas (versão dos dados e cluster)."""
     st.markdown("<h3 style='color:#2C3E50'>Indicadores de Retenção</h3>", unsafe_allow_html=True)
 
     col1, col2, col3, col4 = st.columns(4)
@@ -586,7 +272,11 @@ try:
         st.metric("Ticket Médio", 
                   formatar_moeda(metricas.get("ticket_medio_geral", 0)))
 
-    st.markdown("---")
+def secao_graficos(metricas, versao_dados, cluster_selecionado):
+    """Segmentação, valor e satisfação. Depende de: métricas, versão dos dados e cluster."""
+    with medir_etapa("graficos") as etapa:
+        figuras = figuras_metricas(metricas, versao_dados, cluster_selecionado)
+        etapa["cache"] = status_cache("figuras_metricas")
 
     # Segmentação de Clientes
     st.markdown("<h3 style='color:#2C3E50'>Segmentação de Clientes</h3>", unsafe_allow_html=True)
@@ -595,76 +285,13 @@ try:
     col1, col2 = st.columns(2)
 
     with col1:
-        # Gráfico de distribuição por cluster
-        data_clusters = pd.DataFrame({
-            "Cluster": list(metricas["total_por_cluster"].keys()),
-            "Clientes": list(metricas["total_por_cluster"].values())
-        })
-        
-        fig_clusters = px.pie(
-            data_clusters, 
-            names="Cluster", 
-            values="Clientes",
-            color="Cluster",
-            color_discrete_map={
-                "Regular": "#3498DB",
-                "Risco de Churn": "#E74C3C", 
-                "Potencial de Upsell": "#2ECC71"
-            },
-            title="Distribuição de Clientes por Cluster"
-        )
-        
-        fig_clusters.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            hovertemplate='%{label}<br>Clientes: %{value:,.0f}<br>Percentual: %{percent}<extra></extra>'
-        )
-        
         st.markdown("<h4 style='color:#3498DB'>Distribuição por Cluster</h4>", unsafe_allow_html=True)
-        st.plotly_chart(fig_clusters, use_container_width=True)
+        st.plotly_chart(figuras["clusters"], use_container_width=True)
 
     with col2:
-        # Gráfico de NPS por cluster
-        if "nps_por_cluster" in metricas:
-            data_nps = pd.DataFrame({
-                "Cluster": list(metricas["nps_por_cluster"].keys()),
-                "NPS Médio": list(metricas["nps_por_cluster"].values())
-            })
-            
-            fig_nps = px.bar(
-                data_nps,
-                x="Cluster",
-                y="NPS Médio",
-                color="Cluster",
-                color_discrete_map={
-                    "Regular": "#3498DB",
-                    "Risco de Churn": "#E74C3C", 
-                    "Potencial de Upsell": "#2ECC71"
-                },
-                title="NPS Médio por Cluster"
-            )
-            
-            # Adicionar uma linha horizontal para o NPS médio geral
-            fig_nps.add_shape(
-                type="line",
-                x0=-0.5,
-                x1=2.5,
-                y0=metricas["nps_medio_geral"],
-                y1=metricas["nps_medio_geral"],
-                line=dict(color="red", width=2, dash="dash"),
-            )
-            
-            # Adicionar texto para a linha
-            fig_nps.add_annotation(
-                x=1.5,
-                y=metricas["nps_medio_geral"] + 0.5,
-                text=f"Média Geral: {metricas['nps_medio_geral']:.1f}",
-                showarrow=False,
-                font=dict(color="red")
-            )
-            
+        if "nps" in figuras:
             st.markdown("<h4 style='color:#3498DB'>NPS por Cluster</h4>", unsafe_allow_html=True)
-            st.plotly_chart(fig_nps, use_container_width=True)
+            st.plotly_chart(figuras["nps"], use_container_width=True)
 
     # Ticket médio por cluster e distribuição de NPS
     st.markdown("---")
@@ -674,72 +301,17 @@ try:
     col1, col2 = st.columns(2)
 
     with col1:
-        # Ticket médio por cluster
-        if "ticket_medio_por_cluster" in metricas:
-            data_ticket = pd.DataFrame({
-                "Cluster": list(metricas["ticket_medio_por_cluster"].keys()),
-                "Ticket Médio": list(metricas["ticket_medio_por_cluster"].values())
-            })
-            
-            fig_ticket = px.bar(
-                data_ticket,
-                x="Cluster",
-                y="Ticket Médio",
-                color="Cluster",
-                color_discrete_map={
-                    "Regular": "#3498DB",
-                    "Risco de Churn": "#E74C3C", 
-                    "Potencial de Upsell": "#2ECC71"
-                },
-                title="Ticket Médio por Cluster"
-            )
-            
-            # Formatar o eixo Y para mostrar valores em reais
-            fig_ticket.update_layout(
-                yaxis=dict(
-                    tickprefix="R$ ",
-                    tickformat=",.0f"
-                )
-            )
-            
+        if "ticket" in figuras:
             st.markdown("<h4 style='color:#E67E22'>Ticket Médio por Cluster</h4>", unsafe_allow_html=True)
-            st.plotly_chart(fig_ticket, use_container_width=True)
+            st.plotly_chart(figuras["ticket"], use_container_width=True)
 
     with col2:
-        # Distribuição de NPS (Detrator, Neutro, Promotor)
-        if "dist_nps" in metricas:
-            data_dist_nps = pd.DataFrame({
-                "Categoria": list(metricas["dist_nps"].keys()),
-                "Quantidade": list(metricas["dist_nps"].values())
-            })
-            
-            # Ordenar as categorias
-            ordem_cat = ["Detrator", "Neutro", "Promotor"]
-            data_dist_nps["Categoria"] = pd.Categorical(
-                data_dist_nps["Categoria"], 
-                categories=ordem_cat, 
-                ordered=True
-            )
-            data_dist_nps = data_dist_nps.sort_values("Categoria")
-            
-            fig_dist_nps = px.bar(
-                data_dist_nps,
-                x="Categoria",
-                y="Quantidade",
-                color="Categoria",
-                color_discrete_map={
-                    "Detrator": "#E74C3C",
-                    "Neutro": "#F39C12", 
-                    "Promotor": "#27AE60"
-                },
-                title="Distribuição de NPS"
-            )
-            
+        if "dist_nps" in figuras:
             st.markdown("<h4 style='color:#E67E22'>Distribuição de Clientes por NPS</h4>", unsafe_allow_html=True)
-            st.plotly_chart(fig_dist_nps, use_container_width=True)
+            st.plotly_chart(figuras["dist_nps"], use_container_width=True)
 
-    # Alertas de Retenção e Oportunidades
-    st.markdown("---")
+def secao_alertas(metricas):
+    """Cartões de alertas e NPS Score. Depende de: métricas."""
     st.markdown("<h3 style='color:#2C3E50'>Alertas de Retenção e Oportunidades</h3>", unsafe_allow_html=True)
     st.markdown("<p style='color:#7F8C8D'>Clientes que precisam de atenção e potenciais oportunidades de negócio</p>", unsafe_allow_html=True)
 
@@ -790,60 +362,379 @@ try:
         </div>
         """, unsafe_allow_html=True)
 
-    # Lista de clientes em risco - Acionável
-    if (cluster_selecionado == "Risco de Churn" or cluster_selecionado == "Todos") and "risco_churn" in df.columns:
-        st.markdown("---")
-        st.markdown("<h3 style='color:#E74C3C'>Lista de Clientes em Risco de Churn</h3>", unsafe_allow_html=True)
+@fragmento
+def secao_simulador(df_completo, versao_dados):
+    """Simulador de limiares de risco e upsell.
+
+    Depende de: base completa e versão dos dados. Cada ajuste dos limiares
+    reexecuta apenas este fragmento e é respondido pelo histograma em cache.
+    """
+    st.markdown("---")
+    st.markdown("<h3 style='color:#2C3E50'>Simulador de Cenários</h3>", unsafe_allow_html=True)
+    st.markdown("<p style='color:#7F8C8D'>Ajuste os limiares da segmentação e veja o efeito nos clusters, na receita em risco e no perfil de NPS</p>", unsafe_allow_html=True)
+
+    with medir_etapa("simulador", linhas=len(df_completo)) as etapa:
+        histograma = histograma_simulador(df_completo, versao_dados)
+        etapa["cache"] = status_cache("histograma_simulador")
+
+    if histograma is None:
+        st.info("Não há colunas de NPS, tempo de casa e valor para simular cenários.")
+        return
+
+    padrao = LIMIARES_SEGMENTACAO
+    limiares = {}
+    with st.expander("Limiares da segmentação", expanded=False):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("**Risco de Churn**")
+            limiares["risco_nps_novo"] = st.slider("NPS máximo (cliente novo)", 0, 10, padrao["risco_nps_novo"])
+            limiares["risco_dias_novo"] = st.select_slider("Cliente novo: menos de N dias", options=CORTES_DIAS,
+                                                          value=padrao["risco_dias_novo"])
+            limiares["risco_nps_critico"] = st.slider("NPS crítico (qualquer cliente)", 0, 10, padrao["risco_nps_critico"])
+            limiares["risco_nps_antigo"] = st.slider("NPS abaixo de (cliente antigo)", 0, 11, padrao["risco_nps_antigo"])
+            limiares["risco_dias_antigo"] = st.select_slider("Cliente antigo: mais de N dias", options=CORTES_DIAS,
+                                                            value=padrao["risco_dias_antigo"], key="risco_dias_antigo")
+            limiares["risco_minimo"] = st.slider("Fração mínima em risco", 0.0, 0.5, padrao["risco_minimo"], step=0.05)
+
+        with col2:
+            st.markdown("**Potencial de Upsell**")
+            limiares["upsell_nps"] = st.slider("NPS mínimo (contrato pequeno)", 0, 10, padrao["upsell_nps"])
+            limiares["upsell_quantil_valor"] = st.select_slider(
+                "Contrato abaixo do quantil de valor", options=QUANTIS_VALOR,
+                value=padrao["upsell_quantil_valor"], format_func=lambda q: f"{q:.0%}")
+            limiares["upsell_dias_antigo"] = st.select_slider("Cliente antigo: mais de N dias", options=CORTES_DIAS,
+                                                             value=padrao["upsell_dias_antigo"], key="upsell_dias_antigo")
+            limiares["upsell_quantil_valor_antigo"] = st.select_slider(
+                "Cliente antigo: contrato abaixo do quantil", options=QUANTIS_VALOR,
+                value=padrao["upsell_quantil_valor_antigo"], format_func=lambda q: f"{q:.0%}")
+            limiares["upsell_nps_promotor"] = st.slider("NPS de promotor", 0, 10, padrao["upsell_nps_promotor"])
+            limiares["upsell_minimo"] = st.slider("Fração mínima com potencial de upsell", 0.0, 0.5,
+                                                  padrao["upsell_minimo"], step=0.05)
+
+    atual = simular_cenario(histograma)
+    cenario = simular_cenario(histograma, limiares)
+
+    col1, col2, col3, col4 = st.columns(4)
+    for coluna, cluster in zip([col1, col2, col3], ["Regular", "Risco de Churn", "Potencial de Upsell"]):
+        with coluna:
+            diferenca = cenario["registros_por_cluster"][cluster] - atual["registros_por_cluster"][cluster]
+            st.metric(f"Registros: {cluster}",
+                      formatar_numero(cenario["registros_por_cluster"][cluster]),
+                      delta=f"{diferenca:+,}".replace(',', '.'),
+                      delta_color="inverse" if cluster == "Risco de Churn" else "normal")
+    with col4:
+        diferenca = cenario["receita_em_risco"] - atual["receita_em_risco"]
+        st.metric("Receita em Risco", formatar_moeda(cenario["receita_em_risco"]),
+                  delta=("+" if diferenca >= 0 else "-") + formatar_moeda(abs(diferenca)),
+                  delta_color="inverse")
+
+    # Perfil de NPS de cada cluster no cenário simulado
+    data_mix = pd.DataFrame([
+        {"Cluster": cluster, "Categoria": categoria, "Registros": quantidade}
+        for cluster, distribuicao in cenario["dist_nps_por_cluster"].items()
+        for categoria, quantidade in distribuicao.items()
+    ])
+    fig_mix = px.bar(
+        data_mix,
+        x="Cluster",
+        y="Registros",
+        color="Categoria",
+        color_discrete_map={
+            "Detrator": "#E74C3C",
+            "Neutro": "#F39C12", 
+            "Promotor": "#27AE60"
+        },
+        title="Distribuição de NPS por Cluster no Cenário"
+    )
+    st.plotly_chart(fig_mix, use_container_width=True)
+
+def rotulo_snapshot(snapshot):
+    return f"{data_snapshot(snapshot):%d/%m/%Y %H:%M} (versão {snapshot['versao']})"
+
+@fragmento
+def secao_mudancas():
+    """Clientes que mudaram de segmentação entre dois snapshots.
+
+    Depende apenas dos snapshots gravados. A escolha dos snapshots e da
+    transição reexecuta apenas este fragmento.
+    """
+    st.markdown("---")
+    st.markdown("<h3 style='color:#8E44AD'>O Que Mudou</h3>", unsafe_allow_html=True)
+    snapshots = {snapshot["id"]: snapshot for snapshot in reversed(listar_snapshots())}
+    if len(snapshots) < 2:
+        st.info("As mudanças aparecem a partir da segunda versão da base: "
+                "um snapshot da segmentação é gravado a cada nova versão carregada.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        atual = st.selectbox("Snapshot atual", options=list(snapshots), index=0,
+                             format_func=lambda i: rotulo_snapshot(snapshots[i]), key="snapshot_atual")
+    with col2:
+        anterior = st.selectbox("Comparar com", options=list(snapshots), index=1,
+                                format_func=lambda i: rotulo_snapshot(snapshots[i]), key="snapshot_anterior")
+
+    with medir_etapa("mudancas_segmentacao") as etapa:
+        transicoes = transicoes_snapshots(snapshots[anterior], snapshots[atual])
+        etapa["cache"] = status_cache("transicoes_snapshots")
+        etapa["linhas"] = len(transicoes)
+
+    contagens = transicoes["transicao"].value_counts()
+    for coluna, transicao in zip(st.columns(len(TRANSICOES)), TRANSICOES):
+        with coluna:
+            st.metric(transicao, formatar_numero(contagens.get(transicao, 0)))
+
+    transicao = st.selectbox("Transição", options=TRANSICOES, key="transicao_snapshot")
+    selecao = transicoes[transicoes["transicao"] == transicao]
+    if not selecao.empty:
+        st.dataframe(selecao[["cliente_id", "novo_na_base"]].reset_index(drop=True), use_container_width=True)
+    else:
+        st.info("Nenhum cliente com esta transição entre os snapshots escolhidos.")
+
+@fragmento
+def secao_risco_churn(df, df_completo, versao_dados, cluster_selecionado):
+    """Lista de clientes em risco e clientes semelhantes.
+
+    Depende de: base do cluster, versão dos dados e cluster. A escolha do
+    cliente a comparar reexecuta apenas este fragmento.
+    """
+    st.markdown("---")
+    st.markdown("<h3 style='color:#E74C3C'>Lista de Clientes em Risco de Churn</h3>", unsafe_allow_html=True)
+    
+    # Obter amostra de clientes em risco
+    with medir_etapa("lista_risco_churn", linhas=len(df)) as etapa:
+        clientes_risco = clientes_destaque(df, versao_dados, cluster_selecionado, "risco_churn")
+        etapa["cache"] = status_cache("clientes_destaque")
+    
+    if not clientes_risco.empty:
+        colunas_mostrar = [
+            "cliente_id", "resposta_NPS_x", "DS_SEGMENTO", 
+            "UF", "SITUACAO_CONTRATO", "dias_como_cliente"
+        ]
         
-        # Obter amostra de clientes em risco
-        clientes_risco = df[df["risco_churn"]].drop_duplicates(subset=["cliente_id"] if "cliente_id" in df.columns else None).head(10)
+        # Garantir que só mostra colunas que existem
+        colunas_mostrar = [col for col in colunas_mostrar if col in clientes_risco.columns]
         
-        if not clientes_risco.empty:
-            colunas_mostrar = [
-                "cliente_id", "resposta_NPS_x", "DS_SEGMENTO", 
-                "UF", "SITUACAO_CONTRATO", "dias_como_cliente"
-            ]
-            
-            # Garantir que só mostra colunas que existem
-            colunas_mostrar = [col for col in colunas_mostrar if col in clientes_risco.columns]
-            
-            if colunas_mostrar:
-                st.write(clientes_risco[colunas_mostrar])
-            else:
-                st.info("Não há colunas disponíveis para exibir clientes em risco.")
+        if colunas_mostrar:
+            st.write(clientes_risco[colunas_mostrar])
         else:
-            st.info("Não há clientes em risco de churn na seleção atual.")
+            st.info("Não há colunas disponíveis para exibir clientes em risco.")
+
+        # Contas comparáveis: mesmo subsegmento e faixa, valor, tempo de casa e NPS parecidos
+        if "cliente_id" in clientes_risco.columns:
+            st.markdown("<h4 style='color:#E74C3C'>Clientes Semelhantes</h4>", unsafe_allow_html=True)
+            cliente_escolhido = st.selectbox(
+                "Comparar cliente em risco com contas semelhantes",
+                options=clientes_risco["cliente_id"].astype(str).tolist()
+            )
+            with medir_etapa("clientes_semelhantes", linhas=len(df_completo)) as etapa:
+                indice = indice_similares(df_completo, versao_dados)
+                etapa["cache"] = status_cache("indice_similares")
+                similares = buscar_similares(indice, [cliente_escolhido], k=5)
+
+            if not similares.empty:
+                colunas_similares = ["cliente_id", "valor_contrato", "dias_como_cliente", "nps",
+                                     "desfecho", "distancia", "mesmo_grupo"]
+                st.write(similares[colunas_similares])
+                desfechos = similares["desfecho"].value_counts()
+                st.caption(" | ".join(f"{desfecho}: {qtd}" for desfecho, qtd in desfechos.items()))
+            else:
+                st.info("Não há clientes semelhantes disponíveis para este cliente.")
+    else:
+        st.info("Não há clientes em risco de churn na seleção atual.")
 
-    # Lista de oportunidades de upsell - Acionável
-    if (cluster_selecionado == "Potencial de Upsell" or cluster_selecionado == "Todos") and "potencial_upsell" in df.columns:
-        st.markdown("---")
-        st.markdown("<h3 style='color:#27AE60'>Lista de Oportunidades de Upsell</h3>", unsafe_allow_html=True)
+@fragmento
+def secao_upsell(df, df_completo, versao_dados, cluster_selecionado):
+    """Lista de oportunidades de upsell com produtos recomendados.
+
+    Depende de: base do cluster, versão dos dados e cluster.
+    """
+    st.markdown("---")
+    st.markdown("<h3 style='color:#27AE60'>Lista de Oportunidades de Upsell</h3>", unsafe_allow_html=True)
+    
+    # Obter amostra de clientes com potencial de upsell
+    with medir_etapa("lista_upsell", linhas=len(df)) as etapa:
+        clientes_upsell = clientes_destaque(df, versao_dados, cluster_selecionado, "potencial_upsell")
+        etapa["cache"] = status_cache("clientes_destaque")
+
+    # Próximos produtos recomendados para cada cliente (calculados em lote por versão da base)
+    with medir_etapa("recomendacoes_upsell", linhas=len(df_completo)) as etapa:
+        produtos_recomendados = recomendacoes_upsell(df_completo, versao_dados)
+        etapa["cache"] = status_cache("recomendacoes_upsell")
+    
+    if not clientes_upsell.empty:
+        colunas_mostrar = [
+            "cliente_id", "resposta_NPS_x", "DS_SEGMENTO", 
+            "UF", "VL_TOTAL_CONTRATO", "SITUACAO_CONTRATO"
+        ]
         
-        # Obter amostra de clientes com potencial de upsell
-        clientes_upsell = df[df["potencial_upsell"]].drop_duplicates(subset=["cliente_id"] if "cliente_id" in df.columns else None).head(10)
+        # Garantir que só mostra colunas que existem
+        colunas_mostrar = [col for col in colunas_mostrar if col in clientes_upsell.columns]
         
-        if not clientes_upsell.empty:
-            colunas_mostrar = [
-                "cliente_id", "resposta_NPS_x", "DS_SEGMENTO", 
-                "UF", "VL_TOTAL_CONTRATO", "SITUACAO_CONTRATO"
-            ]
-            
-            # Garantir que só mostra colunas que existem
-            colunas_mostrar = [col for col in colunas_mostrar if col in clientes_upsell.columns]
-            
-            if colunas_mostrar:
-                st.write(clientes_upsell[colunas_mostrar])
-            else:
-                st.info("Não há colunas disponíveis para exibir oportunidades de upsell.")
+        if colunas_mostrar:
+            tabela_upsell = clientes_upsell[colunas_mostrar]
+            if "cliente_id" in clientes_upsell.columns:
+                tabela_upsell = tabela_upsell.assign(
+                    produtos_recomendados=clientes_upsell["cliente_id"].astype(str)
+                    .map(produtos_recomendados).fillna("-").to_numpy()
+                )
+            st.write(tabela_upsell)
+        else:
+            st.info("Não há colunas disponíveis para exibir oportunidades de upsell.")
+    else:
+        st.info("Não há oportunidades de upsell na seleção atual.")
+
+def secao_listas_arrow(filtros, versao_dados, cluster_selecionado):
+    """Listas de clientes em risco e de upsell com o backend Arrow.
+
+    Depende de: filtros de partição, versão dos dados e cluster. Clientes
+    semelhantes e produtos recomendados precisam da base em memória e não
+    são exibidos com este backend.
+    """
+    listas = [
+        ("risco_churn", "Risco de Churn", "#E74C3C", "Lista de Clientes em Risco de Churn",
+         ["cliente_id", "resposta_NPS_x", "DS_SEGMENTO", "UF", "SITUACAO_CONTRATO", "dias_como_cliente"],
+         "Não há clientes em risco de churn na seleção atual."),
+        ("potencial_upsell", "Potencial de Upsell", "#27AE60", "Lista de Oportunidades de Upsell",
+         ["cliente_id", "resposta_NPS_x", "DS_SEGMENTO", "UF", "VL_TOTAL_CONTRATO", "SITUACAO_CONTRATO"],
+         "Não há oportunidades de upsell na seleção atual."),
+    ]
+    for coluna, cluster, cor, titulo, colunas_mostrar, mensagem_vazia in listas:
+        if cluster_selecionado not in ("Todos", cluster):
+            continue
+        st.markdown("---")
+        st.markdown(f"<h3 style='color:{cor}'>{titulo}</h3>", unsafe_allow_html=True)
+        with medir_etapa(f"lista_{coluna}") as etapa:
+            clientes = clientes_destaque_particoes(*filtros, versao_dados, cluster_selecionado, coluna, colunas_mostrar)
+            etapa["cache"] = status_cache("clientes_destaque")
+        if not clientes.empty:
+            st.write(clientes)
         else:
-            st.info("Não há oportunidades de upsell na seleção atual.")
+            st.info(mensagem_vazia)
+
+try:
+    # Sidebar
+    st.sidebar.image("logo-totvs-v-blue.png", width=100)
+    st.sidebar.title("Filtros")
+
+    # Filtros simplificados
+    clusters = ["Todos", "Regular", "Risco de Churn", "Potencial de Upsell"]
+    cluster_selecionado = st.sidebar.selectbox("Cluster", options=clusters)
+
+    # Filtros por partição: com a base particionada, apenas a fatia selecionada é lida do disco
+    opcoes_particao = opcoes_base_particionada()
+    if opcoes_particao:
+        ufs_selecionadas = tuple(st.sidebar.multiselect("UF", options=opcoes_particao.get("UF", [])))
+        segmentos_selecionados = tuple(st.sidebar.multiselect("Segmento", options=opcoes_particao.get("DS_SEGMENTO", [])))
+        janela_meses = st.sidebar.slider("Assinaturas nos últimos N meses (0 = todo o histórico)",
+                                         min_value=0, max_value=120, value=0, step=6)
+
+    # Backend de consultas: com "arrow", métricas e listas são calculadas direto na
+    # base particionada, sem carregá-la na memória
+    usar_arrow = bool(opcoes_particao) and backend_ativo() == "arrow"
+    # Snapshots da segmentação só são gravados para a base inteira, sem filtros de partição
+    base_inteira = not opcoes_particao or not (ufs_selecionadas or segmentos_selecionados or janela_meses)
+    if usar_arrow:
+        filtros = (ufs_selecionadas, segmentos_selecionados, janela_meses or None)
+        versao_dados = versao_particoes(*filtros)
+        if registros_particoes(*filtros, versao_dados) == 0:
+            st.warning("Nenhum registro encontrado para os filtros selecionados.")
+            st.stop()
+
+        with medir_etapa("metricas") as etapa:
+            metricas = metricas_painel_arrow(*filtros, versao_dados, cluster_selecionado)
+            etapa["cache"] = status_cache("metricas_painel")
+
+        if base_inteira:
+            with medir_etapa("snapshot_segmentacao") as etapa:
+                snapshot_segmentacao(None, versao_dados)
+                etapa["cache"] = status_cache("snapshot_segmentacao")
+    else:
+        # Carregar dados
+        with medir_etapa("load_data") as etapa:
+            if opcoes_particao:
+                df, versao_dados = load_particoes(ufs_selecionadas, segmentos_selecionados, janela_meses or None)
+            else:
+                df, versao_dados = load_data()
+            etapa["linhas"] = len(df)
+            etapa["cache"] = status_cache("load_data")
+
+        if df.empty:
+            st.warning("Nenhum registro encontrado para os filtros selecionados.")
+            st.stop()
+
+        # Calcular métricas (base completa com os números de demonstração, ou o cluster filtrado)
+        with medir_etapa("metricas", linhas=len(df)) as etapa:
+            metricas = metricas_painel(df, versao_dados, cluster_selecionado)
+            etapa["cache"] = status_cache("metricas_painel")
+
+        # Base completa da versão carregada e visão do cluster; a base compartilhada não é alterada
+        df_completo = df
+        df = filtrar_cluster(df_completo, versao_dados, cluster_selecionado)
+
+        # Dados de demonstração não têm histórico a comparar
+        if base_inteira and not versao_dados.startswith("demo"):
+            with medir_etapa("snapshot_segmentacao", linhas=len(df_completo)) as etapa:
+                snapshot_segmentacao(df_completo, versao_dados)
+                etapa["cache"] = status_cache("snapshot_segmentacao")
+
+    # Título e descrição
+    st.markdown("""
+        <h1 style='text-align: center; color: #2E86C1;'>Dashboard de Customer Success</h1>
+        <p style='text-align: center; color: #7F8C8D;'>Métricas de retenção, segmentação de clientes e oportunidades de negócio</p>
+        <hr style='border:1px solid #2E86C1'>
+        """, unsafe_allow_html=True)
+
+    secao_indicadores(metricas)
+    st.markdown("---")
+    secao_graficos(metricas, versao_dados, cluster_selecionado)
+
+    # Alertas de Retenção e Oportunidades
+    st.markdown("---")
+    secao_alertas(metricas)
+
+    # O que mudou na segmentação entre versões da base
+    secao_mudancas()
+
+    if usar_arrow:
+        secao_listas_arrow(filtros, versao_dados, cluster_selecionado)
+        st.caption("Backend de consultas Arrow: simulador de cenários, clientes semelhantes e produtos "
+                   "recomendados estão disponíveis apenas com o backend pandas.")
+    else:
+        # Simulador de limiares sobre a base completa da versão carregada
+        secao_simulador(df_completo, versao_dados)
+
+        # Lista de clientes em risco - Acionável
+        if (cluster_selecionado == "Risco de Churn" or cluster_selecionado == "Todos") and "risco_churn" in df.columns:
+            secao_risco_churn(df, df_completo, versao_dados, cluster_selecionado)
+
+        # Lista de oportunidades de upsell - Acionável
+        if (cluster_selecionado == "Potencial de Upsell" or cluster_selecionado == "Todos") and "potencial_upsell" in df.columns:
+            secao_upsell(df, df_completo, versao_dados, cluster_selecionado)
 
 except Exception as e:
+    registrar_excecao(e)
     st.error(f"Erro ao construir o dashboard: {e}")
     st.info("Recarregue a página para tentar novamente ou verifique a estrutura dos dados.")
 
 # Liberar memória ao final
-gc.collect()
+with medir_etapa("gc_collect") as etapa:
+    etapa["objetos_coletados"] = gc.collect()
 
 st.markdown("---")
-st.write("Dashboard de Customer Success gerado com base nos dados de clientes TOTVS.") 
\ No newline at end of file
+st.write("Dashboard de Customer Success gerado com base nos dados de clientes TOTVS.")
+
+# Painel de debug de performance (oculto por padrão)
+if modo_debug:
+    with st.expander("🔧 Performance da execução", expanded=False):
+        registros = registros_execucao()
+        if registros:
+            df_perf = pd.DataFrame(registros)
+            colunas_perf = ["nivel", "etapa", "duracao_ms", "linhas", "cache",
+                            "pico_rss_mb", "pico_alocacao_mb", "erros"]
+            st.dataframe(df_perf[[c for c in colunas_perf if c in df_perf.columns]], use_container_width=True)
+            st.caption(f"Execução {registros[-1]['id_execucao']} - tempo total medido: "
+                       f"{df_perf.loc[df_perf['nivel'] == 0, 'duracao_ms'].sum():.0f} ms")
+        else:
+            st.info("Nenhuma etapa medida nesta execução.")
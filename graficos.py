@@ -0,0 +1,161 @@
+"""Formatação de valores e gráficos das métricas de Customer Success.
+
+Compartilhado pelo dashboard e pelos relatórios gerados em lote
+(``relatorios.py``), para que ambos exibam os mesmos cartões e gráficos.
+"""
+import pandas as pd
+
+from inicializacao import importacao_tardia
+from instrumentacao import medir_etapa
+
+# plotly.express é pesado e só é carregado quando o primeiro gráfico é montado
+px = importacao_tardia("plotly.express")
+
+
+def formatar_moeda(valor):
+    if pd.isna(valor):
+        return "R$ 0"
+    valor_int = round(valor)
+    return f"R$ {valor_int:,}".replace(',', '.')
+
+
+def formatar_numero(valor):
+    if pd.isna(valor):
+        return "0"
+    return f"{int(valor):,}".replace(',', '.')
+
+
+def formatar_percentual(valor):
+    if pd.isna(valor):
+        return "0%"
+    return f"{valor:.1f}%"
+
+
+def construir_figuras(metricas):
+    """Gráficos de segmentação, valor e satisfação a partir das métricas de ``calcular_metricas_cs``.
+
+    Retorna um dicionário com as figuras ``clusters``, ``nps``, ``ticket`` e
+    ``dist_nps`` (as três últimas só quando as métricas existem). Cada
+    figura é uma etapa própria na instrumentação.
+    """
+    figuras = {}
+    cores_cluster = {
+        "Regular": "#3498DB",
+        "Risco de Churn": "#E74C3C",
+        "Potencial de Upsell": "#2ECC71"
+    }
+
+    # Gráfico de distribuição por cluster
+    with medir_etapa("grafico_clusters"):
+        data_clusters = pd.DataFrame({
+            "Cluster": list(metricas["total_por_cluster"].keys()),
+            "Clientes": list(metricas["total_por_cluster"].values())
+        })
+
+        figuras["clusters"] = px.pie(
+            data_clusters,
+            names="Cluster",
+            values="Clientes",
+            color="Cluster",
+            color_discrete_map=cores_cluster,
+            title="Distribuição de Clientes por Cluster"
+        )
+
+        figuras["clusters"].update_traces(
+            textposition='inside',
+            textinfo='percent+label',
+            hovertemplate='%{label}<br>Clientes: %{value:,.0f}<br>Percentual: %{percent}<extra></extra>'
+        )
+
+    # Gráfico de NPS por cluster
+    if "nps_por_cluster" in metricas:
+        with medir_etapa("grafico_nps_cluster"):
+            data_nps = pd.DataFrame({
+                "Cluster": list(metricas["nps_por_cluster"].keys()),
+                "NPS Médio": list(metricas["nps_por_cluster"].values())
+            })
+
+            figuras["nps"] = px.bar(
+                data_nps,
+                x="Cluster",
+                y="NPS Médio",
+                color="Cluster",
+                color_discrete_map=cores_cluster,
+                title="NPS Médio por Cluster"
+            )
+
+            # Adicionar uma linha horizontal para o NPS médio geral
+            figuras["nps"].add_shape(
+                type="line",
+                x0=-0.5,
+                x1=2.5,
+                y0=metricas["nps_medio_geral"],
+                y1=metricas["nps_medio_geral"],
+                line=dict(color="red", width=2, dash="dash"),
+            )
+
+            # Adicionar texto para a linha
+            figuras["nps"].add_annotation(
+                x=1.5,
+                y=metricas["nps_medio_geral"] + 0.5,
+                text=f"Média Geral: {metricas['nps_medio_geral']:.1f}",
+                showarrow=False,
+                font=dict(color="red")
+            )
+
+    # Ticket médio por cluster
+    if "ticket_medio_por_cluster" in metricas:
+        with medir_etapa("grafico_ticket_cluster"):
+            data_ticket = pd.DataFrame({
+                "Cluster": list(metricas["ticket_medio_por_cluster"].keys()),
+                "Ticket Médio": list(metricas["ticket_medio_por_cluster"].values())
+            })
+
+            figuras["ticket"] = px.bar(
+                data_ticket,
+                x="Cluster",
+                y="Ticket Médio",
+                color="Cluster",
+                color_discrete_map=cores_cluster,
+                title="Ticket Médio por Cluster"
+            )
+
+            # Formatar o eixo Y para mostrar valores em reais
+            figuras["ticket"].update_layout(
+                yaxis=dict(
+                    tickprefix="R$ ",
+                    tickformat=",.0f"
+                )
+            )
+
+    # Distribuição de NPS (Detrator, Neutro, Promotor)
+    if "dist_nps" in metricas:
+        with medir_etapa("grafico_dist_nps"):
+            data_dist_nps = pd.DataFrame({
+                "Categoria": list(metricas["dist_nps"].keys()),
+                "Quantidade": list(metricas["dist_nps"].values())
+            })
+
+            # Ordenar as categorias
+            ordem_cat = ["Detrator", "Neutro", "Promotor"]
+            data_dist_nps["Categoria"] = pd.Categorical(
+                data_dist_nps["Categoria"],
+                categories=ordem_cat,
+                ordered=True
+            )
+            data_dist_nps = data_dist_nps.sort_values("Categoria")
+
+            figuras["dist_nps"] = px.bar(
+                data_dist_nps,
+                x="Categoria",
+                y="Quantidade",
+                color="Categoria",
+                color_discrete_map={
+                    "Detrator": "#E74C3C",
+                    "Neutro": "#F39C12",
+                    "Promotor": "#27AE60"
+                },
+                title="Distribuição de NPS"
+            )
+
+    return figuras
@@ -0,0 +1,217 @@
+"""Ingestão normalizada da base: contratos, pesquisas de NPS e tickets.
+
+A base unificada é uma junção em leque (fan-out): os campos do contrato se
+repetem para cada resposta de NPS (colunas ``_x``/``_y``) e cada ticket do
+cliente. Aqui cada entidade é uma fonte separada, lida em paralelo e mantida
+como uma tabela compacta com a chave ``cliente_id``. As junções acontecem só
+sobre agregados por cliente, então a memória acompanha o número real de
+contratos, respostas e tickets, e não o produto da junção.
+"""
+import concurrent.futures
+import os
+
+import numpy as np
+import pandas as pd
+
+from compressao import blocos_csv, ler_csv, localizar_arquivo
+from instrumentacao import medir_etapa
+
+DIRETORIO_FONTES = os.environ.get("DASHBOARD_FONTES", "fontes")
+ARQUIVOS_FONTES = {
+    "contratos": "contratos.csv",
+    "nps": "nps.csv",
+    "tickets": "tickets.csv",
+}
+
+# Colunas de cada entidade na base unificada (além de cliente_id)
+COLUNAS_CONTRATOS = [
+    "DS_PROD", "DS_LIN_REC", "CIDADE", "DS_CNAE", "DS_SEGMENTO", "DS_SUBSEGMENTO",
+    "FAT_FAIXA_x", "MARCA_TOTVS", "MODAL_COMERC", "PAIS", "PERIODICIDADE",
+    "SITUACAO_CONTRATO", "UF", "VL_TOTAL_CONTRATO", "DT_ASSINATURA_CONTRATO",
+    "CLIENTE_DESDE", "QTD_CONTRATACOES_12M", "VLR_CONTRATACOES_12M", "NR_PROPOSTA",
+    "ITEM_PROPOSTA", "DT_UPLOAD", "HOSPEDAGEM", "FAT_FAIXA_y", "CD_PROD", "QTD",
+    "MESES_BONIF", "VL_PCT_DESC_TEMP", "VL_PCT_DESCONTO", "PRC_UNITARIO",
+    "VL_DESCONTO_TEMPORARIO", "VL_TOTAL", "VL_FULL", "VL_DESCONTO", "MRR_12M",
+]
+COLUNAS_NPS = [
+    "respondedAt", "resposta_NPS_x", "resposta_unidade", "Nota_SupTec_Agilidade",
+    "Nota_SupTec_Atendimento", "Nota_Comercial", "Nota_Custos", "Nota_AdmFin_Atendimento",
+    "Nota_Software", "Nota_Software_Atualizacao", "Data da Resposta_x", "Nota NPS_x",
+    "Nota Agilidade", "Nota Conhecimento_x", "Nota Custo", "Nota Facilidade",
+    "Nota Flexibilidade", "Data da Resposta_y", "Nota NPS_y", "Nota Metodologia",
+    "Nota Gestao", "Nota Conhecimento_y", "Nota Qualidade", "Nota Comunicacao",
+    "Nota Prazos", "Data da Resposta", "Linha de Produto", "Nome do Produto", "Nota",
+]
+COLUNAS_TICKETS = [
+    "ticket", "resposta_NPS_y", "grupo_NPS", "Nota_ConhecimentoAgente", "Nota_Solucao",
+    "Nota_TempoRetorno", "Nota_Facilidade", "Nota_Satisfacao", "NOME_GRUPO", "TIPO_TICKET",
+    "STATUS_TICKET", "DT_CRIACAO", "DT_ATUALIZACAO", "BK_TICKET", "PRIORIDADE_TICKET",
+]
+COLUNAS_FONTES = {
+    "contratos": COLUNAS_CONTRATOS,
+    "nps": COLUNAS_NPS,
+    "tickets": COLUNAS_TICKETS,
+}
+
+
+def caminhos_fontes(diretorio=DIRETORIO_FONTES):
+    return {nome: os.path.join(diretorio, arquivo) for nome, arquivo in ARQUIVOS_FONTES.items()}
+
+
+def localizar_fontes(diretorio=DIRETORIO_FONTES):
+    """Arquivos de fontes existentes, em CSV puro ou comprimido: {nome: caminho}."""
+    encontrados = {nome: localizar_arquivo(caminho) for nome, caminho in caminhos_fontes(diretorio).items()}
+    return {nome: caminho for nome, caminho in encontrados.items() if caminho}
+
+
+def fontes_disponiveis(diretorio=DIRETORIO_FONTES):
+    """As fontes normalizadas exigem ao menos o arquivo de contratos."""
+    return "contratos" in localizar_fontes(diretorio)
+
+
+def _separar_bloco(bloco):
+    """Divide um bloco da base unificada nas três entidades (com linhas repetidas)."""
+    tabelas = {}
+    for nome, colunas in COLUNAS_FONTES.items():
+        colunas = [col for col in colunas if col in bloco.columns]
+        tabela = bloco[["cliente_id"] + colunas]
+        if nome != "contratos":
+            # Linhas sem resposta/ticket existem só por causa da junção
+            tabela = tabela.dropna(how="all", subset=colunas)
+        tabelas[nome] = tabela
+    return tabelas
+
+
+def _hash_linhas(tabela):
+    """Hash de 64 bits de cada linha pelo valor, e não pelo texto.
+
+    Os campos numéricos são comparados como números ("100" e "100.0" são o
+    mesmo valor, como na leitura com tipos do pandas); ``cliente_id`` é
+    sempre comparado como texto.
+    """
+    normalizada = {}
+    for col in tabela.columns:
+        valores = tabela[col]
+        if col != "cliente_id":
+            numeros = pd.to_numeric(valores, errors="coerce")
+            valores = numeros.astype(str).where(numeros.notna(), valores)
+        normalizada[col] = valores
+    return pd.util.hash_pandas_object(pd.DataFrame(normalizada), index=False).to_numpy()
+
+
+def separar_base_unificada(origem, destino=DIRETORIO_FONTES, tamanho_bloco=200_000):
+    """Grava contratos, NPS e tickets da base unificada como arquivos separados.
+
+    A leitura é feita em blocos (também de origens comprimidas) e cada bloco
+    é acrescentado aos arquivos assim que separado, então a memória depende
+    do tamanho do bloco e não da base. As linhas repetidas, no bloco ou entre
+    blocos, são descartadas por um hash de 64 bits de cada linha já gravada.
+    Os valores são gravados com o texto da primeira ocorrência.
+    Retorna o número de linhas gravadas por fonte.
+    """
+    os.makedirs(destino, exist_ok=True)
+    caminhos = caminhos_fontes(destino)
+    linhas = {nome: 0 for nome in COLUNAS_FONTES}
+    # Hashes ordenados das linhas já gravadas em cada fonte
+    gravadas = {nome: np.empty(0, dtype=np.uint64) for nome in COLUNAS_FONTES}
+
+    for numero, bloco in enumerate(blocos_csv(origem, linhas_por_bloco=tamanho_bloco, dtype=str)):
+        for nome, tabela in _separar_bloco(bloco).items():
+            hashes = _hash_linhas(tabela)
+            posicoes = np.searchsorted(gravadas[nome], hashes)
+            repetidas = posicoes < len(gravadas[nome])
+            repetidas[repetidas] = gravadas[nome][posicoes[repetidas]] == hashes[repetidas]
+            repetidas |= pd.Series(hashes).duplicated().to_numpy()
+            novas = tabela[~repetidas]
+            gravadas[nome] = np.union1d(gravadas[nome], hashes[~repetidas])
+
+            novas.to_csv(caminhos[nome], index=False, mode="w" if numero == 0 else "a", header=numero == 0)
+            linhas[nome] += len(novas)
+    return linhas
+
+
+def _compactar(df):
+    """Reduz a memória da tabela: float32 e categorias para textos repetitivos."""
+    for col in df.select_dtypes(include=["float64"]).columns:
+        df[col] = df[col].astype("float32")
+    for col in df.select_dtypes(include=["object"]).columns:
+        if col == "cliente_id" or df[col].nunique() < max(len(df) // 2, 100):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _ler_fonte(caminho, nrows=None):
+    return _compactar(ler_csv(caminho, nrows=nrows, dtype={"cliente_id": str}))
+
+
+def carregar_fontes(diretorio=DIRETORIO_FONTES, nrows=None):
+    """Lê as fontes disponíveis em paralelo, em um pool de threads.
+
+    ``nrows`` limita apenas os contratos, que definem o tamanho da visão
+    analítica. Retorna um dicionário {nome da fonte: DataFrame}.
+    """
+    caminhos = localizar_fontes(diretorio)
+    with medir_etapa("leitura_fontes") as etapa:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(caminhos)) as pool:
+            futuros = {
+                nome: pool.submit(_ler_fonte, caminho, nrows if nome == "contratos" else None)
+                for nome, caminho in caminhos.items()
+            }
+            fontes = {nome: futuro.result() for nome, futuro in futuros.items()}
+        for nome, tabela in fontes.items():
+            etapa[f"linhas_{nome}"] = len(tabela)
+        etapa["linhas"] = sum(len(tabela) for tabela in fontes.values())
+    return fontes
+
+
+def agregar_nps(nps):
+    """Uma linha por cliente: NPS médio, quantidade e data da última resposta."""
+    respostas = pd.DataFrame({
+        "cliente_id": nps["cliente_id"].astype(str).to_numpy(),
+        "resposta_NPS_x": pd.to_numeric(nps["resposta_NPS_x"], errors="coerce").to_numpy(),
+        "respondedAt": pd.to_datetime(nps["respondedAt"], errors="coerce").to_numpy(),
+    })
+    return respostas.groupby("cliente_id").agg(
+        resposta_NPS_x=("resposta_NPS_x", "mean"),
+        qtd_respostas_nps=("resposta_NPS_x", "count"),
+        ultima_resposta_nps=("respondedAt", "max"),
+    )
+
+
+def agregar_tickets(tickets):
+    """Uma linha por cliente: quantidade de tickets, abertos, último ticket e satisfação."""
+    status = tickets["STATUS_TICKET"].astype(str).str.lower()
+    chamados = pd.DataFrame({
+        "cliente_id": tickets["cliente_id"].astype(str).to_numpy(),
+        "aberto": (~status.isin(["closed", "solved", "nan"])).to_numpy(),
+        "DT_CRIACAO": pd.to_datetime(tickets["DT_CRIACAO"], errors="coerce").to_numpy(),
+        "resposta_NPS_y": pd.to_numeric(tickets["resposta_NPS_y"], errors="coerce").to_numpy(),
+    })
+    return chamados.groupby("cliente_id").agg(
+        qtd_tickets=("aberto", "size"),
+        tickets_abertos=("aberto", "sum"),
+        ultimo_ticket=("DT_CRIACAO", "max"),
+        satisfacao_tickets=("resposta_NPS_y", "mean"),
+    )
+
+
+def montar_visao_clientes(fontes):
+    """Contratos enriquecidos apenas com os agregados por cliente de NPS e tickets.
+
+    As junções são muitos-para-um, então a visão tem o mesmo número de linhas
+    que a tabela de contratos. Elas acontecem uma vez, na carga, e não em
+    cada visão do dashboard: a segmentação de ``processar_base`` usa o NPS
+    médio do cliente, então os agregados precisam estar na base antes dela.
+    """
+    with medir_etapa("juncao_agregados", linhas=len(fontes["contratos"])):
+        contratos = fontes["contratos"]
+        chave = contratos["cliente_id"].astype(str)
+        agregados = []
+        if "nps" in fontes:
+            agregados.append(agregar_nps(fontes["nps"]))
+        if "tickets" in fontes:
+            agregados.append(agregar_tickets(fontes["tickets"]))
+        # Cada agregado tem uma linha por cliente: o reindex alinha sem multiplicar linhas
+        alinhados = [agregado.reindex(chave).set_axis(contratos.index) for agregado in agregados]
+        visao = pd.concat([contratos] + alinhados, axis=1)
+    return visao
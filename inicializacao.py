@@ -0,0 +1,110 @@
+"""Inicialização rápida do processo do dashboard.
+
+Reúne o que só precisa acontecer uma vez por processo (locale, importações
+pesadas) e o pré-aquecimento usado pelo launcher: os módulos pesados são
+carregados e a primeira página do dashboard é renderizada uma vez, sem
+servidor, antes de o servidor aceitar conexões, dentro de um orçamento de
+tempo mensurável.
+"""
+import functools
+import importlib
+import importlib.util
+import locale
+import os
+import sys
+import time
+
+from instrumentacao import medir_etapa
+
+# Orçamento de tempo (em segundos) para o processo ficar pronto para receber acessos
+ORCAMENTO_INICIALIZACAO_S = float(os.environ.get("DASHBOARD_ORCAMENTO_INICIALIZACAO_S", "10"))
+
+# Módulos pesados carregados no pré-aquecimento para que a primeira sessão não pague por eles
+MODULOS_PESADOS = ["pandas", "numpy", "plotly.express"]
+
+SCRIPT_DASHBOARD = "dashboard_cliente_success.py"
+
+# Tempo máximo (em segundos) da renderização de pré-aquecimento
+TIMEOUT_RENDERIZACAO_S = 600
+
+
+@functools.lru_cache(maxsize=None)
+def configurar_locale():
+    """Configura o locale pt-BR uma única vez por processo, com fallbacks."""
+    for nome in ('pt_BR.UTF-8', 'Portuguese_Brazil.1252', ''):
+        try:
+            return locale.setlocale(locale.LC_ALL, nome)
+        except locale.Error:
+            continue
+    return None
+
+
+def importacao_tardia(nome):
+    """Retorna o módulo ``nome`` sem executá-lo até o primeiro acesso a um atributo."""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    spec = importlib.util.find_spec(nome)
+    if spec is None:
+        raise ImportError(f"Módulo não encontrado: {nome}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nome] = modulo
+    loader.exec_module(modulo)
+    return modulo
+
+
+def renderizar_pagina(script=SCRIPT_DASHBOARD):
+    """Executa o script do dashboard uma vez no processo atual, sem servidor.
+
+    Os caches do Streamlit (``st.cache_data``/``st.cache_resource``) são do
+    processo, então a renderização deixa prontos exatamente os dados que a
+    primeira sessão vai pedir: a base ou as partições conforme o backend
+    ativo, as métricas, os gráficos, o snapshot da segmentação, o histograma
+    do simulador, as árvores de clientes semelhantes e o modelo de
+    recomendações. Retorna as mensagens das exceções levantadas pelo script.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(script, default_timeout=TIMEOUT_RENDERIZACAO_S)
+    app.run()
+    return [str(excecao.value) for excecao in app.exception]
+
+
+def preaquecer(nrows=10000, inicio=None, script=SCRIPT_DASHBOARD):
+    """Importa os módulos pesados e renderiza a primeira página do dashboard no processo atual.
+
+    ``inicio`` é o ``time.perf_counter()`` do começo do processo; o tempo
+    total é comparado com ``ORCAMENTO_INICIALIZACAO_S``. Se a renderização
+    falhar, ao menos a base processada (``nrows`` linhas) fica carregada.
+    Retorna um dicionário com a duração de cada fase, os erros da
+    renderização e se o orçamento foi respeitado.
+    """
+    inicio = time.perf_counter() if inicio is None else inicio
+    resultado = {}
+
+    with medir_etapa("preaquecimento_importacoes"):
+        for nome in MODULOS_PESADOS:
+            # O acesso a um atributo força a carga caso o módulo tenha sido registrado como tardio
+            getattr(importlib.import_module(nome), "__file__", None)
+    resultado["importacoes_s"] = time.perf_counter() - inicio
+
+    with medir_etapa("preaquecimento_pagina") as etapa:
+        try:
+            resultado["erros"] = renderizar_pagina(script)
+        except Exception as e:
+            resultado["erros"] = [f"{type(e).__name__}: {e}"]
+        etapa["erros"].extend(resultado["erros"])
+        if resultado["erros"]:
+            # Importado aqui para que este módulo não carregue pandas ao ser importado
+            from dados import carregar_base
+
+            carregar_base(nrows)
+    resultado["pagina_s"] = time.perf_counter() - inicio - resultado["importacoes_s"]
+
+    configurar_locale()
+
+    resultado["total_s"] = time.perf_counter() - inicio
+    resultado["orcamento_s"] = ORCAMENTO_INICIALIZACAO_S
+    resultado["dentro_orcamento"] = resultado["total_s"] <= ORCAMENTO_INICIALIZACAO_S
+    return resultado
@@ -0,0 +1,168 @@
+"""Instrumentação das etapas do pipeline do dashboard.
+
+Cada etapa medida registra tempo de execução, linhas processadas, pico de
+memória (RSS do processo e, quando o tracemalloc está ativo, alocações
+Python) e se a chamada foi servida do cache. Os registros ficam disponíveis
+para o painel de debug da execução atual e são gravados em um log JSON
+(uma linha por etapa) para diagnóstico em produção.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows não possui o módulo resource
+    resource = None
+
+# Caminho do log estruturado; uma string vazia desativa a gravação em arquivo
+ARQUIVO_LOG = os.environ.get("DASHBOARD_LOG_PERFORMANCE", "logs/pipeline_performance.jsonl")
+
+# O Streamlit executa cada sessão em sua própria thread, então o estado da
+# execução atual é mantido por thread
+_estado = threading.local()
+
+_logger = logging.getLogger("dashboard.performance")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+
+def _configurar_log():
+    """Adiciona o handler de arquivo ao logger apenas uma vez por processo."""
+    if _logger.handlers or not ARQUIVO_LOG:
+        return
+    try:
+        pasta = os.path.dirname(ARQUIVO_LOG)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        handler = logging.FileHandler(ARQUIVO_LOG, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+    except OSError:
+        # Sem permissão de escrita: mantém apenas os registros em memória
+        _logger.addHandler(logging.NullHandler())
+
+
+def _pico_rss_mb():
+    """Pico de memória residente do processo em MB (None se indisponível)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KB e macOS em bytes
+    if sys.platform == "darwin":
+        return round(pico / (1024 * 1024), 2)
+    return round(pico / 1024, 2)
+
+
+def _pilha():
+    if not hasattr(_estado, "pilha"):
+        _estado.pilha = []
+    return _estado.pilha
+
+
+def iniciar_execucao(rastrear_alocacoes=False, escopo="pagina"):
+    """Inicia uma nova execução do script, descartando os registros anteriores.
+
+    ``escopo`` identifica o que está sendo executado: a página inteira ou,
+    nas reexecuções parciais, o nome do fragmento.
+
+    Com ``rastrear_alocacoes`` o tracemalloc é ligado para medir o pico de
+    alocações de cada etapa (tem custo, por isso fica restrito ao modo debug).
+    O tracemalloc é global ao processo e não é desligado aqui para não afetar
+    outras sessões em modo debug.
+    """
+    _estado.id_execucao = uuid.uuid4().hex[:12]
+    _estado.escopo = escopo
+    _estado.registros = []
+    _estado.pilha = []
+    _estado.cache_miss = set()
+    if rastrear_alocacoes and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _configurar_log()
+
+
+def registros_execucao():
+    """Retorna os registros das etapas medidas na execução atual."""
+    return list(getattr(_estado, "registros", []))
+
+
+def marcar_cache_miss(nome):
+    """Chamado dentro do corpo de uma função cacheada: indica que ela executou."""
+    if not hasattr(_estado, "cache_miss"):
+        _estado.cache_miss = set()
+    _estado.cache_miss.add(nome)
+
+
+def status_cache(nome):
+    """Retorna 'miss' se o corpo da função cacheada executou, senão 'hit'."""
+    misses = getattr(_estado, "cache_miss", set())
+    if nome in misses:
+        misses.discard(nome)
+        return "miss"
+    return "hit"
+
+
+def registrar_excecao(erro):
+    """Anota uma exceção tratada na etapa em andamento, sem interromper o fluxo."""
+    pilha = _pilha()
+    if pilha:
+        pilha[-1]["erros"].append(f"{type(erro).__name__}: {erro}")
+
+
+@contextlib.contextmanager
+def medir_etapa(nome, linhas=None, cache=None):
+    """Mede uma etapa do pipeline.
+
+    O dicionário retornado pode ser atualizado dentro do bloco, por exemplo
+    com ``etapa["linhas"] = len(df)`` ou ``etapa["cache"] = "hit"``.
+    """
+    pilha = _pilha()
+    etapa = {
+        "etapa": nome,
+        "linhas": linhas,
+        "cache": cache,
+        "erros": [],
+        "_pico_alocacao": 0,
+    }
+    alocacao_antes = None
+    if tracemalloc.is_tracing():
+        alocacao_antes, pico_anterior = tracemalloc.get_traced_memory()
+        # Guarda o pico acumulado até aqui na etapa pai antes de zerá-lo
+        if pilha:
+            pilha[-1]["_pico_alocacao"] = max(pilha[-1]["_pico_alocacao"], pico_anterior)
+        tracemalloc.reset_peak()
+    pilha.append(etapa)
+    inicio = time.perf_counter()
+    try:
+        yield etapa
+    except Exception as e:
+        etapa["erros"].append(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        etapa["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+        etapa["pico_rss_mb"] = _pico_rss_mb()
+        etapa["pico_alocacao_mb"] = None
+        if alocacao_antes is not None and tracemalloc.is_tracing():
+            pico = max(tracemalloc.get_traced_memory()[1], etapa["_pico_alocacao"])
+            etapa["pico_alocacao_mb"] = round(max(pico - alocacao_antes, 0) / (1024 * 1024), 2)
+            # O pico da etapa filha também conta para a etapa pai
+            if len(pilha) > 1:
+                pilha[-2]["_pico_alocacao"] = max(pilha[-2]["_pico_alocacao"], pico)
+        pilha.pop()
+        del etapa["_pico_alocacao"]
+        etapa["nivel"] = len(pilha)
+        etapa["id_execucao"] = getattr(_estado, "id_execucao", None)
+        etapa["escopo"] = getattr(_estado, "escopo", None)
+        etapa["timestamp"] = datetime.datetime.now().isoformat(timespec="milliseconds")
+        if not hasattr(_estado, "registros"):
+            _estado.registros = []
+        _estado.registros.append(etapa)
+        _configurar_log()
+        _logger.info(json.dumps(etapa, ensure_ascii=False, default=str))
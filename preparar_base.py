@@ -0,0 +1,89 @@
+"""Prepara a base completa em Parquet particionado por mês, UF e segmento.
+
+Uso:
+    python preparar_base.py [--origem ARQUIVO.csv] [--destino DIRETORIO]
+    python preparar_base.py --separar-fontes [DIRETORIO] [--origem ARQUIVO.csv]
+
+O dashboard passa a ler somente as partições exigidas pelos filtros de UF,
+segmento e janela de meses, em vez do histórico inteiro.
+
+A origem é lida e processada inteira na memória antes de ser particionada:
+``processar_base`` preenche nulos com médias e modas e segmenta por quantis
+calculados sobre a base toda, então processá-la em blocos mudaria a
+segmentação. A base precisa caber na memória da máquina que executa este
+script (o dashboard, depois, lê só as partições).
+
+Com ``--separar-fontes`` a base unificada é dividida em contratos, respostas
+de NPS e tickets (ver ``ingestao.py``), que o dashboard passa a ler no lugar
+da junção desnormalizada.
+"""
+import argparse
+import os
+import sys
+import time
+
+from compressao import localizar_arquivo
+from dados import ARQUIVOS_AMOSTRA, DIRETORIO_PARTICIONADO
+from ingestao import DIRETORIO_FONTES
+
+
+def find_source_file():
+    """Return the most complete data file available (the full base first)."""
+    for arquivo in reversed(ARQUIVOS_AMOSTRA):
+        arquivo = localizar_arquivo(arquivo)
+        if arquivo:
+            return arquivo
+    return None
+
+
+def separar_fontes(origem, destino):
+    """Split the unified base into one CSV per entity."""
+    from ingestao import caminhos_fontes, separar_base_unificada
+
+    inicio = time.perf_counter()
+    print(f"Splitting {origem} ({os.path.getsize(origem) / (1024 * 1024):.2f} MB) into {destino}...")
+    linhas = separar_base_unificada(origem, destino)
+    for nome, caminho in caminhos_fontes(destino).items():
+        print(f"  {nome}: {linhas[nome]} rows ({os.path.getsize(caminho) / (1024 * 1024):.2f} MB)")
+    print(f"Done ({time.perf_counter() - inicio:.2f}s).")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the cleaned base as a partitioned Parquet dataset.")
+    parser.add_argument("--origem", help="CSV file to process, optionally .gz/.zst/.bz2 "
+                                         "(default: the largest available base)")
+    parser.add_argument("--destino", default=DIRETORIO_PARTICIONADO,
+                        help=f"Output directory (default: {DIRETORIO_PARTICIONADO})")
+    parser.add_argument("--separar-fontes", nargs="?", const=DIRETORIO_FONTES, metavar="DIRETORIO",
+                        help=f"Split the unified base into contracts, NPS and tickets CSVs "
+                             f"(default directory: {DIRETORIO_FONTES})")
+    args = parser.parse_args(argv)
+
+    origem = args.origem or find_source_file()
+    if not origem or not os.path.exists(origem):
+        print("No data files found. Please run gerar_amostra.py or dividir_amostra.py first.")
+        return 1
+
+    if args.separar_fontes:
+        return separar_fontes(origem, args.separar_fontes)
+
+    from compressao import ler_csv
+    from dados import gravar_base_particionada, metadados_origem, processar_base
+
+    inicio = time.perf_counter()
+    print(f"Reading {origem} ({os.path.getsize(origem) / (1024 * 1024):.2f} MB)...")
+    df = ler_csv(origem)
+
+    print(f"Processing {len(df)} rows...")
+    df = processar_base(df)
+
+    print(f"Writing partitioned dataset to {args.destino}...")
+    arquivos = gravar_base_particionada(df, args.destino, metadados_origem(origem, None))
+
+    print(f"Done: {len(df)} rows in {arquivos} files ({time.perf_counter() - inicio:.2f}s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Recomendação de próximos produtos (next-best-product) para upsell.
+
+A partir dos itens de proposta da base (uma linha por produto contratado),
+monta uma matriz esparsa cliente x produto e, a partir dela, a matriz de
+afinidade produto x produto (coocorrência normalizada pelo cosseno, mantendo
+apenas os vizinhos mais próximos de cada produto). A pontuação de todos os
+candidatos é feita em lote, com multiplicações de matrizes esparsas, e só os
+k melhores produtos de cada cliente são mantidos.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentacao import medir_etapa
+
+# DS_PROD identifica o produto: CD_PROD vem vazio em boa parte dos itens
+COLUNA_PRODUTO = "DS_PROD"
+
+# Vizinhos mantidos por produto na matriz de afinidade: mantém a matriz
+# esparsa mesmo em catálogos grandes, em que quase todo par coocorre
+VIZINHOS_POR_PRODUTO = 50
+
+# Clientes pontuados por vez: limita a memória do produto esparso do lote
+TAMANHO_LOTE = 20000
+
+
+def _maiores_por_linha(matriz, k):
+    """Linhas, colunas e valores dos k maiores elementos de cada linha de uma matriz CSR."""
+    linhas = np.repeat(np.arange(matriz.shape[0]), np.diff(matriz.indptr))
+    # Ordena por linha e, dentro da linha, por valor decrescente
+    ordem = np.lexsort((-matriz.data, linhas))
+    posicao_na_linha = np.arange(len(ordem)) - matriz.indptr[linhas[ordem]]
+    manter = ordem[posicao_na_linha < k]
+    return linhas[manter], matriz.indices[manter], matriz.data[manter]
+
+
+def construir_modelo_produtos(df, coluna_produto=COLUNA_PRODUTO):
+    """Monta as matrizes cliente x produto e produto x produto a partir da base.
+
+    Retorna None se a base não tiver as colunas de cliente e produto.
+    """
+    if "cliente_id" not in df.columns or coluna_produto not in df.columns:
+        return None
+
+    # scipy só é carregado quando o modelo é construído
+    from scipy import sparse
+
+    with medir_etapa("modelo_produtos", linhas=len(df)) as etapa:
+        itens = df[["cliente_id", coluna_produto]].dropna()
+        codigos_clientes, clientes = pd.factorize(itens["cliente_id"])
+        codigos_produtos, produtos = pd.factorize(itens[coluna_produto])
+
+        # Posse binária: vários itens do mesmo produto contam uma única vez
+        posse = sparse.csr_matrix(
+            (np.ones(len(itens), dtype=np.float32), (codigos_clientes, codigos_produtos)),
+            shape=(len(clientes), len(produtos)),
+        )
+        posse.sum_duplicates()
+        posse.data[:] = 1.0
+
+        # Coocorrência normalizada pelo cosseno, sem a diagonal (produto com ele mesmo)
+        coocorrencia = (posse.T @ posse).tocsr()
+        popularidade = np.sqrt(coocorrencia.diagonal())
+        popularidade[popularidade == 0] = 1.0
+        normalizacao = sparse.diags((1.0 / popularidade).astype(np.float32))
+        afinidade = (normalizacao @ coocorrencia @ normalizacao).tolil()
+        afinidade.setdiag(0)
+        afinidade = afinidade.tocsr()
+        afinidade.eliminate_zeros()
+        linhas, colunas, valores = _maiores_por_linha(afinidade, VIZINHOS_POR_PRODUTO)
+        afinidade = sparse.csr_matrix((valores, (linhas, colunas)), shape=afinidade.shape)
+
+        etapa["clientes"] = len(clientes)
+        etapa["produtos"] = len(produtos)
+        etapa["pares_afinidade"] = afinidade.nnz
+
+    return {
+        "clientes": pd.Index(np.asarray(clientes)),
+        "produtos": pd.Index(produtos).astype(str),
+        "posse": posse,
+        "afinidade": afinidade,
+    }
+
+
+def recomendar_produtos(modelo, clientes_ids, k=3):
+    """Pontua os próximos produtos para uma lista de clientes em uma só passada.
+
+    Retorna um DataFrame com ``cliente_id``, ``ranking``, ``produto`` e
+    ``score``, com até ``k`` produtos (ainda não contratados) por cliente.
+    """
+    colunas = ["cliente_id", "ranking", "produto", "score"]
+    if modelo is None or len(clientes_ids) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    posicoes = modelo["clientes"].get_indexer(pd.Index(clientes_ids).unique())
+    posicoes = posicoes[posicoes >= 0]
+    n_produtos = len(modelo["produtos"])
+    k = min(k, n_produtos)
+    if len(posicoes) == 0 or k == 0:
+        return pd.DataFrame(columns=colunas)
+
+    resultados = []
+    with medir_etapa("recomendacao_produtos", linhas=len(posicoes)):
+        for inicio in range(0, len(posicoes), TAMANHO_LOTE):
+            lote = posicoes[inicio:inicio + TAMANHO_LOTE]
+            posse = modelo["posse"][lote]
+            scores = (posse @ modelo["afinidade"]).tocsr()
+            # Produtos já contratados não são recomendados
+            scores = (scores - scores.multiply(posse)).tocsr()
+            scores.eliminate_zeros()
+
+            linhas, colunas, valores = _maiores_por_linha(scores, k)
+            # As linhas já saem ordenadas por score decrescente dentro de cada cliente
+            ranking = np.arange(len(linhas)) - np.searchsorted(linhas, linhas)
+            resultados.append(pd.DataFrame({
+                "cliente_id": modelo["clientes"][lote[linhas]].to_numpy(),
+                "ranking": ranking + 1,
+                "produto": modelo["produtos"][colunas].to_numpy(),
+                "score": valores,
+            }))
+
+    recomendacoes = pd.concat(resultados, ignore_index=True)
+    return recomendacoes[recomendacoes["score"] > 0].reset_index(drop=True)
+
+
+def resumir_recomendacoes(recomendacoes):
+    """Uma linha por cliente com os produtos recomendados em ordem de ranking."""
+    if recomendacoes.empty:
+        return pd.Series(dtype=object, name="produtos_recomendados")
+    return (recomendacoes.sort_values(["cliente_id", "ranking"])
+            .groupby("cliente_id", sort=False)["produto"]
+            .agg(" | ".join)
+            .rename("produtos_recomendados"))
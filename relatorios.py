@@ -0,0 +1,314 @@
+"""Gera relatórios estáticos de KPIs por segmento e por UF, em paralelo.
+
+Uso:
+    python relatorios.py [--dimensoes segmento uf segmento_uf] [--destino DIRETORIO]
+                         [--processos N] [--nrows N]
+
+Cada relatório é uma página HTML com os mesmos cartões e gráficos do
+dashboard (clientes ativos, taxa de churn, NPS médio, ticket médio e
+distribuição por cluster), calculados com ``calcular_metricas_cs``. Um índice
+(``index.html``) e um resumo com os KPIs de todos os relatórios
+(``resumo_kpis.csv`` e, com openpyxl ou xlsxwriter instalado,
+``resumo_kpis.xlsx``) acompanham as páginas.
+
+A base é lida e preparada uma única vez: as colunas usadas pelas métricas
+são gravadas em um arquivo Arrow ordenado por segmento e UF, com textos já
+convertidos em categorias e datas já interpretadas. Cada relatório é uma
+faixa de linhas desse arquivo, que os processos do pool mapeiam em memória
+sem copiar a base.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
+import html
+import importlib.util
+import os
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from graficos import construir_figuras, formatar_moeda, formatar_numero, formatar_percentual
+from instrumentacao import medir_etapa, registrar_excecao
+from metricas import calcular_metricas_cs
+
+DIRETORIO_RELATORIOS = os.environ.get("DASHBOARD_RELATORIOS", "relatorios")
+
+# Colunas lidas por calcular_metricas_cs
+COLUNAS_METRICAS = [
+    "cliente_id", "SITUACAO_CONTRATO", "DT_ASSINATURA_CONTRATO", "cluster", "resposta_NPS_x",
+    "categoria_nps", "VL_TOTAL_CONTRATO_NUM", "risco_churn", "potencial_upsell", "ticket", "DT_CRIACAO",
+]
+
+# Dimensões dos relatórios: nome -> colunas da base
+DIMENSOES = {
+    "segmento": ["DS_SEGMENTO"],
+    "uf": ["UF"],
+    "segmento_uf": ["DS_SEGMENTO", "UF"],
+}
+
+# Base preparada, mapeada uma vez em cada processo do pool
+_base_processo = None
+
+
+def preparar_base_relatorios(df, caminho):
+    """Grava a base enxuta dos relatórios e retorna as faixas de linhas de cada par segmento/UF.
+
+    Retorna um dicionário {(segmento, uf): (inicio, fim)}, com as linhas
+    ordenadas por segmento e UF.
+    """
+    with medir_etapa("base_relatorios", linhas=len(df)) as etapa:
+        codigos_segmento, segmentos = pd.factorize(df["DS_SEGMENTO"].astype(str), sort=True)
+        codigos_uf, ufs = pd.factorize(df["UF"].astype(str), sort=True)
+        pares = codigos_segmento.astype(np.int64) * len(ufs) + codigos_uf
+        ordem = np.argsort(pares, kind="stable")
+
+        colunas = [col for col in COLUNAS_METRICAS if col in df.columns]
+        base = df[colunas].iloc[ordem].reset_index(drop=True)
+        # Conversões feitas uma única vez, e não em cada relatório
+        for col in ["cliente_id", "SITUACAO_CONTRATO"]:
+            if col in base.columns and not isinstance(base[col].dtype, pd.CategoricalDtype):
+                base[col] = base[col].astype("category")
+        if "DT_CRIACAO" in base.columns:
+            base["DT_CRIACAO"] = pd.to_datetime(base["DT_CRIACAO"], errors="coerce")
+        # Sem compressão, para que os processos mapeiem o arquivo sem cópia
+        feather.write_feather(base, caminho, compression="uncompressed")
+
+        pares_ordenados = pares[ordem]
+        valores, inicios = np.unique(pares_ordenados, return_index=True)
+        fins = np.append(inicios[1:], len(pares_ordenados))
+        faixas = {
+            (segmentos[valor // len(ufs)], ufs[valor % len(ufs)]): (int(inicio), int(fim))
+            for valor, inicio, fim in zip(valores, inicios, fins)
+        }
+        etapa["pares"] = len(faixas)
+    return faixas
+
+
+def nome_arquivo(dimensao, valores):
+    """Nome do arquivo HTML do relatório, distinto para cada combinação de valores.
+
+    Quando a troca de acentos, espaços e barras altera o texto, um trecho do
+    hash do texto original é acrescentado: "São Paulo" e "S-o Paulo" não
+    podem gravar a mesma página.
+    """
+    texto = "_".join([dimensao] + [str(valor) for valor in valores])
+    nome = re.sub(r"[^0-9A-Za-z_-]+", "-", texto).strip("-")
+    if nome != texto:
+        nome += "-" + hashlib.sha1(texto.encode("utf-8")).hexdigest()[:8]
+    return nome + ".html"
+
+
+def tarefas_relatorios(faixas, dimensoes):
+    """Um relatório por valor de cada dimensão, com as faixas de linhas que o compõem."""
+    tarefas = []
+    for dimensao in dimensoes:
+        colunas = DIMENSOES[dimensao]
+        grupos = {}
+        for (segmento, uf), faixa in faixas.items():
+            valores = {"DS_SEGMENTO": segmento, "UF": uf}
+            chave = tuple(valores[col] for col in colunas)
+            grupos.setdefault(chave, []).append(faixa)
+        for chave, faixas_grupo in sorted(grupos.items()):
+            tarefas.append({
+                "dimensao": dimensao,
+                "valor": " / ".join(chave),
+                "arquivo": nome_arquivo(dimensao, chave),
+                "faixas": faixas_grupo,
+            })
+    return tarefas
+
+
+def _iniciar_processo(caminho):
+    global _base_processo
+    _base_processo = feather.read_table(caminho, memory_map=True)
+
+
+def _fatia(faixas):
+    partes = [_base_processo.slice(inicio, fim - inicio) for inicio, fim in faixas]
+    return pa.concat_tables(partes).to_pandas()
+
+
+def renderizar_html(titulo, metricas, figuras):
+    """Página estática com os cartões de KPIs e os gráficos do dashboard."""
+    cartoes = [
+        ("Total de Clientes Ativos", formatar_numero(metricas.get("clientes_ativos", 0))),
+        ("Taxa de Churn (12M)", formatar_percentual(metricas.get("taxa_churn", 0))),
+        ("NPS Médio", f"{metricas.get('nps_medio_geral', 0):.1f}"),
+        ("Ticket Médio", formatar_moeda(metricas.get("ticket_medio_geral", 0))),
+        ("Clientes em Risco de Churn", formatar_numero(metricas.get("num_clientes_risco_churn", 0))),
+        ("Oportunidades de Upsell", formatar_numero(metricas.get("num_clientes_upsell", 0))),
+    ]
+    html_cartoes = "\n".join(
+        f"<div class='cartao'><div class='rotulo'>{rotulo}</div><div class='valor'>{valor}</div></div>"
+        for rotulo, valor in cartoes
+    )
+    html_graficos = "\n".join(
+        f"<div class='grafico'>{figura.to_html(full_html=False, include_plotlyjs=False)}</div>"
+        for figura in figuras.values()
+    )
+    erro = f"<p class='erro'>Erro ao calcular métricas: {html.escape(metricas['erro'])}</p>" if "erro" in metricas else ""
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(titulo)}</title>
+<script src="plotly.min.js"></script>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #2C3E50; }}
+h1 {{ color: #2E86C1; text-align: center; }}
+h2, .gerado {{ text-align: center; color: #7F8C8D; }}
+.cartoes {{ display: flex; flex-wrap: wrap; gap: 1em; justify-content: center; margin: 2em 0; }}
+.cartao {{ border: 1px solid #D5D8DC; border-radius: 8px; padding: 1em 1.5em; min-width: 12em; }}
+.rotulo {{ font-size: 0.9em; color: #7F8C8D; }}
+.valor {{ font-size: 1.8em; }}
+.graficos {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(480px, 1fr)); gap: 1em; }}
+.erro {{ color: #E74C3C; }}
+</style>
+</head>
+<body>
+<h1>Dashboard de Customer Success</h1>
+<h2>{html.escape(titulo)}</h2>
+<p class="gerado">Gerado em {datetime.datetime.now():%d/%m/%Y %H:%M}</p>
+{erro}
+<div class="cartoes">
+{html_cartoes}
+</div>
+<div class="graficos">
+{html_graficos}
+</div>
+</body>
+</html>
+"""
+
+
+def gerar_relatorio(tarefa, destino):
+    """Calcula as métricas da fatia da tarefa e grava a página HTML. Retorna a linha do resumo."""
+    df = _fatia(tarefa["faixas"])
+    metricas = calcular_metricas_cs(df)
+    titulo = f"{tarefa['dimensao'].replace('_', ' / ').upper()}: {tarefa['valor']}"
+    try:
+        pagina = renderizar_html(titulo, metricas, construir_figuras(metricas))
+    except Exception as e:
+        registrar_excecao(e)
+        metricas.setdefault("erro", str(e))
+        pagina = renderizar_html(titulo, metricas, {})
+    with open(os.path.join(destino, tarefa["arquivo"]), "w", encoding="utf-8") as f:
+        f.write(pagina)
+
+    resumo = {
+        "dimensao": tarefa["dimensao"],
+        "valor": tarefa["valor"],
+        "arquivo": tarefa["arquivo"],
+        "registros": len(df),
+    }
+    for chave in ["total_clientes", "clientes_ativos", "taxa_churn", "nps_medio_geral", "ticket_medio_geral",
+                  "num_clientes_risco_churn", "num_clientes_upsell"]:
+        resumo[chave] = metricas.get(chave)
+    for cluster in ["Regular", "Risco de Churn", "Potencial de Upsell"]:
+        resumo[f"clientes_{cluster}"] = metricas.get("total_por_cluster", {}).get(cluster, 0)
+    resumo["erro"] = metricas.get("erro", "")
+    return resumo
+
+
+def motor_excel():
+    """Motor disponível para gravar .xlsx pelo pandas, ou None."""
+    for motor in ["openpyxl", "xlsxwriter"]:
+        if importlib.util.find_spec(motor) is not None:
+            return motor
+    return None
+
+
+def gravar_resumo(resumo, destino):
+    """Grava o índice HTML e o resumo dos KPIs (CSV e, se possível, Excel). Retorna os arquivos gravados."""
+    arquivos = [os.path.join(destino, "resumo_kpis.csv")]
+    resumo.to_csv(arquivos[0], index=False)
+
+    motor = motor_excel()
+    if motor:
+        arquivos.append(os.path.join(destino, "resumo_kpis.xlsx"))
+        with pd.ExcelWriter(arquivos[-1], engine=motor) as planilha:
+            for dimensao, parte in resumo.groupby("dimensao", sort=False):
+                parte.drop(columns=["dimensao", "arquivo"]).to_excel(planilha, sheet_name=dimensao[:31], index=False)
+
+    indice = resumo.assign(valor=[
+        f"<a href='{html.escape(arquivo)}'>{html.escape(valor)}</a>"
+        for arquivo, valor in zip(resumo["arquivo"], resumo["valor"])
+    ]).drop(columns="arquivo")
+    arquivos.append(os.path.join(destino, "index.html"))
+    with open(arquivos[-1], "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html>\n<html lang='pt-BR'><head><meta charset='utf-8'>"
+                "<title>Relatórios de Customer Success</title></head><body>\n"
+                "<h1>Relatórios de Customer Success</h1>\n")
+        f.write(indice.to_html(index=False, escape=False, float_format=lambda valor: f"{valor:.2f}"))
+        f.write("\n</body></html>\n")
+    return arquivos
+
+
+def carregar_base_relatorios(nrows=None):
+    """Base processada completa: a particionada, se existir, ou a mesma base do dashboard."""
+    from dados import base_particionada_disponivel, carregar_base, carregar_particoes
+
+    if base_particionada_disponivel() and nrows is None:
+        return carregar_particoes()
+    return carregar_base(nrows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render static KPI reports per segment and UF in parallel.")
+    parser.add_argument("--dimensoes", nargs="+", choices=list(DIMENSOES), default=["segmento", "uf"],
+                        help="Report dimensions (default: segmento uf)")
+    parser.add_argument("--destino", default=DIRETORIO_RELATORIOS,
+                        help=f"Output directory (default: {DIRETORIO_RELATORIOS})")
+    parser.add_argument("--processos", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--nrows", type=int, help="Read only the first N rows of the base")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    df = carregar_base_relatorios(args.nrows)
+    if df is None or df.empty:
+        print("No data files found. Please run gerar_amostra.py or dividir_amostra.py first.")
+        return 1
+    if "DS_SEGMENTO" not in df.columns or "UF" not in df.columns:
+        print("The base has no DS_SEGMENTO/UF columns; nothing to report.")
+        return 1
+    print(f"Loaded {len(df)} rows ({time.perf_counter() - inicio:.2f}s).")
+
+    os.makedirs(args.destino, exist_ok=True)
+    # plotly.js é gravado uma vez e referenciado por todas as páginas
+    from plotly.offline import get_plotlyjs
+    with open(os.path.join(args.destino, "plotly.min.js"), "w", encoding="utf-8") as f:
+        f.write(get_plotlyjs())
+
+    with tempfile.TemporaryDirectory() as temporario:
+        caminho_base = os.path.join(temporario, "base_relatorios.arrow")
+        faixas = preparar_base_relatorios(df, caminho_base)
+        del df
+        tarefas = tarefas_relatorios(faixas, args.dimensoes)
+        print(f"Rendering {len(tarefas)} reports with {args.processos} processes...")
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.processos, initializer=_iniciar_processo,
+                                                    initargs=(caminho_base,)) as pool:
+            futuros = [pool.submit(gerar_relatorio, tarefa, args.destino) for tarefa in tarefas]
+            linhas = [futuro.result() for futuro in futuros]
+
+    resumo = pd.DataFrame(linhas)
+    arquivos = gravar_resumo(resumo, args.destino)
+    if motor_excel() is None:
+        print("Excel summary skipped: install openpyxl to also write resumo_kpis.xlsx.")
+    com_erro = int((resumo["erro"] != "").sum())
+    print(f"Wrote {len(tarefas)} reports and {', '.join(os.path.basename(a) for a in arquivos)} "
+          f"to {args.destino} ({time.perf_counter() - inicio:.2f}s)"
+          + (f"; {com_erro} reports had errors." if com_erro else "."))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
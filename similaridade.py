@@ -0,0 +1,158 @@
+"""Busca de clientes semelhantes com índices de vizinhos mais próximos.
+
+Cada cliente vira um vetor normalizado (valor do contrato em escala log,
+tempo de casa e NPS médio). Clientes do mesmo ``DS_SUBSEGMENTO`` e
+``FAT_FAIXA_x`` ficam em um KD-tree próprio, construído uma vez por versão
+da base; quando o grupo tem menos de k outros clientes, a busca é completada
+com um KD-tree global. As consultas não varrem a base inteira.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentacao import medir_etapa
+from metricas import mascara_status_cancelado
+
+COLUNAS_GRUPO = ["DS_SUBSEGMENTO", "FAT_FAIXA_x"]
+
+
+def _perfil_clientes(df):
+    """Uma linha por cliente com as colunas de grupo, atributos numéricos e desfecho."""
+    colunas_grupo = [col for col in COLUNAS_GRUPO if col in df.columns]
+    base = pd.DataFrame({
+        "cliente_id": df["cliente_id"].astype(str).to_numpy(),
+        "valor_contrato": pd.to_numeric(df["VL_TOTAL_CONTRATO_NUM"], errors="coerce").to_numpy(),
+        "dias_como_cliente": pd.to_numeric(df["dias_como_cliente"], errors="coerce").to_numpy(),
+        "nps": pd.to_numeric(df["resposta_NPS_x"], errors="coerce").to_numpy(),
+        "cancelado": mascara_status_cancelado(df["SITUACAO_CONTRATO"]).to_numpy(),
+    })
+    for col in colunas_grupo:
+        base[col] = df[col].astype(str).to_numpy()
+
+    agregacoes = {
+        "valor_contrato": "mean",
+        "dias_como_cliente": "max",
+        "nps": "mean",
+        "cancelado": "mean",
+        **{col: "first" for col in colunas_grupo},
+    }
+    perfil = base.groupby("cliente_id", sort=False).agg(agregacoes)
+
+    # Desfecho do cliente a partir da fração de contratos cancelados
+    perfil["desfecho"] = np.select(
+        [perfil["cancelado"] >= 1, perfil["cancelado"] > 0],
+        ["Cancelado", "Parcialmente cancelado"],
+        default="Retido",
+    )
+    perfil["grupo"] = perfil[colunas_grupo].agg(" / ".join, axis=1) if colunas_grupo else "Todos"
+    return perfil.drop(columns="cancelado")
+
+
+def construir_indice_similares(df):
+    """Constrói os KD-trees por grupo e o global. Retorna None se faltarem colunas."""
+    necessarias = ["cliente_id", "VL_TOTAL_CONTRATO_NUM", "dias_como_cliente",
+                   "resposta_NPS_x", "SITUACAO_CONTRATO"]
+    if any(col not in df.columns for col in necessarias):
+        return None
+
+    # scikit-learn só é carregado quando o índice é construído
+    from sklearn.neighbors import KDTree
+
+    with medir_etapa("indice_similares", linhas=len(df)) as etapa:
+        perfil = _perfil_clientes(df)
+        atributos = np.column_stack([
+            np.log1p(perfil["valor_contrato"].clip(lower=0).fillna(0)),
+            perfil["dias_como_cliente"].fillna(0),
+            perfil["nps"].fillna(perfil["nps"].mean() if perfil["nps"].notna().any() else 0),
+        ]).astype(np.float64)
+        desvio = atributos.std(axis=0)
+        desvio[desvio == 0] = 1.0
+        vetores = (atributos - atributos.mean(axis=0)) / desvio
+
+        codigos_grupo, grupos = pd.factorize(perfil["grupo"])
+        ordem = np.argsort(codigos_grupo, kind="stable")
+        limites = np.searchsorted(codigos_grupo[ordem], np.arange(len(grupos) + 1))
+        arvores = {}
+        for codigo in range(len(grupos)):
+            posicoes = ordem[limites[codigo]:limites[codigo + 1]]
+            if len(posicoes) > 1:
+                arvores[codigo] = (KDTree(vetores[posicoes]), posicoes)
+
+        etapa["clientes"] = len(perfil)
+        etapa["grupos"] = len(grupos)
+        etapa["grupos_indexados"] = len(arvores)
+
+    return {
+        "perfil": perfil.reset_index(),
+        "clientes": pd.Index(perfil.index),
+        "vetores": vetores,
+        "codigos_grupo": codigos_grupo,
+        "arvores": arvores,
+        "arvore_global": KDTree(vetores),
+    }
+
+
+def buscar_similares(indice, clientes_ids, k=5):
+    """Retorna os k clientes mais parecidos com cada cliente consultado.
+
+    As consultas são agrupadas por grupo (subsegmento e faixa) para fazer
+    uma única busca por KD-tree. A coluna ``mesmo_grupo`` indica se o vizinho
+    veio do grupo do cliente ou do índice global.
+    """
+    colunas = ["cliente_consultado", "cliente_id", "distancia", "mesmo_grupo"]
+    if indice is None:
+        return pd.DataFrame(columns=colunas)
+
+    posicoes = indice["clientes"].get_indexer(pd.Index(clientes_ids).astype(str).unique())
+    posicoes = posicoes[posicoes >= 0]
+    if len(posicoes) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    resultados = []
+    with medir_etapa("busca_similares", linhas=len(posicoes)):
+        grupos_consulta = indice["codigos_grupo"][posicoes]
+        sem_grupo = []
+        for codigo in np.unique(grupos_consulta):
+            consultas = posicoes[grupos_consulta == codigo]
+            if codigo not in indice["arvores"]:
+                sem_grupo.append(consultas)
+                continue
+            arvore, membros = indice["arvores"][codigo]
+            # k + 1 porque o próprio cliente é sempre o vizinho mais próximo
+            n_vizinhos = min(k + 1, len(membros))
+            distancias, vizinhos = arvore.query(indice["vetores"][consultas], k=n_vizinhos)
+            resultados.append((consultas, distancias, membros[vizinhos], True))
+            if n_vizinhos < k + 1:
+                sem_grupo.append(consultas)
+
+        if sem_grupo:
+            consultas = np.concatenate(sem_grupo)
+            n_vizinhos = min(k + 1, len(indice["vetores"]))
+            distancias, vizinhos = indice["arvore_global"].query(indice["vetores"][consultas], k=n_vizinhos)
+            resultados.append((consultas, distancias, vizinhos, False))
+
+    if not resultados:
+        return pd.DataFrame(columns=colunas)
+
+    partes = []
+    for consultas, distancias, vizinhos, mesmo_grupo in resultados:
+        parte = pd.DataFrame({
+            "cliente_consultado": np.repeat(consultas, vizinhos.shape[1]),
+            "vizinho": vizinhos.ravel(),
+            "distancia": distancias.ravel(),
+            "mesmo_grupo": mesmo_grupo,
+        })
+        partes.append(parte[parte["cliente_consultado"] != parte["vizinho"]])
+
+    # Vizinhos do próprio grupo vêm antes dos que completam a lista pelo índice global
+    similares = pd.concat(partes, ignore_index=True)
+    similares = similares.sort_values(["cliente_consultado", "mesmo_grupo", "distancia"],
+                                      ascending=[True, False, True], kind="stable")
+    similares = similares.drop_duplicates(["cliente_consultado", "vizinho"])
+    similares = similares.groupby("cliente_consultado", sort=False).head(k)
+
+    perfil = indice["perfil"]
+    similares["cliente_consultado"] = perfil["cliente_id"].to_numpy()[similares["cliente_consultado"].to_numpy()]
+    detalhes = perfil.iloc[similares["vizinho"].to_numpy()].reset_index(drop=True)
+    similares = similares.drop(columns="vizinho").reset_index(drop=True)
+    return pd.concat([similares[["cliente_consultado"]], detalhes,
+                      similares[["distancia", "mesmo_grupo"]]], axis=1)
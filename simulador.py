@@ -0,0 +1,190 @@
+"""Simulador de cenários para os limiares de risco de churn e de upsell.
+
+Uma vez por versão da base é montado um histograma conjunto
+NPS x faixa de tempo de casa x faixa de valor do contrato, com a quantidade
+de registros e a receita de cada célula. Cada cenário reaplica as regras de
+``processar_base`` sobre as células do histograma (algumas centenas), e não
+sobre as linhas da base, então a resposta é imediata a cada ajuste.
+
+As faixas são construídas para que as regras sejam exatas nos limiares
+oferecidos: NPS com duas casas decimais, cortes de tempo de casa em
+``CORTES_DIAS`` e cortes de valor nos quantis de ``QUANTIS_VALOR``.
+"""
+import numpy as np
+import pandas as pd
+
+from dados import LIMIARES_SEGMENTACAO
+from instrumentacao import medir_etapa
+
+# Cortes de tempo de casa (em dias) disponíveis nos limiares do simulador
+CORTES_DIAS = [90, 180, 365, 545, 730, 1095, 1460, 1825]
+
+# Quantis do valor do contrato disponíveis nos limiares de upsell
+QUANTIS_VALOR = [round(float(q), 2) for q in np.arange(0.05, 1.0, 0.05)]
+
+
+def _faixas(valores, cortes):
+    """Índice da faixa [corte_i-1, corte_i) de cada valor; nulos ficam na última faixa."""
+    indices = np.searchsorted(cortes, valores, side="right")
+    indices[np.isnan(valores)] = len(cortes) + 1
+    return indices
+
+
+def _limites_faixas(cortes):
+    """Limites inferior e superior de cada faixa, com NaN na faixa de nulos."""
+    inferior = np.concatenate([[-np.inf], cortes, [np.nan]])
+    superior = np.concatenate([cortes, [np.inf], [np.nan]])
+    return inferior, superior
+
+
+def construir_histograma(df):
+    """Histograma conjunto de registros e receita para a simulação.
+
+    Retorna None se a base não tiver as colunas usadas na segmentação.
+    """
+    necessarias = ["resposta_NPS_x", "dias_como_cliente", "VL_TOTAL_CONTRATO_NUM"]
+    if any(col not in df.columns for col in necessarias):
+        return None
+
+    with medir_etapa("histograma_simulador", linhas=len(df)) as etapa:
+        nps = pd.to_numeric(df["resposta_NPS_x"], errors="coerce").to_numpy(dtype=np.float64)
+        dias = pd.to_numeric(df["dias_como_cliente"], errors="coerce").to_numpy(dtype=np.float64)
+        valor = df["VL_TOTAL_CONTRATO_NUM"]
+
+        # NPS: um nível por valor distinto (duas casas decimais) e um nível para nulos
+        nps = np.round(nps, 2)
+        niveis_nps = np.unique(nps[~np.isnan(nps)])
+        indice_nps = np.searchsorted(niveis_nps, nps)
+        indice_nps[np.isnan(nps)] = len(niveis_nps)
+        niveis_nps = np.concatenate([niveis_nps, [np.nan]])
+
+        # Dias são inteiros: cortes em c e c + 1 tornam exatos "dias < c" e "dias > c"
+        cortes_dias = np.unique(np.concatenate([CORTES_DIAS, np.add(CORTES_DIAS, 1)])).astype(np.float64)
+        indice_dias = _faixas(dias, cortes_dias)
+
+        # Quantis e comparações feitos como em processar_base (no dtype da coluna),
+        # para que "valor < quantil" reproduza exatamente a segmentação
+        quantis_valor = {q: valor.quantile(q) for q in QUANTIS_VALOR}
+        cortes_valor = np.unique([corte for corte in quantis_valor.values() if not pd.isna(corte)])
+        indice_valor = np.zeros(len(df), dtype=np.intp)
+        for corte in cortes_valor:
+            indice_valor += ~(valor < corte).to_numpy()
+        valores = valor.to_numpy(dtype=np.float64)
+        indice_valor[np.isnan(valores)] = len(cortes_valor) + 1
+
+        formato = (len(niveis_nps), len(cortes_dias) + 2, len(cortes_valor) + 2)
+        celulas = np.ravel_multi_index((indice_nps, indice_dias, indice_valor), formato)
+        registros = np.bincount(celulas, minlength=np.prod(formato)).reshape(formato)
+        receita = np.bincount(celulas, weights=np.nan_to_num(valores), minlength=np.prod(formato)).reshape(formato)
+
+        etapa["celulas"] = int(np.prod(formato))
+        etapa["celulas_ocupadas"] = int((registros > 0).sum())
+
+    return {
+        "registros": registros,
+        "receita": receita,
+        "niveis_nps": niveis_nps,
+        "limites_dias": _limites_faixas(cortes_dias),
+        "limites_valor": _limites_faixas(cortes_valor),
+        "quantis_valor": quantis_valor,
+    }
+
+
+def _quantil(niveis, contagens, q):
+    """Quantil com interpolação linear (como ``Series.quantile``) a partir de contagens por nível."""
+    validos = ~np.isnan(niveis) & (contagens > 0)
+    niveis, contagens = niveis[validos], contagens[validos]
+    total = contagens.sum()
+    if total == 0:
+        return np.nan
+    posicao = (total - 1) * q
+    acumulado = np.cumsum(contagens)
+    abaixo = niveis[np.searchsorted(acumulado, np.floor(posicao), side="right")]
+    acima = niveis[np.searchsorted(acumulado, np.ceil(posicao), side="right")]
+    return abaixo + (posicao - np.floor(posicao)) * (acima - abaixo)
+
+
+def simular_cenario(histograma, limiares=None):
+    """Aplica os limiares de segmentação ao histograma.
+
+    ``limiares`` segue as chaves de ``LIMIARES_SEGMENTACAO`` (as ausentes
+    usam o padrão). Retorna registros e receita por cluster, a receita em
+    risco e a distribuição de NPS (Detrator, Neutro, Promotor) por cluster.
+    """
+    limiares = {**LIMIARES_SEGMENTACAO, **(limiares or {})}
+    registros, receita = histograma["registros"], histograma["receita"]
+
+    # Eixos em formato de broadcast: NPS x faixa de dias x faixa de valor.
+    # Comparações com NaN (faixas de nulos) são falsas, como no pandas.
+    with np.errstate(invalid="ignore"):
+        nps = histograma["niveis_nps"][:, None, None]
+        dias_inferior = histograma["limites_dias"][0][None, :, None]
+        dias_superior = histograma["limites_dias"][1][None, :, None]
+        valor_superior = histograma["limites_valor"][1][None, None, :]
+
+        def dias_menor(corte):
+            return dias_superior <= corte
+
+        def dias_maior(corte):
+            return dias_inferior >= corte + 1
+
+        def valor_menor(quantil):
+            corte = histograma["quantis_valor"].get(quantil)
+            if corte is None or np.isnan(corte):
+                return np.zeros_like(valor_superior, dtype=bool)
+            return valor_superior <= corte
+
+        risco = (
+            ((nps <= limiares["risco_nps_novo"]) & dias_menor(limiares["risco_dias_novo"]))
+            | (nps <= limiares["risco_nps_critico"])
+            | ((nps < limiares["risco_nps_antigo"]) & dias_maior(limiares["risco_dias_antigo"]))
+        )
+        risco = np.broadcast_to(risco, registros.shape).copy()
+        total = registros.sum()
+
+        registros_por_nps = registros.sum(axis=(1, 2))
+        if total and registros[risco].sum() / total < limiares["risco_minimo"]:
+            limite = _quantil(histograma["niveis_nps"], registros_por_nps, limiares["risco_minimo"])
+            risco |= np.broadcast_to(nps <= limite, registros.shape)
+
+        upsell = (
+            ((nps >= limiares["upsell_nps"]) & valor_menor(limiares["upsell_quantil_valor"]))
+            | (dias_maior(limiares["upsell_dias_antigo"]) & valor_menor(limiares["upsell_quantil_valor_antigo"]))
+            | (nps >= limiares["upsell_nps_promotor"])
+        )
+        upsell = np.broadcast_to(upsell, registros.shape) & ~risco
+
+        if total and registros[upsell].sum() / total < limiares["upsell_minimo"]:
+            fora_risco = np.where(risco, 0, registros).sum(axis=(1, 2))
+            limite = _quantil(histograma["niveis_nps"], fora_risco, 1 - limiares["upsell_minimo"])
+            upsell = upsell | (np.broadcast_to(nps >= limite, registros.shape) & ~risco)
+
+        # Categorias de NPS como em processar_base: (-1, 6], (6, 8], (8, 10]
+        niveis = histograma["niveis_nps"]
+        categorias = {
+            "Detrator": (niveis > -1) & (niveis <= 6),
+            "Neutro": (niveis > 6) & (niveis <= 8),
+            "Promotor": (niveis > 8) & (niveis <= 10),
+        }
+
+    mascaras = {
+        "Regular": ~risco & ~upsell,
+        "Risco de Churn": risco,
+        "Potencial de Upsell": upsell,
+    }
+    resultado = {
+        "registros_por_cluster": {},
+        "receita_por_cluster": {},
+        "dist_nps_por_cluster": {},
+    }
+    for cluster, mascara in mascaras.items():
+        registros_cluster = np.where(mascara, registros, 0)
+        resultado["registros_por_cluster"][cluster] = int(registros_cluster.sum())
+        resultado["receita_por_cluster"][cluster] = float(receita[mascara].sum())
+        por_nps = registros_cluster.sum(axis=(1, 2))
+        resultado["dist_nps_por_cluster"][cluster] = {
+            categoria: int(por_nps[selecao].sum()) for categoria, selecao in categorias.items()
+        }
+    resultado["receita_em_risco"] = resultado["receita_por_cluster"]["Risco de Churn"]
+    resultado["total_registros"] = int(total)
+    return resultado
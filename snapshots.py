@@ -0,0 +1,240 @@
+"""Snapshots versionados da segmentação por cliente e comparação entre eles.
+
+Cada snapshot guarda, por cliente, um estado compacto (risco de churn,
+potencial de upsell e cancelamento) indexado por um código inteiro. Os
+códigos vêm de um dicionário ``cliente_id -> código`` compartilhado por todos
+os snapshots e que só cresce, então o mesmo cliente tem o mesmo código em
+qualquer snapshot. A comparação posiciona os estados de dois snapshots em
+vetores indexados pelo código e compara elemento a elemento: custo linear no
+número de clientes, sem ordenação nem reprocessamento da base.
+"""
+import contextlib
+import datetime
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from instrumentacao import medir_etapa
+from metricas import mascara_status_cancelado
+
+DIRETORIO_SNAPSHOTS = os.environ.get("DASHBOARD_SNAPSHOTS", "snapshots")
+ARQUIVO_DICIONARIO = "clientes.arrow"
+ARQUIVO_TRAVA = ".trava"
+
+# Identificador do snapshot: data e hora da gravação, com microssegundos.
+# Snapshots antigos têm identificadores só até os segundos.
+FORMATO_ID = "%Y%m%dT%H%M%S%f"
+TAMANHO_ID = len(datetime.datetime(2000, 1, 1).strftime(FORMATO_ID))
+
+# Espera máxima pela trava do diretório e idade a partir da qual uma trava
+# é considerada abandonada (processo encerrado no meio da gravação)
+ESPERA_TRAVA_S = 30
+TRAVA_ABANDONADA_S = 120
+
+# Quantidade de snapshots mantidos; os mais antigos são removidos
+MAX_SNAPSHOTS = 60
+
+# Bits do estado de cada cliente
+RISCO = 1
+UPSELL = 2
+CANCELADO = 4
+PRESENTE = 8
+
+TRANSICOES = ["Entrou em risco", "Recuperado", "Cancelado", "Novo upsell"]
+
+
+def estado_clientes(df):
+    """Estado de cada cliente na base: Series uint8 de bits indexada por ``cliente_id``.
+
+    Um cliente está em risco (ou com potencial de upsell) se algum contrato
+    estiver, e cancelado se todos os contratos estiverem cancelados.
+    Retorna None se a base não tiver ``cliente_id``.
+    """
+    if "cliente_id" not in df.columns:
+        return None
+    falso = np.zeros(len(df), dtype=bool)
+    base = pd.DataFrame({
+        "cliente_id": df["cliente_id"].astype(str).to_numpy(),
+        "risco": df["risco_churn"].fillna(False).to_numpy(dtype=bool) if "risco_churn" in df.columns else falso,
+        "upsell": (df["potencial_upsell"].fillna(False).to_numpy(dtype=bool)
+                   if "potencial_upsell" in df.columns else falso),
+        "cancelado": (mascara_status_cancelado(df["SITUACAO_CONTRATO"]).to_numpy()
+                      if "SITUACAO_CONTRATO" in df.columns else falso),
+    })
+    por_cliente = base.groupby("cliente_id", sort=False).agg(
+        risco=("risco", "max"), upsell=("upsell", "max"), cancelado=("cancelado", "min"))
+    return codificar_estado(por_cliente["risco"], por_cliente["upsell"], por_cliente["cancelado"])
+
+
+def codificar_estado(risco, upsell, cancelado):
+    """Combina as flags por cliente (Series booleanas com o mesmo índice) nos bits do estado."""
+    estado = (PRESENTE + RISCO * risco.to_numpy(dtype=np.uint8) + UPSELL * upsell.to_numpy(dtype=np.uint8)
+              + CANCELADO * cancelado.to_numpy(dtype=np.uint8))
+    return pd.Series(estado.astype(np.uint8), index=risco.index.astype(str), name="estado")
+
+
+def _gravar_arrow(tabela, caminho):
+    # Gravação atômica: leitores nunca veem um arquivo pela metade
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    feather.write_feather(tabela, temporario, compression="uncompressed")
+    os.replace(temporario, caminho)
+
+
+@contextlib.contextmanager
+def _trava_diretorio(diretorio):
+    """Trava entre processos para as gravações no diretório de snapshots.
+
+    Usa a criação exclusiva de um arquivo (``O_CREAT | O_EXCL``), que é
+    atômica em qualquer sistema operacional. Travas mais antigas que
+    ``TRAVA_ABANDONADA_S`` são removidas; após ``ESPERA_TRAVA_S`` sem
+    conseguir a trava, levanta ``TimeoutError``.
+    """
+    caminho = os.path.join(diretorio, ARQUIVO_TRAVA)
+    limite = time.monotonic() + ESPERA_TRAVA_S
+    while True:
+        try:
+            descritor = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(caminho) > TRAVA_ABANDONADA_S:
+                    os.remove(caminho)
+                    continue
+            except FileNotFoundError:
+                # Liberada entre a tentativa e a verificação
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Trava de snapshots ocupada: {caminho}")
+            time.sleep(0.05)
+    try:
+        with os.fdopen(descritor, "w") as arquivo:
+            arquivo.write(str(os.getpid()))
+        yield
+    finally:
+        # Pode já ter sido removida por outro processo, se considerada abandonada
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(caminho)
+
+
+def carregar_dicionario(diretorio=DIRETORIO_SNAPSHOTS):
+    """Clientes do dicionário na ordem dos códigos (a posição é o código)."""
+    caminho = os.path.join(diretorio, ARQUIVO_DICIONARIO)
+    if not os.path.exists(caminho):
+        return pd.Index([], dtype=object)
+    return pd.Index(feather.read_table(caminho)["cliente_id"].to_numpy(zero_copy_only=False))
+
+
+def codificar_clientes(clientes, diretorio=DIRETORIO_SNAPSHOTS):
+    """Códigos inteiros dos clientes, acrescentando ao dicionário os que forem novos.
+
+    Lê e regrava o dicionário: deve ser chamada com a trava do diretório.
+    """
+    dicionario = carregar_dicionario(diretorio)
+    codigos = dicionario.get_indexer(clientes)
+    novos = codigos < 0
+    if novos.any():
+        codigos[novos] = len(dicionario) + np.arange(novos.sum())
+        dicionario = dicionario.append(pd.Index(clientes[novos]))
+        _gravar_arrow(pa.table({"cliente_id": pa.array(dicionario.to_numpy(), pa.string())}),
+                      os.path.join(diretorio, ARQUIVO_DICIONARIO))
+    return codigos.astype(np.int32)
+
+
+def listar_snapshots(diretorio=DIRETORIO_SNAPSHOTS):
+    """Snapshots gravados, do mais antigo ao mais recente: [{id, versao, caminho}]."""
+    if not os.path.isdir(diretorio):
+        return []
+    snapshots = []
+    for nome in os.listdir(diretorio):
+        if nome.startswith("snapshot_") and nome.endswith(".arrow"):
+            identificador, versao = nome[len("snapshot_"):-len(".arrow")].split("_", 1)
+            snapshots.append({"id": identificador, "versao": versao, "caminho": os.path.join(diretorio, nome)})
+    # Completa os identificadores sem microssegundos para ordenar pela data
+    return sorted(snapshots, key=lambda snapshot: snapshot["id"].ljust(TAMANHO_ID, "0"))
+
+
+def data_snapshot(snapshot):
+    """Data e hora da gravação do snapshot."""
+    return datetime.datetime.strptime(snapshot["id"].ljust(TAMANHO_ID, "0"), FORMATO_ID)
+
+
+def gravar_snapshot(estado, versao, diretorio=DIRETORIO_SNAPSHOTS):
+    """Grava o estado dos clientes como um novo snapshot da versão ``versao`` da base.
+
+    Se o snapshot mais recente já é da mesma versão, nada é gravado. Retorna
+    o snapshot mais recente. Processos concorrentes (réplicas do dashboard)
+    gravam um de cada vez: a verificação, o dicionário e o snapshot ficam
+    sob a mesma trava.
+    """
+    snapshots = listar_snapshots(diretorio)
+    if snapshots and snapshots[-1]["versao"] == versao:
+        return snapshots[-1]
+
+    os.makedirs(diretorio, exist_ok=True)
+    with _trava_diretorio(diretorio):
+        # Outro processo pode ter gravado a mesma versão enquanto esperávamos a trava
+        snapshots = listar_snapshots(diretorio)
+        if snapshots and snapshots[-1]["versao"] == versao:
+            return snapshots[-1]
+
+        with medir_etapa("gravacao_snapshot", linhas=len(estado)):
+            codigos = codificar_clientes(estado.index, diretorio)
+            identificador = datetime.datetime.now().strftime(FORMATO_ID)
+            caminho = os.path.join(diretorio, f"snapshot_{identificador}_{versao}.arrow")
+            _gravar_arrow(pa.table({"codigo": codigos, "estado": estado.to_numpy(dtype=np.uint8)}), caminho)
+
+        for antigo in snapshots[:max(len(snapshots) + 1 - MAX_SNAPSHOTS, 0)]:
+            os.remove(antigo["caminho"])
+    return {"id": identificador, "versao": versao, "caminho": caminho}
+
+
+def _estados_por_codigo(snapshot, tamanho):
+    """Vetor de estados indexado pelo código do cliente (0 = ausente do snapshot)."""
+    tabela = feather.read_table(snapshot["caminho"], memory_map=True)
+    estados = np.zeros(tamanho, dtype=np.uint8)
+    estados[tabela["codigo"].to_numpy()] = tabela["estado"].to_numpy()
+    return estados
+
+
+def comparar_snapshots(anterior, atual, diretorio=DIRETORIO_SNAPSHOTS):
+    """Transições de segmentação entre dois snapshots.
+
+    - Entrou em risco: em risco no atual e não no anterior (inclui clientes novos na base);
+    - Recuperado: em risco no anterior, presente e fora de risco e não cancelado no atual;
+    - Cancelado: não cancelado no anterior, e cancelado ou ausente no atual;
+    - Novo upsell: com potencial de upsell no atual e não no anterior.
+
+    Retorna um DataFrame com ``cliente_id``, ``transicao`` e ``novo_na_base``
+    (um cliente pode ter mais de uma transição).
+    """
+    dicionario = carregar_dicionario(diretorio)
+    with medir_etapa("comparacao_snapshots", linhas=len(dicionario)) as etapa:
+        antes = _estados_por_codigo(anterior, len(dicionario))
+        depois = _estados_por_codigo(atual, len(dicionario))
+
+        presente_antes = (antes & PRESENTE) > 0
+        presente_depois = (depois & PRESENTE) > 0
+        risco_antes, risco_depois = (antes & RISCO) > 0, (depois & RISCO) > 0
+        cancelado_antes, cancelado_depois = (antes & CANCELADO) > 0, (depois & CANCELADO) > 0
+
+        mascaras = {
+            "Entrou em risco": risco_depois & ~risco_antes,
+            "Recuperado": risco_antes & presente_depois & ~risco_depois & ~cancelado_depois,
+            "Cancelado": presente_antes & ~cancelado_antes & (cancelado_depois | ~presente_depois),
+            "Novo upsell": ((depois & UPSELL) > 0) & ((antes & UPSELL) == 0),
+        }
+        partes = []
+        for transicao, mascara in mascaras.items():
+            codigos = np.flatnonzero(mascara)
+            partes.append(pd.DataFrame({
+                "cliente_id": dicionario.to_numpy()[codigos],
+                "transicao": transicao,
+                "novo_na_base": ~presente_antes[codigos],
+            }))
+        etapa["transicoes"] = sum(len(parte) for parte in partes)
+    return pd.concat(partes, ignore_index=True)
+
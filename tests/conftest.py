@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Os testes não gravam o log de performance do dashboard
+os.environ.setdefault("DASHBOARD_LOG_PERFORMANCE", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
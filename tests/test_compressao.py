@@ -0,0 +1,71 @@
+import bz2
+import gzip
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+import compressao
+from compressao import blocos_csv, ler_csv, localizar_arquivo
+
+
+@pytest.fixture
+def csv_puro(tmp_path):
+    caminho = tmp_path / "amostra.csv"
+    shutil.copyfile("amostras/amostra_tiny.csv", caminho)
+    return caminho
+
+
+def _gravar_zst(destino, modo):
+    zstandard = pytest.importorskip("zstandard")
+    return zstandard.ZstdCompressor().stream_writer(open(destino, modo), closefd=True)
+
+
+def _comprimir(origem, destino, abrir):
+    with open(origem, "rb") as entrada, abrir(destino, "wb") as saida:
+        shutil.copyfileobj(entrada, saida)
+    return str(destino)
+
+
+@pytest.fixture(params=[(".gz", gzip.open), (".bz2", bz2.open), (".zst", _gravar_zst)], ids=["gz", "bz2", "zst"])
+def csv_comprimido(request, csv_puro):
+    extensao, abrir = request.param
+    return _comprimir(csv_puro, f"{csv_puro}{extensao}", abrir)
+
+
+@pytest.fixture
+def blocos_pequenos(monkeypatch):
+    # Blocos pequenos para que a leitura atravesse vários blocos descomprimidos e do parser
+    monkeypatch.setattr(compressao, "TAMANHO_BLOCO_BYTES", 4096)
+    monkeypatch.setattr(compressao, "LINHAS_POR_BLOCO", 10)
+
+
+def test_csv_comprimido_igual_ao_puro(csv_puro, csv_comprimido, blocos_pequenos):
+    # Sem dtype: colunas de tipo misto são inferidas como na leitura do CSV puro
+    pd.testing.assert_frame_equal(ler_csv(csv_comprimido), pd.read_csv(csv_puro))
+    pd.testing.assert_frame_equal(ler_csv(csv_comprimido, dtype={"cliente_id": str}),
+                                  pd.read_csv(csv_puro, dtype={"cliente_id": str}))
+    pd.testing.assert_frame_equal(ler_csv(csv_comprimido, nrows=7), pd.read_csv(csv_puro, nrows=7))
+
+
+def test_blocos_de_csv_comprimido(csv_puro, csv_comprimido, blocos_pequenos):
+    blocos = list(blocos_csv(csv_comprimido, dtype=str))
+    assert len(blocos) == 100
+    # Em blocos o tipo de cada coluna é inferido por bloco: compara o texto lido
+    pd.testing.assert_frame_equal(pd.concat(blocos, ignore_index=True), pd.read_csv(csv_puro, dtype=str))
+
+
+def test_zst_sem_zstandard(csv_puro, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    caminho = csv_puro.with_name("amostra.csv.zst")
+    caminho.write_bytes(b"")
+    with pytest.raises(ImportError, match="pip install zstandard"):
+        ler_csv(str(caminho))
+
+
+def test_localiza_variante_comprimida(csv_puro):
+    comprimido = _comprimir(csv_puro, f"{csv_puro}.gz", gzip.open)
+    assert localizar_arquivo(str(csv_puro)) == str(csv_puro)
+    csv_puro.unlink()
+    assert localizar_arquivo(str(csv_puro)) == comprimido
@@ -0,0 +1,49 @@
+import math
+
+import pandas as pd
+import pytest
+
+import dados
+from consultas import metricas_arrow
+from metricas import calcular_metricas_cs
+
+FATIAS = [
+    {},
+    {"ufs": ["SP"]},
+    {"segmentos": ["MANUFATURA"], "meses": 24},
+    {"segmentos": ["MANUFATURA"], "meses": 24, "cluster": "Regular"},
+    {"ufs": ["SC", "PE"], "cluster": "Risco de Churn"},
+    # Fatias vazias: UF inexistente e cluster sem registros na janela
+    {"ufs": ["XX"]},
+    {"ufs": ["XX"], "cluster": "Potencial de Upsell"},
+]
+
+
+@pytest.fixture(scope="module")
+def base_particionada(tmp_path_factory):
+    diretorio = str(tmp_path_factory.mktemp("base_particionada"))
+    dados.gravar_base_particionada(dados.processar_base(pd.read_csv("amostras/amostra_parte_1.csv")), diretorio)
+    return diretorio
+
+
+def _comparar(obtido, esperado, chave=""):
+    if isinstance(esperado, dict):
+        assert list(obtido) == list(esperado), chave
+        for k in esperado:
+            _comparar(obtido[k], esperado[k], f"{chave}.{k}")
+    elif isinstance(esperado, float) and math.isnan(esperado):
+        assert isinstance(obtido, float) and math.isnan(obtido), chave
+    else:
+        assert obtido == pytest.approx(esperado, rel=1e-5), chave
+
+
+@pytest.mark.parametrize("fatia", FATIAS)
+def test_backend_arrow_igual_ao_pandas(base_particionada, fatia):
+    cluster = fatia.get("cluster", "Todos")
+    filtros = {k: v for k, v in fatia.items() if k != "cluster"}
+
+    df = dados.carregar_particoes(diretorio=base_particionada, **filtros)
+    if cluster != "Todos":
+        df = df[(df["cluster"] == cluster).to_numpy()]
+
+    _comparar(metricas_arrow(cluster=cluster, diretorio=base_particionada, **filtros), calcular_metricas_cs(df))
@@ -0,0 +1,79 @@
+"""Regressão de ``processar_base`` contra o comportamento do dashboard original.
+
+``dados/processar_base_amostra_tiny.csv`` foi gerado pelo ``load_data`` do
+commit base (b5c6a4b), aplicado a ``amostras/amostra_tiny.csv`` com a data
+atual fixada em 2025-08-16.
+"""
+import datetime
+import os
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+
+REFERENCIA = "tests/dados/processar_base_amostra_tiny.csv"
+
+
+class _DataFixa(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 8, 16)
+
+
+@pytest.fixture
+def data_fixa(monkeypatch):
+    monkeypatch.setattr(dados, "datetime", types.SimpleNamespace(datetime=_DataFixa, timedelta=datetime.timedelta))
+
+
+def test_processar_base_igual_ao_dashboard_original(data_fixa):
+    esperado = pd.read_csv(REFERENCIA, dtype={"cliente_id": str})
+    df = dados.processar_base(pd.read_csv("amostras/amostra_tiny.csv"))
+
+    for coluna in ["cliente_id", "mes_assinatura", "SITUACAO_CONTRATO", "categoria_nps", "cluster"]:
+        assert df[coluna].astype(str).tolist() == esperado[coluna].astype(str).tolist(), coluna
+    for coluna in ["risco_churn", "potencial_upsell"]:
+        assert df[coluna].astype(bool).tolist() == esperado[coluna].tolist(), coluna
+    for coluna in ["VL_TOTAL_CONTRATO_NUM", "dias_como_cliente", "resposta_NPS_x"]:
+        np.testing.assert_allclose(df[coluna].astype("float64"), esperado[coluna], rtol=1e-6, err_msg=coluna)
+
+
+@pytest.fixture
+def pasta_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(dados, "PASTA_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setattr(dados, "_bases_processo", {})
+    return tmp_path / "cache"
+
+
+def test_cache_em_disco_separa_origens_e_versoes(tmp_path, pasta_cache, monkeypatch):
+    arquivo = tmp_path / "base.csv"
+    pd.read_csv("amostras/amostra_tiny.csv").head(300).to_csv(arquivo, index=False)
+    (tmp_path / "fontes").mkdir()
+    (tmp_path / "fontes" / "contratos.csv").write_text("cliente_id\n1\n")
+
+    unificada = dados.metadados_origem(str(arquivo), None)
+    fontes = dados.metadados_fontes(None, str(tmp_path / "fontes"))
+    assert dados._caminhos_cache(unificada) != dados._caminhos_cache(fontes)
+
+    lidas = []
+
+    def ler():
+        lidas.append(str(arquivo))
+        return pd.read_csv(arquivo)
+
+    assert len(dados._carregar_com_cache(unificada, ler)) == 300
+    # Novo processo: a base vem do cache em disco, sem ler o CSV
+    monkeypatch.setattr(dados, "_bases_processo", {})
+    assert len(dados._carregar_com_cache(unificada, ler)) == 300
+    assert len(lidas) == 1
+
+    # A origem mudou: o cache antigo não é servido e é removido
+    pd.read_csv("amostras/amostra_tiny.csv").head(200).to_csv(arquivo, index=False)
+    atualizada = dados.metadados_origem(str(arquivo), None)
+    monkeypatch.setattr(dados, "_bases_processo", {})
+    assert len(dados._carregar_com_cache(atualizada, ler)) == 200
+    assert len(lidas) == 2
+    assert sorted(p.name for p in pasta_cache.iterdir()) == sorted(
+        os.path.basename(caminho) for caminho in dados._caminhos_cache(atualizada))
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dados
+from ingestao import (
+    COLUNAS_FONTES,
+    agregar_nps,
+    agregar_tickets,
+    carregar_fontes,
+    montar_visao_clientes,
+    separar_base_unificada,
+)
+
+UNIFICADA = "amostras/amostra_tiny.csv"
+
+
+def _sem_repeticao(tabela):
+    """Linhas distintas pelo valor: textos numéricos ("0" e "0.0") são comparados como números."""
+    chave = tabela.copy()
+    for col in chave.columns.drop("cliente_id"):
+        numeros = pd.to_numeric(chave[col].astype(str), errors="coerce")
+        chave[col] = numeros.astype(str).where(numeros.notna(), chave[col].astype(str))
+    return tabela[~chave.duplicated().to_numpy()]
+
+
+def _visao_de_referencia(unificada):
+    """Visão por contrato montada direto da base unificada, sem separar em arquivos."""
+    tabelas = {}
+    for nome, colunas in COLUNAS_FONTES.items():
+        colunas = [col for col in colunas if col in unificada.columns]
+        tabela = unificada[["cliente_id"] + colunas]
+        if nome != "contratos":
+            tabela = tabela.dropna(how="all", subset=colunas)
+        tabelas[nome] = _sem_repeticao(tabela)
+    contratos = tabelas["contratos"].reset_index(drop=True)
+    chave = contratos["cliente_id"]
+    agregados = [agregar_nps(tabelas["nps"]), agregar_tickets(tabelas["tickets"])]
+    return pd.concat([contratos] + [a.reindex(chave).set_axis(contratos.index) for a in agregados], axis=1)
+
+
+@pytest.fixture(scope="module")
+def fontes(tmp_path_factory):
+    pasta = tmp_path_factory.mktemp("ingestao")
+    # Repete o começo da base no fim: com blocos de 100 linhas, as repetições caem em outros blocos
+    with open(UNIFICADA, encoding="utf-8") as f:
+        linhas = f.read().splitlines()
+    origem = pasta / "unificada.csv"
+    origem.write_text("\n".join(linhas + linhas[1:151]) + "\n", encoding="utf-8")
+
+    destino = pasta / "fontes"
+    gravadas = separar_base_unificada(str(origem), str(destino), tamanho_bloco=100)
+    return str(destino), gravadas
+
+
+def test_separacao_descarta_repeticoes_entre_blocos(fontes, tmp_path):
+    _, gravadas = fontes
+    # A base sem as repetições, lida em um único bloco, gera as mesmas fontes
+    assert separar_base_unificada(UNIFICADA, str(tmp_path), tamanho_bloco=100_000) == gravadas
+    unificada = pd.read_csv(UNIFICADA, dtype={"cliente_id": str})
+    assert gravadas["contratos"] == len(_visao_de_referencia(unificada))
+
+
+def test_visao_das_fontes_igual_a_base_unificada(fontes):
+    diretorio, _ = fontes
+    visao = dados.processar_base(montar_visao_clientes(carregar_fontes(diretorio)))
+    referencia = dados.processar_base(_visao_de_referencia(pd.read_csv(UNIFICADA, dtype={"cliente_id": str})))
+
+    assert len(visao) == len(referencia)
+    for coluna in ["cliente_id", "SITUACAO_CONTRATO", "mes_assinatura", "categoria_nps", "cluster"]:
+        assert visao[coluna].astype(str).tolist() == referencia[coluna].astype(str).tolist(), coluna
+    for coluna in ["VL_TOTAL_CONTRATO_NUM", "resposta_NPS_x", "qtd_respostas_nps", "qtd_tickets",
+                   "tickets_abertos", "satisfacao_tickets"]:
+        np.testing.assert_allclose(visao[coluna].astype("float64"), referencia[coluna].astype("float64"),
+                                   rtol=1e-5, err_msg=coluna)
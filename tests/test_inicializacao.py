@@ -0,0 +1,39 @@
+import dados
+import inicializacao
+from instrumentacao import iniciar_execucao, registrar_excecao, registros_execucao
+
+
+def test_renderizacao_com_falha_carrega_a_base(monkeypatch):
+    def renderizar_com_falha(script):
+        raise RuntimeError("script quebrado")
+
+    carregadas = []
+
+    def carregar_base(nrows):
+        # A carga de reserva registra os próprios erros na etapa em andamento
+        registrar_excecao(ValueError("arquivo ausente"))
+        carregadas.append(nrows)
+
+    monkeypatch.setattr(inicializacao, "renderizar_pagina", renderizar_com_falha)
+    monkeypatch.setattr(dados, "carregar_base", carregar_base)
+
+    iniciar_execucao()
+    resultado = inicializacao.preaquecer(nrows=123)
+
+    assert resultado["erros"] == ["RuntimeError: script quebrado"]
+    assert carregadas == [123]
+    etapa = next(r for r in registros_execucao() if r["etapa"] == "preaquecimento_pagina")
+    assert etapa["erros"] == ["RuntimeError: script quebrado", "ValueError: arquivo ausente"]
+
+
+def test_renderizacao_sem_erros_nao_carrega_a_base(monkeypatch):
+    def carregar_base(nrows):
+        raise AssertionError("a página já carregou a base")
+
+    monkeypatch.setattr(inicializacao, "renderizar_pagina", lambda script: [])
+    monkeypatch.setattr(dados, "carregar_base", carregar_base)
+
+    resultado = inicializacao.preaquecer()
+
+    assert resultado["erros"] == []
+    assert set(resultado) >= {"importacoes_s", "pagina_s", "total_s", "dentro_orcamento"}
@@ -0,0 +1,17 @@
+from instrumentacao import iniciar_execucao, medir_etapa, registros_execucao
+
+
+def test_reexecucao_de_fragmento_tem_contexto_proprio():
+    iniciar_execucao()
+    with medir_etapa("load_data"):
+        pass
+    id_pagina = registros_execucao()[0]["id_execucao"]
+
+    iniciar_execucao(escopo="secao_simulador")
+    with medir_etapa("simulacao"):
+        pass
+
+    registros = registros_execucao()
+    assert [r["etapa"] for r in registros] == ["simulacao"]
+    assert registros[0]["escopo"] == "secao_simulador"
+    assert registros[0]["id_execucao"] != id_pagina
@@ -0,0 +1,65 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import dados
+from consultas import contar_registros
+
+FILTROS = [
+    {"ufs": ["SP"]},
+    {"ufs": ["SC", "PE"], "segmentos": ["MANUFATURA"]},
+    {"segmentos": ["SERVICOS", "VAREJO"]},
+    {"meses": 24},
+    {"ufs": ["SP"], "meses": 36},
+    {"ufs": ["XX"]},
+]
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    bruta = pd.read_csv("amostras/amostra_parte_1.csv")
+    # Contratos sem data válida vão para a partição mes_assinatura=NaT
+    bruta.loc[bruta.index[-5:], "DT_ASSINATURA_CONTRATO"] = "sem data"
+    df = dados.processar_base(bruta)
+    assert (df["mes_assinatura"] == "NaT").sum() == 5
+
+    diretorio = str(tmp_path_factory.mktemp("particoes") / "base")
+    dados.gravar_base_particionada(df, diretorio)
+    return df, diretorio
+
+
+def _filtrar_pandas(df, ufs=None, segmentos=None, meses=None):
+    mascara = pd.Series(True, index=df.index)
+    if ufs:
+        mascara &= df["UF"].astype(str).isin(ufs)
+    if segmentos:
+        mascara &= df["DS_SEGMENTO"].astype(str).isin(segmentos)
+    if meses:
+        mes_inicial = pd.Period(datetime.date.today(), freq="M") - (meses - 1)
+        # Comparações com NaT são falsas: contratos sem data ficam de fora
+        mascara &= df["DT_ASSINATURA_CONTRATO"].dt.to_period("M") >= mes_inicial
+    return df[mascara]
+
+
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_particoes_lidas_iguais_ao_filtro_em_memoria(base, filtros):
+    df, diretorio = base
+    esperado = _filtrar_pandas(df, **filtros)
+
+    fatia = dados.carregar_particoes(diretorio=diretorio, **filtros)
+    assert contar_registros(diretorio=diretorio, **filtros) == len(esperado)
+    assert sorted(fatia["NR_PROPOSTA"].astype(str) + fatia["ITEM_PROPOSTA"].astype(str)) == sorted(
+        esperado["NR_PROPOSTA"].astype(str) + esperado["ITEM_PROPOSTA"].astype(str))
+    if filtros.get("meses"):
+        assert "NaT" not in set(fatia["mes_assinatura"].astype(str))
+
+
+def test_regravar_substitui_a_base(base, tmp_path):
+    df, _ = base
+    destino = str(tmp_path / "base")
+    dados.gravar_base_particionada(df, destino)
+    dados.gravar_base_particionada(df.head(100), destino)
+
+    assert contar_registros(diretorio=destino) == 100
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["base"]
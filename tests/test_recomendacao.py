@@ -0,0 +1,42 @@
+import math
+
+import pandas as pd
+import pytest
+
+from recomendacao import construir_modelo_produtos, recomendar_produtos, resumir_recomendacoes
+
+
+@pytest.fixture
+def modelo():
+    itens = pd.DataFrame({
+        "cliente_id": ["A", "A", "B", "B", "B", "C", "C"],
+        "DS_PROD": ["x", "y", "x", "y", "z", "x", "x"],
+    })
+    return construir_modelo_produtos(itens)
+
+
+def test_recomenda_produtos_nao_contratados_por_afinidade(modelo):
+    recomendacoes = recomendar_produtos(modelo, ["A", "C", "B", "desconhecido"], k=2)
+
+    # B já tem todos os produtos; clientes fora da base são ignorados
+    assert set(recomendacoes["cliente_id"]) == {"A", "C"}
+
+    cliente_c = recomendacoes[recomendacoes["cliente_id"] == "C"]
+    assert cliente_c["produto"].tolist() == ["y", "z"]
+    assert cliente_c["ranking"].tolist() == [1, 2]
+    # Cosseno entre x (3 clientes) e y (2 clientes, ambos com x): 2 / sqrt(3 * 2)
+    assert cliente_c["score"].tolist() == pytest.approx([2 / math.sqrt(6), 1 / math.sqrt(3)])
+
+    cliente_a = recomendacoes[recomendacoes["cliente_id"] == "A"]
+    assert cliente_a["produto"].tolist() == ["z"]
+    assert cliente_a["score"].iloc[0] == pytest.approx(1 / math.sqrt(3) + 1 / math.sqrt(2))
+
+
+def test_resumo_lista_produtos_em_ordem_de_ranking(modelo):
+    resumo = resumir_recomendacoes(recomendar_produtos(modelo, ["A", "C"], k=3))
+    assert resumo.to_dict() == {"A": "z", "C": "y | z"}
+
+
+def test_sem_colunas_de_produto_nao_ha_modelo():
+    assert construir_modelo_produtos(pd.DataFrame({"cliente_id": ["A"]})) is None
+    assert recomendar_produtos(None, ["A"]).empty
@@ -0,0 +1,85 @@
+import os
+
+import pandas as pd
+import pytest
+
+import dados
+import relatorios
+from metricas import calcular_metricas_cs
+
+
+@pytest.fixture(scope="module")
+def base(tmp_path_factory):
+    df = dados.processar_base(pd.read_csv("amostras/amostra_parte_1.csv"))
+    caminho = str(tmp_path_factory.mktemp("relatorios") / "base_relatorios.arrow")
+    faixas = relatorios.preparar_base_relatorios(df, caminho)
+    return df, caminho, faixas
+
+
+@pytest.fixture
+def processo(base, monkeypatch):
+    # Mapeia a base como um processo do pool faria, sem deixar o estado para outros testes
+    monkeypatch.setattr(relatorios, "_base_processo", None)
+    relatorios._iniciar_processo(base[1])
+
+
+def test_faixas_cobrem_cada_par_segmento_uf(base, processo):
+    df, _, faixas = base
+    pares = df.groupby([df["DS_SEGMENTO"].astype(str), df["UF"].astype(str)]).size()
+    assert {par: fim - inicio for par, (inicio, fim) in faixas.items()} == pares.to_dict()
+
+    # Faixas contíguas, sem sobreposição, cobrindo todas as linhas
+    limites = sorted(faixas.values())
+    assert limites[0][0] == 0 and limites[-1][1] == len(df)
+    assert all(fim == proximo for (_, fim), (proximo, _) in zip(limites, limites[1:]))
+
+    for (segmento, uf), faixa in faixas.items():
+        fatia = relatorios._fatia([faixa])
+        filtrada = df[(df["DS_SEGMENTO"].astype(str) == segmento) & (df["UF"].astype(str) == uf)]
+        assert sorted(fatia["cliente_id"].astype(str)) == sorted(filtrada["cliente_id"].astype(str))
+
+
+def test_tarefas_agrupam_faixas_por_dimensao(base, processo):
+    df, _, faixas = base
+    tarefas = relatorios.tarefas_relatorios(faixas, ["segmento", "uf", "segmento_uf"])
+
+    for dimensao, colunas in relatorios.DIMENSOES.items():
+        esperado = df.groupby([df[col].astype(str) for col in colunas]).size()
+        esperado.index = [" / ".join(chave) if isinstance(chave, tuple) else chave for chave in esperado.index]
+        obtido = {
+            tarefa["valor"]: sum(fim - inicio for inicio, fim in tarefa["faixas"])
+            for tarefa in tarefas if tarefa["dimensao"] == dimensao
+        }
+        assert obtido == esperado.to_dict()
+
+    arquivos = [tarefa["arquivo"] for tarefa in tarefas]
+    assert len(set(arquivos)) == len(arquivos)
+
+
+def test_relatorio_de_segmento_igual_as_metricas_da_base_filtrada(base, processo, tmp_path):
+    df, _, faixas = base
+    tarefas = relatorios.tarefas_relatorios(faixas, ["segmento"])
+    tarefa = next(tarefa for tarefa in tarefas if tarefa["valor"] == "SERVICOS")
+
+    resumo = relatorios.gerar_relatorio(tarefa, str(tmp_path))
+    metricas = calcular_metricas_cs(df[df["DS_SEGMENTO"].astype(str) == "SERVICOS"])
+
+    assert resumo["erro"] == ""
+    assert resumo["registros"] == 111
+    for chave in ["total_clientes", "clientes_ativos", "num_clientes_risco_churn", "num_clientes_upsell"]:
+        assert resumo[chave] == metricas[chave]
+    for chave in ["taxa_churn", "nps_medio_geral", "ticket_medio_geral"]:
+        assert resumo[chave] == pytest.approx(metricas[chave])
+    for cluster, total in metricas["total_por_cluster"].items():
+        assert resumo[f"clientes_{cluster}"] == total
+    assert os.path.exists(tmp_path / tarefa["arquivo"])
+
+
+def test_nome_arquivo_distinto_para_valores_distintos():
+    valores = ["São Paulo", "S-o Paulo", "S o Paulo", "A/B", "A B", "A-B", "CONSTRUCAO E PROJETOS"]
+    nomes = [relatorios.nome_arquivo("segmento", [valor]) for valor in valores]
+    assert len(set(nomes)) == len(nomes)
+    assert all(nome.endswith(".html") and "/" not in nome for nome in nomes)
+
+    assert relatorios.nome_arquivo("uf", ["SP"]) == "uf_SP.html"
+    assert relatorios.nome_arquivo("segmento_uf", ["A/B", "SP"]) != relatorios.nome_arquivo("segmento_uf", ["A B", "SP"])
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from similaridade import buscar_similares, construir_indice_similares
+
+
+@pytest.fixture(scope="module")
+def indice():
+    # (cliente, subsegmento, faixa, valor, dias, nps, situação); a3 tem dois contratos
+    contratos = [
+        ("a1", "ERP", "P", 1000, 400, 8, "ATIVO"),
+        ("a2", "ERP", "P", 1100, 420, 8, "CANCELADO"),
+        ("a3", "ERP", "P", 5000, 1500, 3, "ATIVO"),
+        ("a3", "ERP", "P", 5000, 1500, 3, "CANCELADO"),
+        # Idêntico a a1, mas em outro grupo
+        ("b1", "RH", "P", 1000, 400, 8, "ATIVO"),
+        ("c1", "RH", "G", 90000, 3000, 0, "ATIVO"),
+    ]
+    df = pd.DataFrame(contratos, columns=["cliente_id", "DS_SUBSEGMENTO", "FAT_FAIXA_x", "VL_TOTAL_CONTRATO_NUM",
+                                          "dias_como_cliente", "resposta_NPS_x", "SITUACAO_CONTRATO"])
+    return construir_indice_similares(df)
+
+
+def _vizinhos(similares, cliente):
+    return similares.loc[similares["cliente_consultado"] == cliente, "cliente_id"].tolist()
+
+
+def test_prefere_vizinhos_do_mesmo_grupo(indice):
+    similares = buscar_similares(indice, ["a1"], k=2)
+    # b1 está à distância zero, mas a1 tem dois vizinhos no próprio grupo
+    assert _vizinhos(similares, "a1") == ["a2", "a3"]
+    assert similares["mesmo_grupo"].all()
+
+
+def test_indice_global_completa_grupos_pequenos(indice):
+    similares = buscar_similares(indice, ["a1", "b1"], k=3)
+
+    a1 = similares[similares["cliente_consultado"] == "a1"]
+    assert a1["cliente_id"].tolist() == ["a2", "a3", "b1"]
+    assert a1["mesmo_grupo"].tolist() == [True, True, False]
+
+    # b1 é o único do grupo: todos os vizinhos vêm do índice global, do mais próximo ao mais distante
+    b1 = similares[similares["cliente_consultado"] == "b1"]
+    assert b1["cliente_id"].tolist() == ["a1", "a2", "a3"]
+    assert not b1["mesmo_grupo"].any()
+    assert b1["distancia"].iloc[0] == pytest.approx(0)
+    assert b1["distancia"].is_monotonic_increasing
+
+
+def test_cliente_consultado_nunca_e_o_proprio_vizinho(indice):
+    todos = ["a1", "a2", "a3", "b1", "c1"]
+    similares = buscar_similares(indice, todos, k=10)
+    assert (similares["cliente_consultado"] != similares["cliente_id"]).all()
+    assert similares.groupby("cliente_consultado").size().to_dict() == {cliente: 4 for cliente in todos}
+
+
+def test_desfecho_dos_vizinhos(indice):
+    similares = buscar_similares(indice, ["b1", "desconhecido"], k=3)
+    assert set(similares["cliente_consultado"]) == {"b1"}
+    assert dict(zip(similares["cliente_id"], similares["desfecho"])) == {
+        "a1": "Retido", "a2": "Cancelado", "a3": "Parcialmente cancelado"}
+    assert {"valor_contrato", "dias_como_cliente", "nps", "grupo"} <= set(similares.columns)
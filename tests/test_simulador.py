@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+import dados
+from simulador import construir_histograma, simular_cenario
+
+CENARIOS = [
+    {},
+    {"risco_nps_novo": 6},
+    {"risco_nps_critico": 4, "risco_dias_antigo": 1095},
+    {"upsell_nps": 7, "upsell_quantil_valor": 0.3},
+    {"risco_minimo": 0.5},
+    {"upsell_minimo": 0.6, "upsell_nps_promotor": 10},
+    {"risco_dias_novo": 90, "upsell_dias_antigo": 365, "upsell_quantil_valor_antigo": 0.75},
+]
+
+
+@pytest.fixture(scope="module")
+def amostra():
+    return pd.read_csv("amostras/amostra_parte_1.csv")
+
+
+@pytest.mark.parametrize("cenario", CENARIOS)
+def test_simulacao_igual_a_resegmentar_a_base(amostra, monkeypatch, cenario):
+    resultado = simular_cenario(construir_histograma(dados.processar_base(amostra.copy())), cenario)
+
+    for limiar, valor in cenario.items():
+        monkeypatch.setitem(dados.LIMIARES_SEGMENTACAO, limiar, valor)
+    referencia = dados.processar_base(amostra.copy())
+
+    clusters = referencia["cluster"].value_counts()
+    assert resultado["registros_por_cluster"] == {
+        cluster: int(clusters.get(cluster, 0)) for cluster in resultado["registros_por_cluster"]}
+
+    receita = referencia.loc[referencia["risco_churn"], "VL_TOTAL_CONTRATO_NUM"].astype("float64").sum()
+    assert resultado["receita_em_risco"] == pytest.approx(receita)
+
+    distribuicao = referencia.groupby("cluster", observed=True)["categoria_nps"].value_counts()
+    for cluster, categorias in resultado["dist_nps_por_cluster"].items():
+        for categoria, quantidade in categorias.items():
+            assert quantidade == distribuicao.get((cluster, categoria), 0), (cluster, categoria)
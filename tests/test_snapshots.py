@@ -0,0 +1,90 @@
+import concurrent.futures
+
+import pandas as pd
+import pytest
+
+import snapshots
+from snapshots import (
+    carregar_dicionario,
+    codificar_estado,
+    comparar_snapshots,
+    data_snapshot,
+    gravar_snapshot,
+    listar_snapshots,
+)
+
+
+def _estado(clientes):
+    """Estado a partir de {cliente: flags}, com flags em "r" (risco), "u" (upsell) e "c" (cancelado)."""
+    flags = pd.DataFrame({"r": [], "u": [], "c": []}, dtype=bool)
+    for cliente, marcas in clientes.items():
+        flags.loc[cliente] = [letra in marcas for letra in "ruc"]
+    return codificar_estado(flags["r"], flags["u"], flags["c"])
+
+
+def test_comparacao_de_snapshots(tmp_path):
+    anterior = gravar_snapshot(_estado({"a": "r", "b": "u", "c": "", "d": "r", "g": "c"}), "v1", str(tmp_path))
+    atual = gravar_snapshot(_estado({"a": "", "b": "c", "d": "r", "e": "r", "f": "u", "g": "c"}), "v2", str(tmp_path))
+
+    transicoes = comparar_snapshots(anterior, atual, str(tmp_path))
+    obtido = {(linha.cliente_id, linha.transicao, linha.novo_na_base) for linha in transicoes.itertuples()}
+    assert obtido == {
+        ("a", "Recuperado", False),
+        ("b", "Cancelado", False),
+        ("c", "Cancelado", False),  # ausente no snapshot atual
+        ("e", "Entrou em risco", True),
+        ("f", "Novo upsell", True),
+    }
+
+
+def test_mesma_versao_nao_grava_novo_snapshot(tmp_path):
+    primeiro = gravar_snapshot(_estado({"a": "r"}), "v1", str(tmp_path))
+    assert gravar_snapshot(_estado({"a": ""}), "v1", str(tmp_path)) == primeiro
+    assert len(listar_snapshots(str(tmp_path))) == 1
+
+
+def test_identificadores_com_e_sem_microssegundos(tmp_path):
+    for identificador in ["20250816T101500", "20250816T101500250000", "20250816T091500999999"]:
+        (tmp_path / f"snapshot_{identificador}_v.arrow").touch()
+
+    ordenados = listar_snapshots(str(tmp_path))
+    assert [s["id"] for s in ordenados] == ["20250816T091500999999", "20250816T101500", "20250816T101500250000"]
+    assert data_snapshot(ordenados[1]) == pd.Timestamp("2025-08-16 10:15:00")
+    assert data_snapshot(ordenados[2]) == pd.Timestamp("2025-08-16 10:15:00.25")
+
+
+def _gravar_versao(diretorio, indice):
+    clientes = {f"comum_{i}": "" for i in range(50)} | {f"p{indice}_{i}": "r" for i in range(50)}
+    return gravar_snapshot(_estado(clientes), f"v{indice}", diretorio)
+
+
+def test_gravacoes_concorrentes_mantem_o_dicionario(tmp_path):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=4) as pool:
+        gravados = list(pool.map(_gravar_versao, [str(tmp_path)] * 8, range(8)))
+
+    dicionario = carregar_dicionario(str(tmp_path))
+    assert dicionario.is_unique
+    assert len(dicionario) == 50 + 8 * 50
+    assert len({s["id"] for s in gravados}) == 8
+    assert not (tmp_path / snapshots.ARQUIVO_TRAVA).exists()
+
+    # Cada snapshot continua apontando para os próprios clientes
+    for indice, snapshot in enumerate(gravados):
+        transicoes = comparar_snapshots(gravados[0], snapshot, str(tmp_path))
+        em_risco = set(transicoes.loc[transicoes["transicao"] == "Entrou em risco", "cliente_id"])
+        assert em_risco == ({f"p{indice}_{i}" for i in range(50)} if indice else set())
+
+
+def test_trava_abandonada_e_removida(tmp_path, monkeypatch):
+    trava = tmp_path / snapshots.ARQUIVO_TRAVA
+    trava.write_text("0")
+    monkeypatch.setattr(snapshots, "TRAVA_ABANDONADA_S", 0)
+    gravar_snapshot(_estado({"a": "r"}), "v1", str(tmp_path))
+    assert not trava.exists()
+
+
+def test_trava_ocupada_expira(tmp_path, monkeypatch):
+    (tmp_path / snapshots.ARQUIVO_TRAVA).write_text("0")
+    monkeypatch.setattr(snapshots, "ESPERA_TRAVA_S", 0.2)
+    with pytest.raises(TimeoutError):
+        gravar_snapshot(_estado({"a": "r"}), "v1", str(tmp_path))